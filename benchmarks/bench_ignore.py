@@ -0,0 +1,117 @@
+"""Benchmark the compiled ignore matcher against the original fnmatch loop.
+
+Generates a synthetic repository of relative paths in memory and times
+ignore decisions for every path, with and without directory pruning.
+
+Usage:
+    python benchmarks/bench_ignore.py [--paths 500000] [--seed 0] [--json]
+"""
+import argparse
+import fnmatch
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ignore import IGNORE_PATTERNS, IgnoreMatcher, is_ignored, parse_gitignore  # noqa: E402
+
+DIR_NAMES = ["src", "lib", "pkg", "internal", "cmd", "api", "core", "utils", "docs", "tests",
+             "build", "dist", "node_modules", "vendor", "target", "components", "services", "config"]
+FILE_STEMS = ["main", "index", "utils", "handler", "model", "client", "server", "test_app", "README", "config"]
+FILE_EXTS = [".py", ".js", ".ts", ".go", ".java", ".md", ".yaml", ".json", ".pyc", ".class",
+             ".png", ".min.js", ".log", ".o", ".txt", ".rs", ".tar.gz"]
+
+
+def legacy_is_ignored(filepath: str) -> bool:
+    """The original per-call fnmatch loop over every pattern."""
+    filename = os.path.basename(filepath)
+    for pattern in list(IGNORE_PATTERNS):
+        if fnmatch.fnmatch(filename, pattern):
+            return True
+    return False
+
+
+def synthetic_paths(count: int, seed: int) -> list[tuple[str, bool]]:
+    """Generate (relpath, is_dir) pairs shaped like a large monorepo."""
+    rng = random.Random(seed)
+    dirs = [""]
+    paths = []
+    while len(paths) < count:
+        parent = rng.choice(dirs)
+        if rng.random() < 0.12 and parent.count("/") < 8:
+            path = f"{parent}{rng.choice(DIR_NAMES)}{rng.randrange(50)}/" if rng.random() < 0.5 \
+                else f"{parent}{rng.choice(DIR_NAMES)}/"
+            dirs.append(path)
+            paths.append((path.rstrip("/"), True))
+        else:
+            name = f"{rng.choice(FILE_STEMS)}{rng.randrange(1000)}{rng.choice(FILE_EXTS)}"
+            paths.append((parent + name, False))
+    return paths
+
+
+def time_it(fn, items) -> tuple[float, int]:
+    start = time.perf_counter()
+    ignored = sum(1 for item in items if fn(item))
+    return time.perf_counter() - start, ignored
+
+
+def visited_with_pruning(paths: list[tuple[str, bool]], decide) -> int:
+    """Count paths a walk would visit when ignored directories are pruned."""
+    pruned = set()
+    visited = 0
+    for relpath, is_dir in sorted(paths):
+        parent = relpath.rsplit("/", 1)[0] if "/" in relpath else ""
+        if any(parent == p or parent.startswith(p + "/") for p in _ancestors(parent, pruned)):
+            continue
+        visited += 1
+        if is_dir and decide(relpath, is_dir):
+            pruned.add(relpath)
+    return visited
+
+
+def _ancestors(path: str, pruned: set) -> list[str]:
+    parts = path.split("/")
+    return [p for p in ("/".join(parts[:i]) for i in range(1, len(parts) + 1)) if p in pruned]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paths", type=int, default=500_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    paths = synthetic_paths(args.paths, args.seed)
+    gitignore = (IgnoreMatcher(parse_gitignore("*.txt\n!README*.txt\ndocs/\n/config/local\n")),)
+
+    legacy_time, legacy_ignored = time_it(lambda p: legacy_is_ignored(p[0]), paths)
+    compiled_time, compiled_ignored = time_it(lambda p: is_ignored(p[0], p[1]), paths)
+    gitignore_time, gitignore_ignored = time_it(lambda p: is_ignored(p[0], p[1], gitignore), paths)
+    legacy_visited = visited_with_pruning(paths, lambda p, d: legacy_is_ignored(p))
+    compiled_visited = visited_with_pruning(paths, lambda p, d: is_ignored(p, d))
+
+    results = {
+        "paths": len(paths),
+        "legacy": {"seconds": legacy_time, "ignored": legacy_ignored, "visited_with_pruning": legacy_visited},
+        "compiled": {"seconds": compiled_time, "ignored": compiled_ignored, "visited_with_pruning": compiled_visited},
+        "compiled_with_gitignore": {"seconds": gitignore_time, "ignored": gitignore_ignored},
+        "speedup": legacy_time / compiled_time if compiled_time else None,
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{len(paths):,} synthetic paths")
+    for name in ("legacy", "compiled", "compiled_with_gitignore"):
+        r = results[name]
+        per_path = r["seconds"] / len(paths) * 1e9
+        visited = f", {r['visited_with_pruning']:,} visited with pruning" if "visited_with_pruning" in r else ""
+        print(f"  {name:<24} {r['seconds']:.3f}s ({per_path:,.0f} ns/path), {r['ignored']:,} ignored{visited}")
+    print(f"  speedup: {results['speedup']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
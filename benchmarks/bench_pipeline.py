@@ -0,0 +1,281 @@
+"""Benchmark the ingestion and query pipeline against a local fake Llama Stack.
+
+Generates a synthetic repository of configurable size and shape, starts
+benchmarks/fake_llama_stack.py in a subprocess (so its JSON and embedding
+work does not compete for the GIL with the measured code) and measures:
+
+  - build_tree: scanning the repository into the file tree
+  - isIgnored: ignore decisions for every path of the repository
+  - generate_diagram: rendering the bounded tree diagram
+  - store_documents: reading, chunking, embedding and inserting every file
+  - answer_query: end-to-end latency of agent turns, including the tool call
+
+Results are printed as a table, or as JSON with --json (and written to
+--output) for regression tracking.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--files 2000] [--depth 4] [--fanout 6] [--file-kb 4]
+        [--queries 20] [--latency-ms 0] [--embed-latency-ms 0] [--token-latency-ms 0] [--json]
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+FAKE_SERVER = os.path.join(os.path.dirname(__file__), "fake_llama_stack.py")
+
+WORDS = ["request", "response", "client", "server", "config", "cache", "index", "token", "chunk", "vector",
+         "session", "agent", "stream", "parse", "load", "store", "query", "model", "batch", "error"]
+IGNORED_DIRS = ["node_modules", "__pycache__", ".git", "dist"]
+
+
+def python_source(rng: random.Random, size: int) -> str:
+    parts = ["import os\nimport json\n\n"]
+    while sum(map(len, parts)) < size:
+        a, b = rng.sample(WORDS, 2)
+        parts.append(
+            f"class {a.title()}{b.title()}:\n"
+            f"    \"\"\"Handles the {a} of each {b}.\"\"\"\n\n"
+            f"    def __init__(self, {b}):\n        self.{b} = {b}\n\n"
+            f"    def {a}_{b}(self, value: int) -> dict:\n"
+            f"        result = {{'{a}': value, '{b}': self.{b}}}\n"
+            f"        if value > {rng.randrange(100)}:\n            result['{a}'] = json.dumps(result)\n"
+            f"        return result\n\n\n"
+        )
+    return "".join(parts)
+
+
+def javascript_source(rng: random.Random, size: int) -> str:
+    parts = []
+    while sum(map(len, parts)) < size:
+        a, b = rng.sample(WORDS, 2)
+        parts.append(
+            f"export function {a}{b.title()}({b}, options = {{}}) {{\n"
+            f"  const {a} = options.{a} ?? {rng.randrange(100)};\n"
+            f"  return {{ {a}, {b}, total: {a} + {b}.length }};\n}}\n\n"
+        )
+    return "".join(parts)
+
+
+def markdown_source(rng: random.Random, size: int) -> str:
+    parts = ["# Project\n\n"]
+    while sum(map(len, parts)) < size:
+        heading = " ".join(rng.sample(WORDS, 2)).title()
+        sentence = " ".join(rng.choice(WORDS) for _ in range(40))
+        parts.append(f"## {heading}\n\n{sentence.capitalize()}.\n\n")
+    return "".join(parts)
+
+
+GENERATORS = [(".py", python_source), (".js", javascript_source), (".md", markdown_source)]
+
+
+def make_repo(root: str, files: int, depth: int, fanout: int, file_bytes: int, seed: int) -> list[str]:
+    """Create a synthetic repository and return the relative paths of its files and directories.
+
+    Directories form a tree of the given depth and fan-out; files are spread
+    over all of them with a mix of Python, JavaScript and Markdown, and some
+    ignored directories (node_modules, __pycache__, ...) are added.
+    """
+    rng = random.Random(seed)
+    dirs = [""]
+    frontier = [""]
+    for level in range(depth):
+        frontier = [os.path.join(parent, f"{rng.choice(WORDS)}{level}_{i}") for parent in frontier for i in range(fanout)]
+        frontier = frontier[:max(1, files // 4)]
+        dirs.extend(frontier)
+    for directory in dirs:
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    paths = list(dirs[1:])
+    for i in range(files):
+        extension, generate = rng.choice(GENERATORS)
+        relpath = os.path.join(rng.choice(dirs), f"{rng.choice(WORDS)}_{i}{extension}")
+        with open(os.path.join(root, relpath), "w") as f:
+            f.write(generate(rng, max(64, int(rng.expovariate(1 / file_bytes)))))
+        paths.append(relpath)
+
+    for name in IGNORED_DIRS:
+        directory = os.path.join(rng.choice(dirs), name)
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+        for i in range(max(1, files // 20)):
+            with open(os.path.join(root, directory, f"ignored_{i}.js"), "w") as f:
+                f.write("module.exports = {};\n")
+            paths.append(os.path.join(directory, f"ignored_{i}.js"))
+    return paths
+
+
+def timed(function, *args, **kwargs) -> tuple[object, float]:
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def start_fake_server(args: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    """Start the fake Llama Stack on a free port and wait until it answers."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([
+        sys.executable, FAKE_SERVER, "--port", str(port), "--dimension", str(args.dimension),
+        "--latency-ms", str(args.latency_ms), "--embed-latency-ms", str(args.embed_latency_ms),
+        "--token-latency-ms", str(args.token_latency_ms),
+    ], stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            fake_stats(url)
+            return process, url
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("Fake Llama Stack server did not start")
+            time.sleep(0.05)
+
+
+def fake_stats(url: str) -> dict:
+    with urllib.request.urlopen(f"{url}/v1/fake/stats", timeout=5) as response:
+        return json.load(response)
+
+
+def run(args: argparse.Namespace) -> dict:
+    root = tempfile.mkdtemp(prefix="bench-pipeline-")
+    cache_dir = tempfile.mkdtemp(prefix="bench-embedding-cache-")
+    server, url = start_fake_server(args)
+    os.environ["LLAMA_STACK_ENDPOINT"] = url
+    os.environ["EMBEDDING_CACHE_DIR"] = cache_dir
+    os.environ.setdefault("ANSWER_CACHE_ENABLED", "false")
+
+    # imported after the environment points at the fake server
+    from agent import GithubAgent
+    from github import build_tree, generate_diagram, get_file_list, isIgnored
+
+    try:
+        paths = make_repo(root, args.files, args.depth, args.fanout, args.file_kb * 1024, args.seed)
+        repo_bytes = sum(os.path.getsize(os.path.join(root, p)) for p in paths if os.path.isfile(os.path.join(root, p)))
+
+        tree, tree_seconds = timed(build_tree, root)
+        file_list = get_file_list(tree)
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for relpath in paths:
+                isIgnored(relpath, os.path.isdir(os.path.join(root, relpath)))
+        ignore_seconds = (time.perf_counter() - start) / args.repeat
+
+        diagram, diagram_seconds = timed(generate_diagram, tree)
+
+        agent = GithubAgent()
+        summary, store_seconds = timed(agent.store_documents, file_list, root_path=root)
+        chunks = fake_stats(url)["chunks"]
+
+        rng = random.Random(args.seed)
+        latencies = []
+        for i in range(args.queries):
+            a, b = rng.sample(WORDS, 2)
+            _, seconds = timed(agent.answer_query, f"How does the {a} {b} code work? ({i})")
+            latencies.append(seconds)
+        agent.release()
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    return {
+        "benchmark": "pipeline",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "output")},
+        "repo": {"files": len(file_list), "paths": len(paths), "bytes": repo_bytes},
+        "build_tree": {"seconds": tree_seconds, "files_per_second": len(file_list) / tree_seconds},
+        "isIgnored": {"seconds": ignore_seconds, "paths_per_second": len(paths) / ignore_seconds},
+        "generate_diagram": {"seconds": diagram_seconds, "lines": diagram.count("\n") + 1},
+        "store_documents": {
+            "seconds": store_seconds,
+            "files_per_second": len(file_list) / store_seconds,
+            "mib_per_second": repo_bytes / 1024 / 1024 / store_seconds,
+            "chunks": chunks,
+            "chunks_per_second": chunks / store_seconds,
+            "stored": summary.get("stored") if isinstance(summary, dict) else None,
+        },
+        "answer_query": {
+            "queries": len(latencies),
+            "mean_seconds": statistics.fmean(latencies) if latencies else None,
+            "p50_seconds": percentile(latencies, 0.5) if latencies else None,
+            "p95_seconds": percentile(latencies, 0.95) if latencies else None,
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=2_000)
+    parser.add_argument("--depth", type=int, default=4, help="directory levels")
+    parser.add_argument("--fanout", type=int, default=6, help="subdirectories per directory")
+    parser.add_argument("--file-kb", type=float, default=4, help="mean file size")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5, help="isIgnored passes over all paths")
+    parser.add_argument("--dimension", type=int, default=384, help="embedding dimension")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="fake server latency per request")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="fake server latency per embedded text")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="fake server latency per answer token")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # progress printed by the pipeline goes to stderr, keeping stdout machine-readable
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    repo = results["repo"]
+    store = results["store_documents"]
+    answers = results["answer_query"]
+    print(f"{repo['files']:,} files ({repo['bytes'] / 1024 / 1024:.1f} MiB) of {repo['paths']:,} synthetic paths")
+    print(f"  build_tree        {results['build_tree']['seconds']:.3f}s")
+    print(f"  isIgnored         {results['isIgnored']['paths_per_second']:,.0f} paths/s")
+    print(f"  generate_diagram  {results['generate_diagram']['seconds'] * 1000:.1f}ms, "
+          f"{results['generate_diagram']['lines']} lines")
+    print(f"  store_documents   {store['seconds']:.2f}s, {store['files_per_second']:,.0f} files/s, "
+          f"{store['mib_per_second']:.2f} MiB/s, {store['chunks_per_second']:,.0f} chunks/s")
+    if answers["queries"]:
+        print(f"  answer_query      p50 {answers['p50_seconds'] * 1000:.0f}ms, "
+              f"p95 {answers['p95_seconds'] * 1000:.0f}ms over {answers['queries']} queries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Benchmark repository tree construction time and memory.
+
+Creates a synthetic repository on disk (including a few very wide
+directories) and compares the original dict-backed Node, which re-sorts its
+children on every insert, with the compact __slots__ tree in github.py.
+
+Usage:
+    python benchmarks/bench_tree.py [--files 50000] [--wide 5000] [--json]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from github import build_tree, get_file_list  # noqa: E402
+from ignore import is_ignored  # noqa: E402
+
+
+class LegacyNode:
+    """The original Node implementation."""
+
+    def __init__(self, filepath: str, is_dir: bool = False, parent: Optional["LegacyNode"] = None):
+        self.name = os.path.basename(filepath)
+        self.filepath = filepath
+        self.is_dir = is_dir
+        self.parent = parent
+        self.children = [] if is_dir else None
+
+    def add_child(self, child_node: "LegacyNode"):
+        if self.children is not None:
+            self.children.append(child_node)
+            child_node.parent = self
+            self.children.sort(key=lambda x: x.name.lower())
+
+
+def legacy_build_tree(root_path: str) -> LegacyNode:
+    """The original os.walk based construction with a parallel node_map."""
+    root_node = LegacyNode(root_path, is_dir=True)
+    node_map = {root_path: root_node}
+    for root, dirs, files in os.walk(root_path):
+        parent_node = node_map.get(root)
+        if parent_node is None:
+            continue
+        prefix = os.path.relpath(root, root_path).replace(os.sep, "/")
+        prefix = "" if prefix == "." else prefix + "/"
+        dirs[:] = [d for d in dirs if not is_ignored(prefix + d, True)]
+        files[:] = [f for f in files if not is_ignored(prefix + f, False)]
+        for d in dirs:
+            dir_path = os.path.join(root, d)
+            dir_node = LegacyNode(dir_path, is_dir=True)
+            parent_node.add_child(dir_node)
+            node_map[dir_path] = dir_node
+        for f in files:
+            parent_node.add_child(LegacyNode(os.path.join(root, f)))
+    return root_node
+
+
+def legacy_get_file_list(root_node: LegacyNode) -> list[str]:
+    files = []
+    stack = [root_node]
+    while stack:
+        node = stack.pop()
+        if not node.is_dir:
+            files.append(node.filepath)
+        elif node.children:
+            stack.extend(node.children)
+    return files
+
+
+def make_repo(root: str, files: int, wide: int, seed: int) -> None:
+    """Create a synthetic repository with nested and very wide directories."""
+    rng = random.Random(seed)
+    dirs = [root]
+    for i in range(3):
+        wide_dir = os.path.join(root, f"generated{i}")
+        os.makedirs(wide_dir)
+        for j in range(wide):
+            open(os.path.join(wide_dir, f"file_{rng.randrange(10**9):09d}_{j}.py"), "w").close()
+    created = 3 * wide
+    while created < files:
+        parent = rng.choice(dirs)
+        if rng.random() < 0.1 and parent.count(os.sep) - root.count(os.sep) < 8:
+            path = os.path.join(parent, f"pkg{rng.randrange(10**6)}")
+            os.makedirs(path, exist_ok=True)
+            dirs.append(path)
+        else:
+            open(os.path.join(parent, f"module_{created}.py"), "w").close()
+            created += 1
+
+
+def measure(build, list_files, root: str) -> dict:
+    gc.collect()
+    start = time.perf_counter()
+    tree = build(root)
+    build_seconds = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    tree = build(root)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    count = len(list_files(tree))
+    list_seconds = time.perf_counter() - start
+    return {"build_seconds": build_seconds, "list_seconds": list_seconds, "files": count, "tree_bytes": retained}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=50_000)
+    parser.add_argument("--wide", type=int, default=5_000, help="files in each of three very wide directories")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench-tree-")
+    try:
+        make_repo(root, args.files, args.wide, args.seed)
+        results = {
+            "files": args.files,
+            "legacy": measure(legacy_build_tree, legacy_get_file_list, root),
+            "compact": measure(build_tree, get_file_list, root),
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.files:,} synthetic files ({args.wide:,} in each of 3 wide directories)")
+    for name in ("legacy", "compact"):
+        r = results[name]
+        print(f"  {name:<8} build {r['build_seconds']:.3f}s, file list {r['list_seconds']:.3f}s, "
+              f"tree {r['tree_bytes'] / 1024 / 1024:.1f} MiB, {r['files']:,} files")
+
+
+if __name__ == "__main__":
+    main()
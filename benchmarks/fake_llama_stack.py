@@ -0,0 +1,412 @@
+"""Local stand-in for a Llama Stack server, for benchmarks without a GPU.
+
+Implements the endpoints the app uses: models, providers, tools,
+vector_dbs, vector_io, rag-tool insert and query, inference embeddings and
+chat completion, and agents with sessions and streaming turns (including
+client tool calls that are resumed with the tool responses). Embeddings are
+deterministic hashed bags of words, so similar texts get similar vectors,
+and answers are canned. Artificial latency can be added per request, per
+embedded text and per streamed token. GET /v1/fake/stats returns request
+counts and the number of stored chunks.
+
+Usage:
+    python benchmarks/fake_llama_stack.py [--port 8321] [--latency-ms 0] [--token-latency-ms 0]
+
+or in process:
+    with FakeLlamaStack(latency=0.01) as server:
+        os.environ["LLAMA_STACK_ENDPOINT"] = server.url
+"""
+import argparse
+import functools
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+LLM_ID = "fake/llm"
+EMBEDDING_ID = "fake/embedding"
+WORD = re.compile(r"[A-Za-z0-9_]+")
+ANSWER = ("Based on the repository, {subject} is handled in {files}. "
+          "The relevant code reads its inputs, validates them and delegates the work to the helpers it imports.")
+
+
+@functools.lru_cache(maxsize=65536)
+def _word_bucket(word: str, dimension: int) -> tuple[int, float]:
+    digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+    return int.from_bytes(digest[:4], "little") % dimension, 1.0 if digest[4] & 1 else -1.0
+
+
+def embed(text: str, dimension: int) -> list[float]:
+    """Embed a text as a normalized, hashed bag of words."""
+    vector = [0.0] * dimension
+    for word in WORD.findall(text.lower()):
+        bucket, sign = _word_bucket(word, dimension)
+        vector[bucket] += sign
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeState:
+    """Vector databases, agents and sessions of the fake server."""
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.lock = threading.Lock()
+        self.vector_dbs = {}
+        self.agents = {}
+        self.turns = {}
+        self.counts = {}
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def insert(self, vector_db_id: str, chunks: list[dict]) -> None:
+        with self.lock:
+            db = self.vector_dbs.setdefault(vector_db_id, [])
+            for chunk in chunks:
+                embedding = chunk.get("embedding") or embed(str(chunk["content"]), self.dimension)
+                db.append((embedding, chunk["content"], chunk.get("metadata") or {}))
+
+    def query(self, vector_db_id: str, query: str, max_chunks: int) -> tuple[list[dict], list[float]]:
+        vector = embed(query, self.dimension)
+        with self.lock:
+            db = list(self.vector_dbs.get(vector_db_id, []))
+        scored = sorted(
+            ((sum(a * b for a, b in zip(vector, embedding)), content, metadata) for embedding, content, metadata in db),
+            key=lambda item: item[0],
+            reverse=True,
+        )[:max_chunks]
+        return ([{"content": content, "metadata": metadata} for _, content, metadata in scored],
+                [score for score, _, _ in scored])
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeHTTPServer"
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    # plumbing
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def _send(self, payload, status: int = 200) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_stream(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _event(self, payload: dict) -> None:
+        data = f"data: {json.dumps({'event': {'payload': payload}})}\n\n".encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _delay(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def do_GET(self) -> None:
+        self._delay(self.server.latency)
+        url = urlparse(self.path)
+        state = self.server.state
+        if url.path == "/v1/models":
+            self._send({"data": [
+                {"identifier": LLM_ID, "provider_resource_id": LLM_ID, "provider_id": "fake",
+                 "model_type": "llm", "type": "model", "metadata": {}},
+                {"identifier": EMBEDDING_ID, "provider_resource_id": EMBEDDING_ID, "provider_id": "fake",
+                 "model_type": "embedding", "type": "model", "metadata": {"embedding_dimension": state.dimension}},
+            ]})
+        elif url.path == "/v1/providers":
+            self._send({"data": [
+                {"api": api, "provider_id": provider, "provider_type": f"inline::{provider}", "config": {}, "health": {}}
+                for api, provider in (("inference", "fake"), ("vector_io", "fake-vectors"), ("agents", "fake"))
+            ]})
+        elif url.path == "/v1/vector-dbs":
+            with state.lock:
+                self._send({"data": [
+                    {"identifier": vector_db_id, "provider_id": "fake-vectors", "provider_resource_id": vector_db_id,
+                     "embedding_model": EMBEDDING_ID, "embedding_dimension": state.dimension, "type": "vector_db"}
+                    for vector_db_id in state.vector_dbs
+                ]})
+        elif url.path == "/v1/fake/stats":
+            with state.lock:
+                self._send({"requests": dict(state.counts), "vector_dbs": len(state.vector_dbs),
+                            "chunks": sum(len(db) for db in state.vector_dbs.values())})
+        elif url.path == "/v1/tools":
+            toolgroup = parse_qs(url.query).get("toolgroup_id", [""])[0]
+            tools = []
+            if toolgroup == "builtin::rag":
+                tools.append({"identifier": "knowledge_search", "toolgroup_id": toolgroup, "provider_id": "fake",
+                              "description": "Search the vector databases", "parameters": [], "type": "tool"})
+            self._send({"data": tools})
+        else:
+            self._send({"detail": f"not found: {url.path}"}, 404)
+
+    def do_DELETE(self) -> None:
+        self._delay(self.server.latency)
+        path = urlparse(self.path).path
+        if path.startswith("/v1/vector-dbs/"):
+            with self.server.state.lock:
+                self.server.state.vector_dbs.pop(path.rsplit("/", 1)[1], None)
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self._send({"detail": f"not found: {path}"}, 404)
+
+    def do_POST(self) -> None:
+        self._delay(self.server.latency)
+        path = urlparse(self.path).path
+        body = self._body()
+        state = self.server.state
+        state.count(path)
+        parts = path.strip("/").split("/")
+
+        if path == "/v1/vector-dbs":
+            with state.lock:
+                state.vector_dbs.setdefault(body["vector_db_id"], [])
+            self._send({"identifier": body["vector_db_id"], "provider_id": "fake-vectors",
+                        "provider_resource_id": body["vector_db_id"], "embedding_model": body.get("embedding_model"),
+                        "embedding_dimension": state.dimension, "type": "vector_db"})
+        elif path == "/v1/inference/embeddings":
+            contents = [c if isinstance(c, str) else json.dumps(c) for c in body["contents"]]
+            self._delay(self.server.embed_latency * len(contents))
+            state.count("embedded_texts", len(contents))
+            self._send({"embeddings": [embed(text, state.dimension) for text in contents]})
+        elif path == "/v1/vector-io/insert":
+            state.insert(body["vector_db_id"], body["chunks"])
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif path == "/v1/vector-io/query":
+            max_chunks = int((body.get("params") or {}).get("max_chunks", 5))
+            chunks, scores = state.query(body["vector_db_id"], str(body["query"]), max_chunks)
+            self._send({"chunks": chunks, "scores": scores})
+        elif path == "/v1/tool-runtime/rag-tool/insert":
+            for document in body["documents"]:
+                content = document["content"] if isinstance(document["content"], str) else json.dumps(document["content"])
+                words = content.split()
+                size = int(body.get("chunk_size_in_tokens", 512))
+                state.insert(body["vector_db_id"], [
+                    {"content": " ".join(words[i:i + size]),
+                     "metadata": {**(document.get("metadata") or {}), "document_id": document["document_id"]}}
+                    for i in range(0, max(len(words), 1), size)
+                ])
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif path == "/v1/tool-runtime/rag-tool/query":
+            self._send(self._rag_result(body["vector_db_ids"], self._text(body["content"])))
+        elif path == "/v1/inference/chat-completion":
+            self._delay(self.server.token_latency * 20)
+            self._send({"completion_message": {
+                "role": "assistant", "stop_reason": "end_of_turn", "tool_calls": [],
+                "content": "Please provide a repository URL in the Settings section to get started.",
+            }})
+        elif path == "/v1/agents":
+            agent_id = uuid.uuid4().hex
+            with state.lock:
+                state.agents[agent_id] = body["agent_config"]
+            self._send({"agent_id": agent_id})
+        elif len(parts) == 4 and parts[1] == "agents" and parts[3] == "session":
+            self._send({"session_id": uuid.uuid4().hex})
+        elif len(parts) == 6 and parts[1] == "agents" and parts[5] == "turn":
+            self._turn(parts[2], parts[4], self._text(body["messages"][-1]["content"]))
+        elif len(parts) == 8 and parts[1] == "agents" and parts[7] == "resume":
+            self._resume(parts[2], parts[4], parts[6], body["tool_responses"])
+        else:
+            self._send({"detail": f"not found: {path}"}, 404)
+
+    # agents
+
+    @staticmethod
+    def _text(content) -> str:
+        if isinstance(content, str):
+            return content
+        if isinstance(content, list):
+            return " ".join(item.get("text", "") for item in content if isinstance(item, dict))
+        return str(content)
+
+    def _rag_result(self, vector_db_ids: list[str], query: str) -> dict:
+        results = []
+        metadata = {"document_ids": []}
+        for vector_db_id in vector_db_ids:
+            chunks, _ = self.server.state.query(vector_db_id, query, 5)
+            for chunk in chunks:
+                results.append(f"Result {len(results) + 1}\nContent: {chunk['content']}\nMetadata: {chunk['metadata']}\n")
+                metadata["document_ids"].append(chunk["metadata"].get("document_id"))
+        return {"content": [{"type": "text", "text": text} for text in results], "metadata": metadata}
+
+    def _turn_payload(self, session_id: str, turn_id: str, query: str, message: dict,
+                      event_type: str = "turn_complete", steps: Optional[list[dict]] = None) -> dict:
+        return {"event_type": event_type, "turn": {
+            "turn_id": turn_id, "session_id": session_id, "steps": steps or [], "started_at": now(), "completed_at": now(),
+            "input_messages": [{"role": "user", "content": query}], "output_message": message,
+        }}
+
+    def _turn(self, agent_id: str, session_id: str, query: str) -> None:
+        with self.server.state.lock:
+            config = self.server.state.agents.get(agent_id)
+        if config is None:
+            self._send({"detail": f"unknown agent {agent_id}"}, 404)
+            return
+        turn_id = uuid.uuid4().hex
+        with self.server.state.lock:
+            self.server.state.turns[turn_id] = query
+        self._start_stream()
+        step_id = uuid.uuid4().hex
+        client_tools = {tool["name"] for tool in config.get("client_tools") or []}
+        rag = next((tg for tg in config.get("toolgroups") or []
+                    if isinstance(tg, dict) and tg.get("name") == "builtin::rag/knowledge_search"), None)
+
+        if "knowledge_search" in client_tools:
+            call = {"call_id": uuid.uuid4().hex, "tool_name": "knowledge_search",
+                    "arguments": {"query": query}, "arguments_json": json.dumps({"query": query})}
+            self._event({"event_type": "step_start", "step_type": "inference", "step_id": step_id})
+            self._event({"event_type": "step_progress", "step_type": "inference", "step_id": step_id,
+                         "delta": {"type": "tool_call", "parse_status": "succeeded", "tool_call": call}})
+            self._event({"event_type": "step_complete", "step_type": "inference", "step_id": step_id,
+                         "step_details": {"step_type": "inference", "step_id": step_id, "turn_id": turn_id,
+                                          "model_response": {"role": "assistant", "content": "",
+                                                             "stop_reason": "end_of_message", "tool_calls": [call]}}})
+            message = {"role": "assistant", "content": "", "stop_reason": "end_of_message", "tool_calls": [call]}
+            self._event(self._turn_payload(session_id, turn_id, query, message, "turn_awaiting_input"))
+            self._end_stream()
+            return
+
+        files = []
+        if rag is not None:
+            result = self._rag_result(rag["args"]["vector_db_ids"], query)
+            files = [item["text"] for item in result["content"]]
+            self._event({"event_type": "step_complete", "step_type": "tool_execution", "step_id": step_id,
+                         "step_details": {"step_type": "tool_execution", "step_id": step_id, "turn_id": turn_id,
+                                          "tool_calls": [], "tool_responses": [{
+                                              "call_id": step_id, "tool_name": "knowledge_search",
+                                              "content": result["content"], "metadata": result["metadata"]}]}})
+        self._answer(session_id, turn_id, query, files)
+
+    def _resume(self, agent_id: str, session_id: str, turn_id: str, tool_responses: list[dict]) -> None:
+        with self.server.state.lock:
+            query = self.server.state.turns.pop(turn_id, "")
+        self._start_stream()
+        files = [self._text(response.get("content")) for response in tool_responses]
+        self._answer(session_id, turn_id, query, files)
+
+    def _answer(self, session_id: str, turn_id: str, query: str, results: list[str]) -> None:
+        files = sorted(set(re.findall(r"'file': '([^']+)'", " ".join(results))))[:3]
+        words = WORD.findall(query)
+        text = ANSWER.format(subject=" ".join(words[-3:]) or "this", files=", ".join(files) or "the repository")
+        step_id = uuid.uuid4().hex
+        started = now()
+        self._event({"event_type": "step_start", "step_type": "inference", "step_id": step_id})
+        for token in re.findall(r"\S+\s*", text):
+            self._delay(self.server.token_latency)
+            self._event({"event_type": "step_progress", "step_type": "inference", "step_id": step_id,
+                         "delta": {"type": "text", "text": token}})
+        message = {"role": "assistant", "content": text, "stop_reason": "end_of_turn", "tool_calls": []}
+        step = {"step_type": "inference", "step_id": step_id, "turn_id": turn_id, "model_response": message,
+                "started_at": started, "completed_at": now()}
+        self._event({"event_type": "step_complete", "step_type": "inference", "step_id": step_id,
+                     "step_details": step})
+        self._event(self._turn_payload(session_id, turn_id, query, message, steps=[step]))
+        self._end_stream()
+
+
+class FakeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, state: FakeState, latency: float, embed_latency: float, token_latency: float):
+        super().__init__(address, Handler)
+        self.state = state
+        self.latency = latency
+        self.embed_latency = embed_latency
+        self.token_latency = token_latency
+
+
+class FakeLlamaStack:
+    """Fake Llama Stack server running in a background thread."""
+
+    def __init__(self, port: int = 0, dimension: int = 384, latency: float = 0.0,
+                 embed_latency: float = 0.0, token_latency: float = 0.0):
+        """Create the server.
+
+        Args:
+            port: Port to listen on, 0 for a free one
+            dimension: Embedding dimension
+            latency: Seconds added to every request
+            embed_latency: Seconds added per embedded text
+            token_latency: Seconds added per streamed answer token
+        """
+        self.state = FakeState(dimension)
+        self.httpd = FakeHTTPServer(("127.0.0.1", port), self.state, latency, embed_latency, token_latency)
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self) -> "FakeLlamaStack":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeLlamaStack":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8321)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added to every request")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="added per embedded text")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="added per streamed token")
+    args = parser.parse_args()
+
+    server = FakeLlamaStack(args.port, args.dimension, args.latency_ms / 1000,
+                            args.embed_latency_ms / 1000, args.token_latency_ms / 1000)
+    print(f"Fake Llama Stack listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,46 @@
-from llama_stack_client import LlamaStackClient, Agent
-from llama_stack_client.types import Document
+from llama_stack_client import Agent
 import uuid
-import mimetypes
 import os
 import re
 import ast
-from typing import Optional
+import json
+import time
+import hashlib
+import functools
+import threading
+from typing import Callable, Iterator, Optional
 
-LLAMA_STACK_ENDPOINT = os.getenv("LLAMA_STACK_ENDPOINT", "http://localhost:8321")
+from answer_cache import AnswerEntry, answer_cache
+from chunking import CHUNK_CONFIG, CHUNK_SIZE_IN_TOKENS, CHUNK_OVERLAP_IN_TOKENS, chunk_document, chunking_strategy, count_tokens
+from conversation import CONVERSATION_SUMMARY_TOKENS, Conversation
+from dedup import DEDUP_ENABLED, DEDUP_METADATA_PATHS, deduplicate
+from embedding_cache import get_embedding_cache, key_hasher
+from github import RepositoryDiagram, diff_commits, resolve_head_commit
+from gitsource import RepositorySource, open_repository
+from ingest import file_size, ingest_files
+from lexical import LexicalIndex
+from lifecycle import approximate_size, lifecycle
+from loader import ByteBudget, SkippedFile, iter_document
+from metrics import (ANSWER_TOKENS, CONVERSATION_COMPACTIONS, DEDUP_FILES, EMBEDDED_TOKENS, EMBEDDING_CACHE,
+                     INGEST_CHUNKS, TOOL_CALLS, TURN_ERRORS, TURN_SECONDS, record_ingest_batch, record_turn_steps, span)
+from registry import RegistryEntry, make_key, new_vector_db_id, registry, repository_name
+from resources import resources
+from snapshot import SNAPSHOT_DTYPE, Snapshot, open_snapshot, save_snapshot, write_snapshot
+from symbols import SymbolIndex
+from tools import FindSymbolTool, SourceRecordingTool, knowledge_search_tool
 
-# Global shared resources (not user-specific)
-client = LlamaStackClient(base_url=LLAMA_STACK_ENDPOINT)
-
-embed_lm = next(m for m in client.models.list() if m.model_type == "embedding")
-embedding_model = embed_lm.identifier
-
-vector_io_provider = next(p.provider_id for p in client.providers.list() if p.api == "vector_io")
-
-llm = next(m for m in client.models.list() if m.model_type == "llm")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+SYMBOL_TOOL = os.getenv("SYMBOL_TOOL", "true").lower() == "true"
+# documents per insert request when restoring a snapshot
+SNAPSHOT_RESTORE_BATCH_DOCS = int(os.getenv("SNAPSHOT_RESTORE_BATCH_DOCS", "256"))
 
 
 class GithubAgent:
     """A RAG-powered agent specialized for GitHub repository analysis.
 
-    Each instance maintains its own vector database, RAG agent, and session state.
+    Each instance maintains its own RAG agent and session state. The vector
+    database is either private to the instance or shared through the
+    registry with every session asking about the same repository commit.
     
     Attributes:
         vector_db_id (str): Unique identifier for this agent's vector database
@@ -31,78 +48,210 @@ class GithubAgent:
         doc_count (int): Counter for documents stored in the vector database
         rag_agent (Agent): LlamaStack agent instance for query processing
         session_id (str): Unique session identifier for conversation continuity
+        registry_entry (Optional[RegistryEntry]): Shared index this agent is attached to
+        diagram (Optional[RepositoryDiagram]): Diagram of the ingested repository
+        ingest_summary (Optional[dict]): Summary of the ingestion that built the index
+        documents (dict): Mapping of relative paths to embedding cache keys of stored documents
+        duplicates (dict): Mapping of relative paths of stored documents to the
+            relative paths of their duplicates, which were not embedded
+        repo_url (Optional[str]): URL of the ingested repository
+        commit_sha (Optional[str]): Commit the index was built from
+        lexical_index (LexicalIndex): BM25 index of the stored chunks, searched
+            together with the vector database
+        symbol_index (SymbolIndex): Definitions and call sites of the symbols in
+            the stored source files, looked up by the find_symbol tool
+        conversation (Conversation): Token budget and rolling summary of the
+            session history
+        expired (bool): Whether the lifecycle manager evicted the vector database
     """
     
-    def __init__(self):
-        """Initialize a new RAG system with its own vector database and agent."""
+    def __init__(self, vector_db_id: Optional[str] = None, register: bool = True,
+                 lexical_index: Optional[LexicalIndex] = None, symbol_index: Optional[SymbolIndex] = None):
+        """Initialize a new RAG system and agent.
+
+        Args:
+            vector_db_id (Optional[str]): Identifier of the vector database to use,
+                or None to generate a unique one
+            register (bool): Whether to register the vector database, or attach
+                to an existing one
+            lexical_index (Optional[LexicalIndex]): Lexical index of an existing
+                vector database, or None to start an empty one
+            symbol_index (Optional[SymbolIndex]): Symbol index of an existing
+                vector database, or None to start an empty one
+        """
         self.doc_id_to_filename = {}
         self.doc_count = 0
-        self.vector_db_id = f"v{uuid.uuid4().hex}"
+        self._lock = threading.Lock()
+        self.vector_db_id = vector_db_id or new_vector_db_id()
+        self.registry_entry = None
+        self.diagram = None
+        self.ingest_summary = None
+        self.documents = {}
+        self.duplicates = {}
+        self.repo_url = None
+        self.commit_sha = None
+        self.lexical_index = lexical_index if lexical_index is not None else LexicalIndex()
+        self.symbol_index = symbol_index if symbol_index is not None else SymbolIndex()
         
-        # Create user-specific vector database
-        client.vector_dbs.register(
-            vector_db_id=self.vector_db_id,
-            embedding_model=embedding_model,
-            embedding_dimension=embed_lm.metadata["embedding_dimension"],
-            provider_id=vector_io_provider,
-        )
+        if register:
+            self._register_vector_db()
         
         # Create user-specific RAG agent and session
         self._create_agent()
+
+    @classmethod
+    def attach(cls, entry: RegistryEntry) -> "GithubAgent":
+        """Create an agent that uses an already built, shared vector database.
+
+        Args:
+            entry (RegistryEntry): Ready registry entry of the shared index
+
+        Returns:
+            GithubAgent: Agent with its own session on the shared index
+        """
+        agent = cls(vector_db_id=entry.vector_db_id, register=False, lexical_index=entry.lexical,
+                    symbol_index=entry.symbols)
+        agent.registry_entry = entry
+        agent.doc_id_to_filename = entry.doc_id_to_filename
+        agent.doc_count = len(entry.doc_id_to_filename)
+        agent.diagram = entry.diagram
+        agent.ingest_summary = entry.summary
+        agent.documents = entry.documents
+        agent.duplicates = entry.duplicates
+        agent.repo_url, agent.commit_sha = entry.key[0], entry.key[1]
+        lifecycle.touch(entry.vector_db_id)
+        return agent
+
+    def share(self) -> "GithubAgent":
+        """Create another agent with its own session on the index of this agent.
+
+        Returns:
+            GithubAgent: Agent holding its own reference to the shared index
+
+        Raises:
+            RuntimeError: If the index is no longer registered
+        """
+        entry = retain_index(self)
+        try:
+            return GithubAgent.attach(entry)
+        except Exception:
+            registry.release(entry)
+            raise
+
+    @property
+    def expired(self) -> bool:
+        """Whether the lifecycle manager evicted the vector database."""
+        return not lifecycle.tracked(self.vector_db_id)
+
+    def touch(self) -> bool:
+        """Record a query with the lifecycle manager.
+
+        Returns:
+            bool: False if the vector database was evicted
+        """
+        return lifecycle.touch(self.vector_db_id)
+
+    def search_indexes(self) -> dict[str, tuple[str, Optional[LexicalIndex], Optional[SymbolIndex]]]:
+        """Return the indexes searched by the agent's tools, keyed by repository name.
+
+        Returns:
+            dict: The vector database, lexical index and symbol index of the
+                  agent's single repository, named ''
+        """
+        return {"": (self.vector_db_id, self.lexical_index, self.symbol_index)}
+
+    def _register_vector_db(self) -> None:
+        """Register the vector database of this agent with the LlamaStack server."""
+        # tracked first, so the orphan sweep never takes it for a leftover
+        lifecycle.track(self.vector_db_id)
+        try:
+            with span("register_vector_db"):
+                resources.client().vector_dbs.register(
+                    vector_db_id=self.vector_db_id,
+                    embedding_model=resources.embedding_model_id(),
+                    embedding_dimension=resources.embedding_dimension(),
+                    provider_id=resources.vector_io_provider_id(),
+                )
+        except Exception:
+            lifecycle.forget(self.vector_db_id)
+            raise
+
+    def _unregister_vector_db(self) -> None:
+        """Unregister the vector database of this agent, logging failures."""
+        if answer_cache:
+            answer_cache.invalidate(self.vector_db_id)
+        if not lifecycle.forget(self.vector_db_id):
+            # already unregistered by the lifecycle manager
+            return
+        try:
+            resources.client().vector_dbs.unregister(vector_db_id=self.vector_db_id)
+            print(f"Successfully unregistered vector database: {self.vector_db_id}")
+        except Exception as e:
+            print(f"Warning: Could not unregister vector database {self.vector_db_id}: {e}")
+
+    def release(self) -> None:
+        """Release the vector database of this agent.
+
+        A shared database is only unregistered once the last session attached
+        to it releases it.
+        """
+        if self.registry_entry is not None:
+            entry, self.registry_entry = self.registry_entry, None
+            if not registry.release(entry):
+                return
+        self._unregister_vector_db()
     
     def _create_agent(self) -> None:
         """Create a new RAG agent and session using the current vector database."""
-        self.rag_agent = Agent(
-            client,
-            model=llm.identifier,
-            instructions=(
-                "You are a highly knowledgeable AI assistant specializing in understanding and explaining codebases and technical documentation from GitHub repositories. "
-                "Your primary function is to answer questions, provide summaries, explain complex functions, and help navigate the codebase. "
-                "Leverage the RAG tool to retrieve relevant information. "
-                "Always prioritize factual information found through the RAG tool. "
-                "Provide clear, concise, and accurate explanations. When explaining code, try to break down complex logic into understandable parts. "
-                "If the RAG tool cannot provide the necessary information, state that you do not have sufficient context from the repository to answer the question."
-            ),
-            tools=[
-                {
-                    "name": "builtin::rag/knowledge_search",
-                    "args": {
-                        "vector_db_ids": [self.vector_db_id],
-                        "chunk_size_in_tokens": 512,
-                        "chunk_overlap_in_tokens": 50,
-                        "chunk_template": "Result {index}\nContent: {chunk.content}\nMetadata: {metadata}\n",
-                    },
-                }
-            ],
-            max_infer_iters=5,
-            sampling_params={
-                "strategy": {"type": "top_p", "temperature": 0.7, "top_p": 0.95},
-                "max_tokens": 2048,
-            },
-        )
+        config = agent_config(self.search_indexes())
+        self.rag_agent = Agent(resources.client(), **config)
         
         self.session_id = self.rag_agent.create_session(session_name=f"s{uuid.uuid4().hex}")
+        self.conversation = Conversation(base_tokens=prompt_tokens(config))
+
+    def _compact(self, reason: str) -> None:
+        """Fold older exchanges into the conversation summary and continue in a new session.
+
+        Args:
+            reason (str): 'budget' when compacting ahead of the context limit,
+                'error' after a turn failed
+        """
+        messages = self.conversation.summary_messages()
+        summary = None
+        if messages:
+            try:
+                with span("summarize"):
+                    response = resources.client().inference.chat_completion(
+                        model_id=resources.llm_id(),
+                        messages=messages,
+                        sampling_params={"strategy": {"type": "greedy"}, "max_tokens": CONVERSATION_SUMMARY_TOKENS * 2},
+                    )
+                summary = response.completion_message.content
+            except Exception as e:
+                print(f"Warning: Could not summarize the conversation, falling back to an extractive summary: {e}")
+        self.conversation.compact(summary if isinstance(summary, str) else None)
+        self.session_id = self.rag_agent.create_session(session_name=f"s{uuid.uuid4().hex}")
+        CONVERSATION_COMPACTIONS.inc(reason=reason)
     
     def reset_vector_db(self) -> None:
-        """Reset the vector database and recreate the agent with the new database."""
-        try:
-            client.vector_dbs.unregister(vector_db_id=self.vector_db_id)
-            print(f"Successfully unregistered vector database: {self.vector_db_id}")
-        except Exception as e:
-            print(f"Warning: Could not unregister vector database {self.vector_db_id}: {e}")
+        """Reset the vector database and recreate the agent with a new, private database."""
+        self.release()
         
-        self.vector_db_id = f"v{uuid.uuid4().hex}"
-        client.vector_dbs.register(
-            vector_db_id=self.vector_db_id,
-            embedding_model=embedding_model,
-            embedding_dimension=embed_lm.metadata["embedding_dimension"],
-            provider_id=vector_io_provider,
-        )
+        self.vector_db_id = new_vector_db_id()
+        self._register_vector_db()
         print(f"Created new vector database: {self.vector_db_id}")
+        self.lexical_index = LexicalIndex()
+        self.symbol_index = SymbolIndex()
         
         self._create_agent()
         self.doc_id_to_filename = {}
         self.doc_count = 0
+        self.diagram = None
+        self.ingest_summary = None
+        self.documents = {}
+        self.duplicates = {}
+        self.repo_url = None
+        self.commit_sha = None
     
     def store_document(self, filepath: str) -> None:
         """Store a single document in the current vector database, skipping files that cannot be loaded or stored.
@@ -110,42 +259,658 @@ class GithubAgent:
         Args:
             filepath (str): Path to the file to be stored in the vector database
         """
-        mime_type, _ = mimetypes.guess_type(filepath)
-        doc_id = f"num-{self.doc_count}"
-        
-        content = load_document(filepath)
-        if content is None:
-            return
-        
+        self.store_documents([filepath])
+
+    def _prepare_document(self, filepath: str, budget: Optional[ByteBudget] = None,
+                          source: Optional[RepositorySource] = None,
+                          texts: Optional[dict[str, str]] = None) -> dict:
+        """Stream a file through the chunker, computing its cache key on the way.
+
+        Runs on the ingestion read threads, so reading, decoding and chunking
+        overlap with the embedding and insert requests of other batches.
+        Source code is split on its syntax (see chunking.chunk_code), other
+        text into overlapping token windows. Files whose text was kept by
+        deduplication are chunked from it instead of being read again.
+
+        Args:
+            filepath (str): Path to the file to prepare
+            budget (Optional[ByteBudget]): Byte budget of the repository being ingested
+            source (Optional[RepositorySource]): Source the file is read from,
+                or None to read it from disk
+            texts (Optional[dict[str, str]]): Text already read of some files,
+                from which the file's text is taken
+
+        Returns:
+            dict: The document's embedding cache 'key' and its 'chunks' as dicts
+                  with 'content', 'token_count', 'start_line' and 'end_line' keys
+
+        Raises:
+            SkippedFile: If the file is binary, too large or over budget
+        """
+        hasher = key_hasher(CHUNK_SIZE_IN_TOKENS, CHUNK_OVERLAP_IN_TOKENS, resources.embedding_model_id(),
+                            chunking_strategy(filepath))
+
+        text = texts.pop(filepath, None) if texts else None
+        if text is not None:
+            size = source.size_of(filepath) if source is not None else file_size(filepath)
+            if budget is not None and not budget.consume(size):
+                raise SkippedFile(f"repository byte budget of {budget.max_bytes:,} bytes exhausted")
+            blocks = (text,)
+        else:
+            read = source.iter_document if source is not None else iter_document
+            blocks = read(filepath, budget)
+
+        def pieces():
+            for piece in blocks:
+                hasher.update(piece.encode("utf-8", errors="surrogatepass"))
+                yield piece
+
+        chunks = list(chunk_document(pieces(), filepath, CHUNK_SIZE_IN_TOKENS, CHUNK_OVERLAP_IN_TOKENS))
+        return {"key": hasher.hexdigest(), "chunks": chunks}
+
+    def _embed_documents(self, documents: list[dict]) -> list[list[dict]]:
+        """Embed prepared documents, reusing cached embeddings where possible.
+
+        Documents already present in the embedding cache (same bytes, chunking
+        parameters and embedding model) skip the embedding call entirely.
+
+        Args:
+            documents (list[dict]): Documents from _prepare_document()
+
+        Returns:
+            list[list[dict]]: For each document, its chunks as dicts with 'content',
+                              'token_count', 'start_line', 'end_line' and 'embedding' keys
+        """
+        cache = get_embedding_cache()
+        results = {}
+        misses = {}
+        for document in documents:
+            key = document["key"]
+            if key in results or key in misses:
+                continue
+            cached = cache.get(key) if cache else None
+            if cached is not None:
+                results[key] = cached
+            else:
+                misses[key] = document["chunks"]
+        EMBEDDING_CACHE.inc(len(results), result="hit")
+        EMBEDDING_CACHE.inc(len(misses), result="miss")
+
+        pending = [chunk for chunks in misses.values() for chunk in chunks]
+        EMBEDDED_TOKENS.inc(sum(chunk["token_count"] for chunk in pending))
+        for start in range(0, len(pending), EMBEDDING_BATCH_SIZE):
+            batch = pending[start:start + EMBEDDING_BATCH_SIZE]
+            with span("embed", chunks=len(batch)):
+                response = resources.client().inference.embeddings(
+                    model_id=resources.embedding_model_id(),
+                    contents=[chunk["content"] for chunk in batch],
+                )
+            for chunk, embedding in zip(batch, response.embeddings):
+                chunk["embedding"] = embedding
+
+        for key, chunks in misses.items():
+            if cache:
+                cache.put(key, chunks)
+            results[key] = chunks
+
+        return [results[document["key"]] for document in documents]
+
+    def _vector_chunks(self, relpath: str, key: str, document_chunks: list[dict]) -> list[dict]:
+        """Record a document and build the vector_io chunks for it.
+
+        Args:
+            relpath (str): Path of the document relative to the repository root
+            key (str): Embedding cache key of the document content
+            document_chunks (list[dict]): Chunks with 'content', 'token_count', 'start_line',
+                'end_line' and 'embedding' keys
+
+        Returns:
+            list[dict]: Chunks ready for vector_io.insert
+        """
+        doc_id = make_document_id(relpath)
+        with self._lock:
+            if doc_id not in self.doc_id_to_filename:
+                self.doc_count += 1
+            self.doc_id_to_filename[doc_id] = relpath
+            self.documents[relpath] = key
+
+        vector_chunks = []
+        for chunk in document_chunks:
+            metadata = {"document_id": doc_id, "file": relpath, "lines": lines_label(chunk)}
+            if self.repo_url:
+                metadata["repo"] = repository_name(self.repo_url)
+            if relpath in self.duplicates:
+                # a large cluster would inflate the metadata of every chunk and search result
+                alternates = self.duplicates[relpath]
+                metadata["duplicates"] = alternates[:DEDUP_METADATA_PATHS]
+                if len(alternates) > DEDUP_METADATA_PATHS:
+                    metadata["duplicate_count"] = len(alternates)
+            vector_chunks.append(vector_chunk(chunk["content"], chunk["embedding"], metadata, chunk["token_count"]))
+        return vector_chunks
+
+    def _index_chunks(self, chunks: list[dict], lexical: bool = True) -> None:
+        """Add inserted vector_io chunks to the lexical and symbol indexes.
+
+        Chunks of syntax-aware strategies cover their file without overlap,
+        so the source of a file is their concatenation and symbols are
+        indexed without reading the file again, also for documents reused
+        from the embedding cache. The size of the chunks is accounted to the
+        vector database with the lifecycle manager.
+
+        Args:
+            chunks (list[dict]): Inserted vector_io chunks
+            lexical (bool): Whether to add them to the lexical index, which a
+                restored snapshot already holds them in
+        """
+        lifecycle.touch(self.vector_db_id, approximate_size(chunks))
+        sources = {}
+        for chunk in chunks:
+            metadata = chunk["metadata"]
+            if lexical:
+                self.lexical_index.add(chunk["content"], {
+                    name: metadata[name] for name in ("document_id", "file", "lines", "duplicates", "duplicate_count")
+                    if name in metadata
+                })
+            if chunking_strategy(metadata["file"]) in ("python", "code"):
+                sources.setdefault(metadata["file"], []).append(chunk["content"])
+        for relpath, contents in sources.items():
+            self.symbol_index.add_file(relpath, "".join(contents))
+
+    def _insert_documents(self, loaded: list[tuple[str, dict]], root_path: Optional[str] = None) -> list[tuple[str, str]]:
+        """Embed a batch of loaded files and insert their chunks into the vector database with a single request.
+
+        If the batch fails, the files are retried one by one so that a single
+        bad document does not drop the whole batch.
+
+        Args:
+            loaded (list[tuple[str, dict]]): List of (filepath, prepared document) pairs
+            root_path (Optional[str]): Repository root used to derive relative paths
+
+        Returns:
+            list[tuple[str, str]]: List of (filepath, error) pairs that could not be stored
+        """
         try:
-            document = Document(
-                document_id=doc_id,
-                content=content,
-                mime_type=mime_type,
-                metadata={"file": filepath}
-            )
-            
-            self.doc_id_to_filename[doc_id] = filepath
-            self.doc_count += 1
+            embedded = self._embed_documents([document for _, document in loaded])
 
-            client.tool_runtime.rag_tool.insert(
-                documents=[document],
-                vector_db_id=self.vector_db_id,
-                chunk_size_in_tokens=512,
-            )
+            chunks = []
+            for (filepath, document), document_chunks in zip(loaded, embedded):
+                relpath = os.path.relpath(filepath, root_path) if root_path else filepath
+                chunks.extend(self._vector_chunks(relpath, document["key"], document_chunks))
+
+            if chunks:
+                with span("insert", chunks=len(chunks)):
+                    resources.client().vector_io.insert(vector_db_id=self.vector_db_id, chunks=chunks)
+                INGEST_CHUNKS.inc(len(chunks))
+                self._index_chunks(chunks)
+            return []
         except Exception as e:
-            print(f"Error storing document {filepath}, will not store: {e}")
+            if len(loaded) == 1:
+                return [(loaded[0][0], str(e))]
+            print(f"Batch insert of {len(loaded)} documents failed, retrying individually: {e}")
 
-    
-    def store_documents(self, files: list[str]) -> None:
+        failed = []
+        for item in loaded:
+            failed.extend(self._insert_documents([item], root_path))
+        return failed
+
+    def _insert_cached_documents(self, cached: list[tuple[str, str]]) -> list[tuple[str, str]]:
+        """Insert documents whose chunks and embeddings are already in the embedding cache.
+
+        Args:
+            cached (list[tuple[str, str]]): List of (relpath, cache key) pairs
+
+        Returns:
+            list[tuple[str, str]]: List of (relpath, error) pairs that could not
+                                   be inserted from the cache
+        """
+        cache = get_embedding_cache()
+        chunks = []
+        failed = []
+        for relpath, key in cached:
+            document_chunks = cache.get(key) if cache else None
+            if document_chunks is None:
+                failed.append((relpath, "not in embedding cache"))
+            else:
+                chunks.extend(self._vector_chunks(relpath, key, document_chunks))
+
+        if chunks:
+            try:
+                with span("insert", chunks=len(chunks)):
+                    resources.client().vector_io.insert(vector_db_id=self.vector_db_id, chunks=chunks)
+                INGEST_CHUNKS.inc(len(chunks))
+                self._index_chunks(chunks)
+            except Exception as e:
+                inserted = {relpath for relpath, _ in cached} - {relpath for relpath, _ in failed}
+                failed.extend((relpath, str(e)) for relpath in inserted)
+        return failed
+
+    def _deduplicate(self, files: list[str], root_path: Optional[str] = None,
+                     source: Optional[RepositorySource] = None) -> tuple[list[str], dict, dict[str, str]]:
+        """Leave generated files and duplicates out of the files about to be stored, see dedup.deduplicate().
+
+        The duplicates left out are recorded with the stored representative
+        of their cluster, whose chunks list them in their metadata.
+
+        Args:
+            files (list[str]): Paths of the files to store
+            root_path (Optional[str]): Repository root used to derive relative paths
+            source (Optional[RepositorySource]): Source the files are read from,
+                or None to read them from disk
+
+        Returns:
+            tuple[list[str], dict, dict[str, str]]: The files to store, the
+                'duplicates' and 'generated' counts of the files left out for the
+                ingestion summary, and the text read of files to store, to be
+                passed on to _prepare_document()
+        """
+        if not DEDUP_ENABLED or not files:
+            return files, {"duplicates": 0, "generated": 0}, {}
+        read = source.iter_document if source is not None else iter_document
+
+        def relative(filepath: str) -> str:
+            return os.path.relpath(filepath, root_path) if root_path else filepath
+
+        with span("deduplicate", files=len(files)) as current:
+            result = deduplicate(files, lambda filepath: "".join(read(filepath)))
+            duplicates = sum(len(alternates) for alternates in result.duplicates.values())
+            current.set_attribute("duplicates", duplicates)
+            current.set_attribute("generated", len(result.generated))
+        with self._lock:
+            for representative, alternates in result.duplicates.items():
+                self.duplicates.setdefault(relative(representative), []).extend(map(relative, alternates))
+        for filepath, reason in result.generated.items():
+            print(f"Skipping generated file {relative(filepath)}: {reason}")
+        DEDUP_FILES.inc(duplicates, reason="duplicate")
+        DEDUP_FILES.inc(len(result.generated), reason="generated")
+        if duplicates or result.generated:
+            print(f"Left out {duplicates} duplicate and {len(result.generated)} generated files of {len(files)}")
+        return result.files, {"duplicates": duplicates, "generated": len(result.generated)}, result.texts
+
+    def store_documents(
+        self,
+        files: list[str],
+        progress_callback: Optional[Callable[[dict], None]] = None,
+        root_path: Optional[str] = None,
+        source: Optional[RepositorySource] = None,
+    ) -> dict:
         """Store multiple documents in the current vector database, skipping files that cannot be loaded or stored.
+
+        Files are read on a thread pool and inserted in size-bounded batches,
+        with several insert requests in flight at once (see ingest.py). Files
+        are streamed through the local chunker, skipping binary files and
+        files over the per-file and per-repository byte budgets (see
+        loader.py), and their embeddings are served from the shared embedding
+        cache when the same content was embedded before. Generated files and
+        all but one file of each group of duplicates are left out first
+        (see dedup.py).
         
         Args:
             files (list[str]): List of file paths to be stored in the vector database
+            progress_callback (Optional[Callable[[dict], None]]): Called with a
+                report dict after each batch completes
+            root_path (Optional[str]): Repository root; document IDs and the
+                'file' metadata are derived from paths relative to it
+            source (Optional[RepositorySource]): Source the files are read
+                from, e.g. git objects, or None to read them from disk
+
+        Returns:
+            dict: Ingestion summary with counts of batches, files, bytes, stored
+                  documents, left out duplicates and generated files and the
+                  list of (filepath, error) failures
         """
-        for file in files:
-            self.store_document(file)
+        if answer_cache:
+            answer_cache.invalidate(self.vector_db_id)
+        with span("store_documents", files=len(files)):
+            files, dropped, texts = self._deduplicate(files, root_path, source)
+            summary = ingest_files(
+                files,
+                functools.partial(self._prepare_document, budget=ByteBudget(), source=source, texts=texts),
+                functools.partial(self._insert_documents, root_path=root_path),
+                on_batch=functools.partial(on_ingest_batch, self, progress_callback),
+                size_of=source.size_of if source is not None else file_size,
+            )
+        summary.update(dropped)
+        for filepath, error in summary["failed"]:
+            print(f"Error storing document {filepath}, will not store: {error}")
+        print(
+            f"Stored {summary['stored']}/{len(files)} documents in {summary['batches']} batches "
+            f"({summary['bytes']} bytes, {summary['elapsed']:.1f}s)"
+        )
+        return summary
+
+    def update_documents(
+        self,
+        root_path: str,
+        files: list[str],
+        previous_documents: dict[str, str],
+        changes: Optional[dict[str, list]],
+        progress_callback: Optional[Callable[[dict], None]] = None,
+        source: Optional[RepositorySource] = None,
+        previous_duplicates: Optional[dict[str, list[str]]] = None,
+    ) -> dict:
+        """Store a new revision of a repository, embedding only what changed since the previous one.
+
+        Files untouched by the diff (and pure renames) are inserted straight
+        from the embedding cache, without being read or embedded again.
+        Unchanged duplicates of such files stay left out. Added and modified
+        files, and unchanged files that fell out of the cache, go through
+        store_documents, which only finds duplicates among them. Deleted
+        files are simply not stored.
+
+        Args:
+            root_path (str): Root of the checked out new revision
+            files (list[str]): Paths of all files to index in the new revision
+            previous_documents (dict[str, str]): Mapping of relative paths to
+                embedding cache keys of the previous revision
+            changes (Optional[dict[str, list]]): Result of diff_commits(), or None
+                if the diff is unknown and every file must be treated as changed
+            progress_callback (Optional[Callable[[dict], None]]): Called with a
+                report dict after each batch of changed files
+            source (Optional[RepositorySource]): Source the files are read from,
+                or None to read them from disk
+            previous_duplicates (Optional[dict[str, list[str]]]): Duplicates left
+                out of the previous revision, by relative path of their representative
+
+        Returns:
+            dict: Ingestion summary of the changed files, with an additional
+                  'reused' count of documents restored from the cache
+        """
+        to_store, reused = self._reuse_documents(root_path, files, previous_documents, changes, previous_duplicates)
+        summary = self.store_documents(to_store, progress_callback=progress_callback, root_path=root_path,
+                                       source=source)
+        summary["reused"] = reused
+        return summary
+
+    def _reuse_documents(
+        self,
+        root_path: str,
+        files: list[str],
+        previous_documents: dict[str, str],
+        changes: Optional[dict[str, list]],
+        previous_duplicates: Optional[dict[str, list[str]]] = None,
+    ) -> tuple[list[str], int]:
+        """Insert the documents of a new revision that did not change from the embedding cache.
+
+        Does synchronous I/O, the async agent runs it with asyncio.to_thread.
+        See update_documents() for the arguments.
+
+        Returns:
+            tuple[list[str], int]: The files left to store, and the number of
+                                   documents inserted from the cache
+        """
+        paths = {os.path.relpath(filepath, root_path): filepath for filepath in files}
+
+        reusable = {}
+        changed = set()
+        if changes is not None:
+            changed = set(changes["added"]) | set(changes["modified"])
+            for old_path, new_path, similarity in changes["renamed"]:
+                if similarity == 100 and old_path in previous_documents:
+                    reusable[new_path] = previous_documents[old_path]
+                else:
+                    changed.add(new_path)
+            for relpath in paths:
+                if relpath not in changed and relpath in previous_documents:
+                    reusable.setdefault(relpath, previous_documents[relpath])
+            reusable = {relpath: key for relpath, key in reusable.items() if relpath in paths}
+
+        # duplicates of reused documents that did not change either are still left out
+        left_out = set()
+        for relpath, alternates in (previous_duplicates or {}).items():
+            kept = [alternate for alternate in alternates if alternate in paths and alternate not in changed]
+            if relpath in reusable and kept:
+                self.duplicates[relpath] = kept
+                left_out.update(kept)
+
+        reuse_summary = ingest_files(
+            list(reusable),
+            reusable.get,
+            self._insert_cached_documents,
+            size_of=lambda _: 0,
+        )
+        missing = {relpath for relpath, _ in reuse_summary["failed"]}
+        for relpath in missing:
+            left_out.difference_update(self.duplicates.pop(relpath, []))
+        to_store = [filepath for relpath, filepath in paths.items()
+                    if (relpath not in reusable or relpath in missing) and relpath not in left_out]
+        print(f"Reused {reuse_summary['stored']} unchanged documents, storing {len(to_store)} changed documents")
+        return to_store, reuse_summary["stored"]
+
+    def _insert_restored(self, loaded: list[tuple[str, list[dict]]]) -> list[tuple[str, str]]:
+        """Insert the chunks of documents read from a snapshot with a single request.
+
+        Args:
+            loaded (list[tuple[str, list[dict]]]): (relpath, chunks) pairs from Snapshot.chunks()
+
+        Returns:
+            list[tuple[str, str]]: (relpath, error) pairs of documents that could not be inserted
+        """
+        repo = repository_name(self.repo_url) if self.repo_url else None
+        chunks = [
+            vector_chunk(chunk["content"], chunk["embedding"],
+                         {**chunk["metadata"], "repo": repo} if repo else chunk["metadata"], chunk["token_count"])
+            for _, document_chunks in loaded for chunk in document_chunks
+        ]
+        try:
+            with span("insert", chunks=len(chunks)):
+                resources.client().vector_io.insert(vector_db_id=self.vector_db_id, chunks=chunks)
+        except Exception as e:
+            return [(relpath, str(e)) for relpath, _ in loaded]
+        INGEST_CHUNKS.inc(len(chunks))
+        self._index_chunks(chunks, lexical=False)
+        return []
+
+    def restore_snapshot(self, snapshot: Snapshot, progress_callback: Optional[Callable[[dict], None]] = None) -> dict:
+        """Insert the chunks and embeddings of a snapshot into the vector database, without embedding anything.
+
+        The agent must have been created with the snapshot's lexical index.
+        Documents are read from the memory-mapped snapshot on the ingestion
+        read threads and inserted in large batches, several at a time, so a
+        restore is bound by disk and insert bandwidth. The symbol index is
+        rebuilt from the chunks as they are inserted.
+
+        Args:
+            snapshot (Snapshot): Snapshot of the index to restore
+            progress_callback (Optional[Callable[[dict], None]]): Called with a
+                report dict after each inserted batch
+
+        Returns:
+            dict: Ingestion summary of the restore, with the keys of store_documents()
+        """
+        with self._lock:
+            self.doc_id_to_filename = dict(snapshot.doc_id_to_filename)
+            self.doc_count = len(self.doc_id_to_filename)
+            self.documents = dict(snapshot.documents)
+            self.duplicates = dict(snapshot.duplicates)
+        files = snapshot.files()
+        with span("restore_snapshot", files=len(files)):
+            summary = ingest_files(
+                files,
+                snapshot.chunks,
+                self._insert_restored,
+                on_batch=functools.partial(on_ingest_batch, self, progress_callback),
+                max_docs=SNAPSHOT_RESTORE_BATCH_DOCS,
+                size_of=snapshot.size_of,
+            )
+        # files left out of the snapshotted index stay left out
+        for name in ("duplicates", "generated"):
+            if name in (snapshot.summary or {}):
+                summary[name] = snapshot.summary[name]
+        for relpath, error in summary["failed"]:
+            print(f"Error restoring document {relpath}, will not store: {error}")
+        print(f"Restored {summary['stored']}/{len(files)} documents from {snapshot.path} "
+              f"in {summary['batches']} batches ({summary['elapsed']:.1f}s)")
+        return summary
+
+    def export_snapshot(self, path: str, dtype: str = SNAPSHOT_DTYPE) -> str:
+        """Write the index to a snapshot directory that restore_snapshot() can load, see snapshot.write_snapshot().
+
+        Embeddings come from the embedding cache; documents that fell out of
+        it are embedded again.
+
+        Args:
+            path (str): Snapshot directory to write
+            dtype (str): Storage type of the embeddings, 'float16' or 'int8'
+
+        Returns:
+            str: The path of the snapshot
+        """
+        key = self.registry_entry.key if self.registry_entry is not None else make_key(
+            self.repo_url or "", self.commit_sha or "", CHUNK_CONFIG, resources.embedding_model_id())
+        # the synchronous embedding path, so that the async agent can export from a thread too
+        return write_snapshot(path, self, functools.partial(GithubAgent._embed_documents, self), key, dtype)
     
+    def _create_turn_stream(self, query: str) -> Iterator:
+        """Start a streamed turn, compacting the conversation first if it might overflow the context.
+
+        A turn that still fails before answering usually ran out of context
+        because the history estimate was off, so the conversation is
+        compacted and the turn retried once, unless answer text was already
+        streamed.
+
+        Args:
+            query (str): The user's question
+
+        Yields:
+            Turn response stream chunks from the LlamaStack agent
+        """
+        if self.conversation.over_budget(query):
+            self._compact("budget")
+        for attempt in range(2):
+            answered = False
+            for chunk in self.rag_agent.create_turn(
+                messages=[self.conversation.message(query)],
+                session_id=self.session_id,
+                stream=True,
+            ):
+                if hasattr(chunk, "error") and attempt == 0 and not answered:
+                    self._compact("error")
+                    break
+                if not hasattr(chunk, "error") and chunk.event.payload.event_type == "step_progress":
+                    answered = answered or chunk.event.payload.delta.type == "text"
+                yield chunk
+            else:
+                return
+
+    def stream_query(self, query: str) -> Iterator[dict]:
+        """Answer a query using the GithubAgent with RAG, yielding events as the turn progresses.
+
+        Args:
+            query (str): The user's question about the GitHub repository
+
+        Yields:
+            dict: Events with a 'type' key:
+                - 'tool_call': the agent called a tool, named in 'tool'
+                - 'sources': a tool returned, with the new source documents in
+                  'sources' (dicts with 'file' and 'text' keys)
+                - 'text': a piece of the answer in 'text'
+                - 'error': the server reported an error, described in 'message'
+                - 'done': the turn is complete, with the full 'answer' and all 'sources'
+
+            Answers to the first question of a session that was asked before
+            about the same index are served from the answer cache, with
+            'cached' set in the 'done' event; follow-up questions depend on
+            the conversation and are never cached.
+            If the vector database was evicted, an 'error' event asks the
+            user to process the repository again.
+        """
+        if not self.touch():
+            yield from expired_events()
+            return
+        start = time.perf_counter()
+        # answers to follow-up questions depend on the conversation, not only on the question
+        scope = self._answer_scope() if answer_cache and self.conversation.fresh else None
+        embedding = None
+        if scope:
+            cached = answer_cache.get(scope, query)
+            if cached is None and answer_cache.similarity > 0:
+                embedding = self._embed_query(query)
+                cached = answer_cache.get_similar(scope, embedding) if embedding else None
+            if cached is not None:
+                TURN_SECONDS.observe(time.perf_counter() - start, cached="true")
+                self.conversation.record_cached(query, cached.answer)
+                yield from cached_answer_events(cached)
+                return
+
+        answer = []
+        sources = []
+        failed = False
+        for chunk in self._create_turn_stream(query):
+            for event in self._turn_events(chunk, answer, sources):
+                failed = failed or event["type"] == "error"
+                yield event
+
+        record_answer(start, answer, failed)
+        if answer and not failed:
+            self.conversation.record(query, "".join(answer), sources)
+        if scope and answer and not failed:
+            answer_cache.put(scope, query, "".join(answer), sources, embedding)
+        yield {"type": "done", "answer": "".join(answer), "sources": sources}
+
+    def _answer_scope(self) -> tuple:
+        """Return the answer cache scope of this agent's index, model and prompt configuration."""
+        config = agent_config({"": (self.vector_db_id, None, None)})
+        prompt = json.dumps(
+            {name: config[name] for name in ("instructions", "sampling_params", "max_infer_iters")},
+            sort_keys=True,
+        )
+        return (self.vector_db_id, self.commit_sha, config["model"], hashlib.sha256(prompt.encode()).hexdigest())
+
+    def _embed_query(self, query: str) -> Optional[list[float]]:
+        """Embed a question for the answer cache's similarity lookup, or return None on failure."""
+        try:
+            response = resources.client().inference.embeddings(
+                model_id=resources.embedding_model_id(),
+                contents=[query],
+            )
+            return response.embeddings[0]
+        except Exception as e:
+            print(f"Warning: Could not embed query for the answer cache: {e}")
+            return None
+
+    def _turn_events(self, chunk, answer: list[str], sources: list[dict[str, str]]) -> Iterator[dict]:
+        """Translate a turn response stream chunk into stream_query() events.
+
+        Args:
+            chunk: Turn response stream chunk
+            answer (list[str]): Answer text received so far, extended in place
+            sources (list[dict[str, str]]): Sources received so far, extended in place
+
+        Yields:
+            dict: The events of the chunk, see stream_query()
+        """
+        for tool in self.rag_agent.client_tools.values():
+            if isinstance(tool, SourceRecordingTool):
+                tool_sources = tool.pop_sources()
+                if tool_sources:
+                    sources.extend(tool_sources)
+                    yield {"type": "sources", "sources": tool_sources}
+
+        if hasattr(chunk, "error"):
+            message = chunk.error["message"] if "message" in chunk.error else str(chunk.error)
+            yield {"type": "error", "message": message}
+            return
+
+        payload = chunk.event.payload
+        if payload.event_type == "step_progress" and payload.step_type == "inference":
+            delta = payload.delta
+            if delta.type == "text":
+                answer.append(delta.text)
+                yield {"type": "text", "text": delta.text}
+            elif delta.type == "tool_call" and delta.parse_status == "succeeded" \
+                    and not isinstance(delta.tool_call, str):
+                TOOL_CALLS.inc(tool=delta.tool_call.tool_name)
+                yield {"type": "tool_call", "tool": delta.tool_call.tool_name}
+        elif payload.event_type == "step_complete" and payload.step_type == "tool_execution":
+            step_sources = self._get_sources(payload.step_details)
+            sources.extend(step_sources)
+            yield {"type": "sources", "sources": step_sources}
+        elif payload.event_type == "turn_complete":
+            record_turn_steps(payload.turn)
+            content = payload.turn.output_message.content
+            if isinstance(content, str) and content:
+                answer[:] = [content]
+
     def answer_query(self, query: str) -> tuple[str, list[dict[str, str]]]:
         """Answer a query using the GithubAgent with RAG.
         
@@ -159,25 +924,12 @@ class GithubAgent:
                     - 'file': The filename of the source document
                     - 'text': The relevant text excerpt from that file
         """
-        try:
-            response = self.rag_agent.create_turn(
-                messages=[{"role": "user", "content": query}],
-                session_id=self.session_id,
-                stream=False
-            )
-        except RuntimeError as e:
-            # reset session to reset token context
-            self.session_id = self.rag_agent.create_session(session_name=f"s{uuid.uuid4().hex}")
-            response = self.rag_agent.create_turn(
-                messages=[{"role": "user", "content": query}],
-                session_id=self.session_id,
-                stream=False
-            )
-
-        sources = self._get_sources(response)
-        reply = response.output_message.content
-
-        return reply, sources
+        for event in self.stream_query(query):
+            if event["type"] == "error":
+                raise RuntimeError(f"Turn did not complete. Error: {event['message']}")
+            if event["type"] == "done":
+                return event["answer"], event["sources"]
+        return "", []
 
     def _get_content_and_filename(self, item) -> tuple[Optional[str], Optional[str]]:
         """Extract content and filename from a TextContentItem object.
@@ -192,7 +944,8 @@ class GithubAgent:
         Returns:
             tuple[Optional[str], Optional[str]]: A tuple containing:
                 - Optional[str]: The extracted content text, or None if parsing failed
-                - Optional[str]: The base filename (without path), or None if not found
+                - Optional[str]: The base filename (without path), followed by the
+                                 line range of the chunk when known, or None if not found
         """
         # for Ollama LlamaStack configuration
         match1 = re.search(
@@ -208,7 +961,8 @@ class GithubAgent:
                 if isinstance(metadata, dict):
                     file_name = metadata.get('file')
                     if file_name:
-                        return content, os.path.basename(file_name)
+                        lines = metadata.get('lines')
+                        return content, os.path.basename(file_name) + (f":{lines}" if lines else "")
             except (ValueError, SyntaxError) as e:
                 print(f"Warning: Could not parse metadata string: {metadata_str}. Error: {e}")
         
@@ -227,12 +981,12 @@ class GithubAgent:
 
         return None, None
     
-    def _get_sources(self, chat_response) -> list[dict[str, str]]:
-        """Extract sources from a chat response, if any tools were used.
+    def _get_sources(self, step_details) -> list[dict[str, str]]:
+        """Extract sources from a completed tool execution step.
         
         Args:
-            chat_response: The response object from the RAG agent containing
-                          tool execution steps and retrieved content
+            step_details: Details of the tool execution step, containing the
+                          responses and retrieved content of its tool calls
                           
         Returns:
             list[dict[str, str]]: List of source documents, where each dict contains:
@@ -240,16 +994,76 @@ class GithubAgent:
                 - 'text': The relevant text excerpt that was retrieved
         """
         sources = []
-        for step in chat_response.steps:
-            if step.step_type == "tool_execution" and step.tool_responses:
-                for responses in step.tool_responses:
-                    for item in responses.content:
-                        text, file_name = self._get_content_and_filename(item)
-                        if file_name:
-                            sources.append({"file": file_name, "text": text})
+        for responses in step_details.tool_responses or []:
+            if isinstance(responses.content, str):
+                continue
+            for item in responses.content:
+                text, file_name = self._get_content_and_filename(item)
+                if file_name:
+                    sources.append({"file": file_name, "text": text})
         return sources
 
 
+def agent_config(indexes: dict[str, tuple[str, Optional[LexicalIndex], Optional[SymbolIndex]]]) -> dict:
+    """Build the configuration of a RAG agent searching the vector databases of one or more repositories.
+
+    Args:
+        indexes (dict): Mapping of repository names to the vector database
+            searched by the agent's RAG tool, the lexical index of the same
+            chunks, searched together with it if given, and the symbol index
+            of the same files, exposed as the find_symbol tool if given
+
+    Returns:
+        dict: Keyword arguments for Agent and AsyncAgent
+    """
+    tools = [knowledge_search_tool({name: (vector_db_id, lexical_index)
+                                    for name, (vector_db_id, lexical_index, _) in indexes.items()})]
+    instructions = ""
+    if SYMBOL_TOOL and all(symbol_index is not None for _, _, symbol_index in indexes.values()):
+        tools.append(FindSymbolTool({name: symbol_index for name, (_, _, symbol_index) in indexes.items()}))
+        instructions = (
+            " Use the find_symbol tool to locate where a function, class or other named symbol is defined"
+            " and where it is called."
+        )
+    if len(indexes) > 1:
+        instructions += (
+            f" You have access to {len(indexes)} repositories: {', '.join(sorted(indexes))}."
+            " Search all of them unless the question is about a specific one, and say which repository"
+            " each piece of information comes from."
+        )
+    return {
+        "model": resources.llm_id(),
+        "instructions": (
+            "You are a highly knowledgeable AI assistant specializing in understanding and explaining codebases and technical documentation from GitHub repositories. "
+            "Your primary function is to answer questions, provide summaries, explain complex functions, and help navigate the codebase. "
+            "Leverage the RAG tool to retrieve relevant information. "
+            "Always prioritize factual information found through the RAG tool. "
+            "Provide clear, concise, and accurate explanations. When explaining code, try to break down complex logic into understandable parts. "
+            "If the RAG tool cannot provide the necessary information, state that you do not have sufficient context from the repository to answer the question."
+            + instructions
+        ),
+        "tools": tools,
+        "max_infer_iters": 5,
+        "sampling_params": {
+            "strategy": {"type": "top_p", "temperature": 0.7, "top_p": 0.95},
+            "max_tokens": 2048,
+        },
+    }
+
+
+def prompt_tokens(config: dict) -> int:
+    """Estimate the tokens of the instructions and tool definitions an agent sends with every turn.
+
+    Args:
+        config (dict): Agent configuration from agent_config()
+
+    Returns:
+        int: Approximate token count
+    """
+    tools = [tool.get_tool_definition() if hasattr(tool, "get_tool_definition") else tool for tool in config["tools"]]
+    return count_tokens(config["instructions"]) + count_tokens(json.dumps(tools, default=str))
+
+
 def create_github_agent() -> GithubAgent:
     """Create a new GithubAgent instance for a user session, with its own vector database.
     
@@ -260,6 +1074,206 @@ def create_github_agent() -> GithubAgent:
     return GithubAgent()
 
 
+def _build_repository_index(
+    link: str,
+    entry: RegistryEntry,
+    progress_callback: Optional[Callable[[dict], None]] = None,
+    previous: Optional[GithubAgent] = None,
+) -> GithubAgent:
+    """Clone a repository commit and build the index of a registry entry.
+
+    If SNAPSHOT_DIR holds a snapshot of the index, it is restored instead,
+    and a newly built index is saved as a snapshot.
+
+    Args:
+        link (str): Git repository URL
+        entry (RegistryEntry): Entry owned by the caller, whose index is built
+        progress_callback (Optional[Callable[[dict], None]]): Called with a
+            report dict after each ingested batch
+        previous (Optional[GithubAgent]): Agent holding an index of an older
+            commit of the same repository; only the diff is re-embedded
+
+    Returns:
+        GithubAgent: Agent attached to the newly built index
+    """
+    commit_sha = entry.key[1]
+    agent = None
+    # the lifecycle manager must not evict the database while it is being built
+    with lifecycle.busy(entry.vector_db_id):
+        try:
+            snapshot = open_snapshot(entry.key)
+            agent = GithubAgent(vector_db_id=entry.vector_db_id,
+                                lexical_index=snapshot.lexical if snapshot is not None else None)
+            agent.registry_entry = entry
+            agent.repo_url = entry.key[0]
+            agent.commit_sha = commit_sha
+            if snapshot is not None:
+                summary = agent.restore_snapshot(snapshot, progress_callback)
+                diagram = snapshot.diagram
+            else:
+                summary, diagram = _ingest_repository(agent, link, progress_callback, previous)
+        except Exception as e:
+            registry.fail(entry, e)
+            registry.release(entry)
+            if agent is not None:
+                agent.registry_entry = None
+                agent._unregister_vector_db()
+            raise
+
+        agent.diagram = diagram
+        agent.ingest_summary = summary
+        registry.publish(entry, agent.doc_id_to_filename, diagram, summary, agent.documents,
+                         agent.lexical_index, agent.symbol_index, agent.duplicates)
+    if snapshot is None:
+        save_snapshot(agent, entry.key)
+    return agent
+
+
+def _ingest_repository(
+    agent: GithubAgent,
+    link: str,
+    progress_callback: Optional[Callable[[dict], None]] = None,
+    previous: Optional[GithubAgent] = None,
+) -> tuple[dict, RepositoryDiagram]:
+    """Clone the commit of an agent and store its files, or only those changed since a previous index.
+
+    Returns:
+        tuple[dict, RepositoryDiagram]: Ingestion summary and diagram of the repository
+    """
+    commit_sha = agent.commit_sha
+    source = open_repository(link, commit_sha)
+    try:
+        if previous is None:
+            summary = agent.store_documents(source.file_list, progress_callback=progress_callback,
+                                            root_path=source.root_path, source=source)
+        else:
+            try:
+                changes = diff_commits(source.git_dir, previous.commit_sha, commit_sha)
+            except ValueError as e:
+                print(f"Could not diff against indexed commit, re-ingesting all files: {e}")
+                changes = None
+            summary = agent.update_documents(
+                source.root_path, source.file_list, previous.documents, changes,
+                progress_callback=progress_callback, source=source,
+                previous_duplicates=previous.duplicates,
+            )
+    finally:
+        source.close()
+    return summary, source.diagram
+
+
+def _attach_repository_index(entry: RegistryEntry) -> GithubAgent:
+    """Wait for the index of a registry entry built by another session and attach to it.
+
+    Args:
+        entry (RegistryEntry): Entry acquired by the caller
+
+    Returns:
+        GithubAgent: Agent with its own session on the shared index
+    """
+    try:
+        entry.wait()
+    except Exception:
+        registry.release(entry)
+        raise
+    print(f"Attaching to existing vector database {entry.vector_db_id} for {entry.key[0]}@{entry.key[1]}")
+    return GithubAgent.attach(entry)
+
+
+def retain_index(agent) -> RegistryEntry:
+    """Take another reference to the shared index of an agent, see GithubAgent.share().
+
+    Raises:
+        RuntimeError: If the agent has no shared index or it is no longer registered
+    """
+    entry = agent.registry_entry
+    if entry is None or not registry.retain(entry):
+        raise RuntimeError("The repository index is no longer available, please process the repository again")
+    return entry
+
+
+def load_repository(link: str, progress_callback: Optional[Callable[[dict], None]] = None,
+                    commit_sha: Optional[str] = None) -> GithubAgent:
+    """Create a GithubAgent for a repository, reusing an existing index of the same commit if possible.
+
+    The remote HEAD is resolved without cloning. If another session already
+    indexed that commit with the same chunking configuration and embedding
+    model, the new agent attaches to the shared vector database and only
+    creates its own agent session. Otherwise the index is restored from a
+    snapshot in SNAPSHOT_DIR, if there is one, or the repository is cloned
+    and ingested, and the resulting index is published for other sessions.
+
+    Args:
+        link (str): Git repository URL
+        progress_callback (Optional[Callable[[dict], None]]): Called with a
+            report dict after each ingested batch
+        commit_sha (Optional[str]): Commit to index, if the remote HEAD was
+            already resolved
+
+    Returns:
+        GithubAgent: Agent ready to answer questions about the repository
+    """
+    commit_sha = commit_sha or resolve_head_commit(link)
+    key = make_key(link, commit_sha, CHUNK_CONFIG, resources.embedding_model_id())
+    entry, owner = registry.acquire(key)
+    if not owner:
+        return _attach_repository_index(entry)
+    return _build_repository_index(link, entry, progress_callback)
+
+
+def update_repository(agent: GithubAgent, progress_callback: Optional[Callable[[dict], None]] = None,
+                      release: bool = True) -> GithubAgent:
+    """Bring an ingested repository up to date with its remote HEAD.
+
+    Only files added, modified or renamed with changes since the indexed
+    commit are read and embedded. Unchanged files are restored from the
+    embedding cache into a new vector database for the new commit, since the
+    vector_io API offers no way to delete the chunks of individual documents.
+    The agent's reference to the old index is released afterwards.
+
+    Args:
+        agent (GithubAgent): Agent holding the index of an older commit
+        progress_callback (Optional[Callable[[dict], None]]): Called with a
+            report dict after each ingested batch
+        release (bool): Whether to release the agent's reference to the old
+            index, or leave that to the caller
+
+    Returns:
+        GithubAgent: Agent for the new commit, or the given agent if the
+                     repository has no new commits
+    """
+    if agent.repo_url is None or agent.commit_sha is None:
+        raise ValueError("Agent has no ingested repository to update")
+
+    commit_sha = resolve_head_commit(agent.repo_url)
+    if commit_sha == agent.commit_sha:
+        print(f"{agent.repo_url} is already up to date at {commit_sha}")
+        return agent
+
+    key = make_key(agent.repo_url, commit_sha, CHUNK_CONFIG, resources.embedding_model_id())
+    entry, owner = registry.acquire(key)
+    if owner:
+        updated = _build_repository_index(agent.repo_url, entry, progress_callback, previous=agent)
+    else:
+        updated = _attach_repository_index(entry)
+
+    if release:
+        agent.release()
+    return updated
+
+
+def make_document_id(relpath: str) -> str:
+    """Derive a stable document ID from a file's path in the repository.
+
+    Args:
+        relpath (str): Path of the file relative to the repository root
+
+    Returns:
+        str: Document ID that stays the same across commits and sessions
+    """
+    return f"doc-{hashlib.sha1(relpath.encode()).hexdigest()[:16]}"
+
+
 def answer_query_no_rag() -> str:
     """Fallback response when no repository is loaded.
     
@@ -271,8 +1285,8 @@ def answer_query_no_rag() -> str:
     You are a helpful AI assistant. To answer questions about a GitHub repository, I need you to first provide a repository URL in the Settings section. Once the repository is processed, I'll be able to answer your questions. Be brief and concise.
     """
 
-    response = client.inference.chat_completion(
-        model_id=llm.identifier,
+    response = resources.client().inference.chat_completion(
+        model_id=resources.llm_id(),
         messages=[
             {"role": "system", "content": prompt},
             {"role": "user", "content": ""},
@@ -282,22 +1296,97 @@ def answer_query_no_rag() -> str:
 
     return response.completion_message.content
 
+def on_ingest_batch(agent, progress_callback: Optional[Callable[[dict], None]], report: dict) -> None:
+    """Record the metrics of an ingestion batch, then pass its report on to the progress callback.
+
+    The report gains a 'chunks' key with the number of chunks indexed by the
+    agent so far.
+    """
+    record_ingest_batch(report)
+    report["chunks"] = len(agent.lexical_index)
+    if progress_callback is not None:
+        progress_callback(report)
+
+
+def record_answer(start: float, answer: list[str], failed: bool) -> None:
+    """Record the metrics of an answered question.
+
+    Args:
+        start (float): time.perf_counter() when the question was asked
+        answer (list[str]): Pieces of the answer
+        failed (bool): Whether the turn ended with an error
+    """
+    TURN_SECONDS.observe(time.perf_counter() - start, cached="false")
+    ANSWER_TOKENS.inc(count_tokens("".join(answer)))
+    if failed:
+        TURN_ERRORS.inc()
+
+
+def cached_answer_events(entry: AnswerEntry) -> list[dict]:
+    """Build the stream_query() events replaying a cached answer.
+
+    Args:
+        entry (AnswerEntry): Cached answer
+
+    Returns:
+        list[dict]: Its sources, text and done events
+    """
+    return [
+        {"type": "sources", "sources": entry.sources},
+        {"type": "text", "text": entry.answer},
+        {"type": "done", "answer": entry.answer, "sources": entry.sources, "cached": True},
+    ]
+
+
+def expired_events() -> list[dict]:
+    """Build the events of a query asked of an agent whose vector database was evicted."""
+    message = "The index of this repository expired after being idle. Reset and process the repository again."
+    return [{"type": "error", "message": message}, {"type": "done", "answer": "", "sources": []}]
+
+
+def vector_chunk(content: str, embedding: list[float], metadata: dict, token_count: int) -> dict:
+    """Build a vector_io chunk, adding the token counts of its content and of its metadata to the metadata."""
+    return {
+        "content": content,
+        "embedding": embedding,
+        "metadata": {**metadata, "token_count": token_count, "metadata_token_count": count_tokens(str(metadata))},
+    }
+
+
+def lines_label(chunk: dict) -> str:
+    """Format the line range of a chunk, e.g. '10-42'.
+
+    Args:
+        chunk (dict): Chunk with 'start_line' and 'end_line' keys; chunks cached
+                      before line ranges were recorded have neither
+
+    Returns:
+        str: The line range, or an empty string if it is unknown
+    """
+    if "start_line" not in chunk:
+        return ""
+    if chunk["start_line"] == chunk["end_line"]:
+        return str(chunk["start_line"])
+    return f"{chunk['start_line']}-{chunk['end_line']}"
+
+
 def load_document(filepath: str) -> Optional[str]:
     """Load document content from file.
     
+    Binary files and files over the size limit are rejected after sampling
+    their first block, and the encoding is detected before decoding.
+    
     Args:
         filepath (str): Path to the file to be loaded
         
     Returns:
         Optional[str]: The complete file content as a string, or None if
                       the file could not be read (e.g., permission denied,
-                      file not found, encoding issues)
+                      file not found, binary content, too large)
     """
     print(f"Reading {filepath}")
     try:
-        with open(filepath, 'r') as f:
-            content = f.read()
-            return content
-    except Exception as e:
+        return "".join(iter_document(filepath))
+    except (OSError, SkippedFile) as e:
         print(f"Error opening {filepath}, will not store: {e}")
-        return None
\ No newline at end of file
+        return None
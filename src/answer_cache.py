@@ -0,0 +1,175 @@
+import os
+import re
+import math
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 60 * 60)))
+# minimum cosine similarity of two questions to share an answer, 0 disables the similarity lookup
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+
+TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a question for exact matching.
+
+    Args:
+        query: Question as typed by the user
+
+    Returns:
+        The question in lower case, with collapsed whitespace and without
+        trailing punctuation
+    """
+    return TRAILING_PUNCTUATION.sub("", WHITESPACE.sub(" ", query.strip().lower()))
+
+
+def _unit(vector: list[float]) -> list[float]:
+    """Scale a vector to unit length, so dot products are cosine similarities."""
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else list(vector)
+
+
+class AnswerEntry:
+    """A cached answer with its sources and the embedding of its question."""
+
+    __slots__ = ("scope", "query", "answer", "sources", "embedding", "created")
+
+    def __init__(self, scope: tuple, query: str, answer: str, sources: list[dict],
+                 embedding: Optional[list[float]]):
+        self.scope = scope
+        self.query = query
+        self.answer = answer
+        self.sources = sources
+        self.embedding = _unit(embedding) if embedding else None
+        self.created = time.monotonic()
+
+
+class AnswerCache:
+    """In-memory cache of answers, scoped per index, model and prompt configuration.
+
+    A scope is a tuple starting with the vector database id; all entries of
+    a vector database are dropped with invalidate() when it is re-ingested or
+    unregistered. Questions are matched exactly after normalization, then
+    by the cosine similarity of their embeddings. Entries expire after ttl
+    seconds and the least recently used ones are evicted beyond max_entries.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl: float = ANSWER_CACHE_TTL,
+                 similarity: float = ANSWER_CACHE_SIMILARITY):
+        """Initialize an empty cache.
+
+        Args:
+            max_entries: Maximum number of cached answers over all scopes
+            ttl: Seconds an answer stays valid
+            similarity: Minimum cosine similarity for a similar question to
+                        match, or 0 to only match exact questions
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._scopes = {}
+
+    def _expired(self, entry: AnswerEntry) -> bool:
+        return time.monotonic() - entry.created > self.ttl
+
+    def _remove(self, key: tuple) -> None:
+        """Remove an entry. Caller holds the lock."""
+        entry = self._entries.pop(key)
+        scope = self._scopes[entry.scope]
+        del scope[entry.query]
+        if not scope:
+            del self._scopes[entry.scope]
+
+    def get(self, scope: tuple, query: str) -> Optional[AnswerEntry]:
+        """Look up the answer of exactly the same question.
+
+        Args:
+            scope: Scope of the answer, see GithubAgent._answer_scope
+            query: Question as typed by the user
+
+        Returns:
+            The cached entry, or None
+        """
+        key = (scope, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def get_similar(self, scope: tuple, embedding: list[float]) -> Optional[AnswerEntry]:
+        """Look up the answer of the most similar question asked before.
+
+        Args:
+            scope: Scope of the answer, see GithubAgent._answer_scope
+            embedding: Embedding of the question
+
+        Returns:
+            The cached entry of the most similar question, or None if no
+            question is similar enough
+        """
+        if self.similarity <= 0:
+            return None
+        vector = _unit(embedding)
+        with self._lock:
+            best, best_similarity = None, self.similarity
+            for query, entry in list(self._scopes.get(scope, {}).items()):
+                if self._expired(entry):
+                    self._remove((scope, query))
+                    continue
+                if entry.embedding is None or len(entry.embedding) != len(vector):
+                    continue
+                similarity = sum(a * b for a, b in zip(vector, entry.embedding))
+                if similarity >= best_similarity:
+                    best, best_similarity = entry, similarity
+            if best is not None:
+                self._entries.move_to_end((scope, best.query))
+            return best
+
+    def put(self, scope: tuple, query: str, answer: str, sources: list[dict],
+            embedding: Optional[list[float]] = None) -> None:
+        """Cache the answer to a question, evicting the least recently used answers if needed.
+
+        Args:
+            scope: Scope of the answer, see GithubAgent._answer_scope
+            query: Question as typed by the user
+            answer: Answer to the question
+            sources: Sources of the answer
+            embedding: Embedding of the question, for similarity lookups
+        """
+        entry = AnswerEntry(scope, normalize_query(query), answer, sources, embedding)
+        key = (scope, entry.query)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._scopes.setdefault(scope, {})[entry.query] = entry
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, vector_db_id: str) -> None:
+        """Drop every answer based on a vector database.
+
+        Args:
+            vector_db_id: Vector database that was re-ingested or unregistered
+        """
+        with self._lock:
+            for scope in [scope for scope in self._scopes if scope[0] == vector_db_id]:
+                for query in list(self._scopes[scope]):
+                    self._remove((scope, query))
+
+
+# Global answer cache shared by all sessions, or None if disabled
+answer_cache = AnswerCache() if ANSWER_CACHE_ENABLED else None
@@ -1,7 +1,25 @@
-from agent import create_github_agent, answer_query_no_rag
-from github import clone_and_build_tree, delete_repository
+import os
+import uuid
+import functools
+from agent import answer_query_no_rag
+from agent import load_repository as load_repository_threaded, update_repository as update_repository_threaded
+from async_agent import load_repository_sync, update_repository_sync
+from jobs import job_queue, FINISHED, QUEUED, SUCCEEDED, CANCELLED
+from lifecycle import lifecycle
+from metrics import start_metrics_server
+from workspace import Workspace, load_repositories, members_of, parse_manifest, update_repositories
 import streamlit as st
 
+if os.getenv("ASYNC_AGENT", "true").lower() == "true":
+    # ingestion and queries of all sessions share one event loop instead of blocking a thread each
+    load_repository, update_repository = load_repository_sync, update_repository_sync
+else:
+    load_repository, update_repository = load_repository_threaded, update_repository_threaded
+
+# the script reruns on every interaction; the endpoint and the reaper are only started once per process
+start_metrics_server()
+lifecycle.start()
+
 st.set_page_config(
     page_title="Github Assistant",
     initial_sidebar_state="auto",
@@ -16,57 +34,249 @@ if "messages" not in st.session_state:
 if "diagram" not in st.session_state:
     st.session_state.diagram = None
 
+if "expanded_dirs" not in st.session_state:
+    st.session_state.expanded_dirs = frozenset()
+
 if "ingested" not in st.session_state:
     st.session_state.ingested = False
 
 if "user_rag_system" not in st.session_state:
     st.session_state.user_rag_system = None
 
+if "job_id" not in st.session_state:
+    # after a page reload, keep following the unfinished job named in the URL
+    st.session_state.job_id = st.query_params.get("job")
+
+if "notice" not in st.session_state:
+    st.session_state.notice = None
+
+
+
+def current_user():
+    """Identify the user jobs are queued for.
+
+    Behind an authenticating proxy this is the forwarded user name, otherwise
+    an id kept in the URL so it survives page reloads.
+    """
+    user = st.context.headers.get("X-Forwarded-User")
+    if user:
+        return user
+    if "user" not in st.query_params:
+        st.query_params["user"] = uuid.uuid4().hex[:12]
+    return st.query_params["user"]
+
+
+def submit_job(description, fn, on_cancel=None):
+    """Queue an ingestion job for the current user and follow it in this session."""
+    job = job_queue.submit(current_user(), description, fn, on_cancel)
+    st.session_state.job_id = job.id
+    st.query_params["job"] = job.id
+
+
+def adopt_finished_job():
+    """Take over the agent of the followed job once it finished, or report why it did not succeed.
+
+    Only the first session to adopt a job takes over its agent; another tab
+    following the same job attaches its own session to the indexes. The job
+    id is dropped from the URL once the job finished, so reloads and shared
+    links do not adopt it again.
+    """
+    job = job_queue.get(st.session_state.job_id)
+    if job is None or job.owner != current_user():
+        st.session_state.job_id = None
+        st.query_params.pop("job", None)
+        return
+    if job.state not in FINISHED:
+        return
+
+    st.session_state.job_id = None
+    st.query_params.pop("job", None)
+    if job.state == SUCCEEDED:
+        result, first = job.adopt()
+        try:
+            agent = result if first else result.share()
+        except RuntimeError as e:
+            st.session_state.notice = ("error", f"Error processing repository: {e}")
+            return
+        st.session_state.user_rag_system = agent
+        st.session_state.diagram = agent.diagram
+        st.session_state.expanded_dirs = frozenset()
+        st.session_state.ingested = True
+        failed = job.progress["failed"]
+        skipped = f" (skipped {failed} files that could not be stored)" if failed else ""
+        summaries = [member.ingest_summary or {} for member in members_of(agent)]
+        left_out = sum(summary.get("duplicates", 0) + summary.get("generated", 0) for summary in summaries)
+        if left_out:
+            skipped += f" (left out {left_out} duplicate or generated files)"
+        if isinstance(agent, Workspace):
+            repositories = len(agent.members)
+            if agent.failed:
+                skipped += f" (could not load {', '.join(link for link, _ in agent.failed)})"
+            st.session_state.notice = ("success", f"Successfully processed {repositories} repositories{skipped}")
+        else:
+            st.session_state.notice = ("success", f"Successfully processed repository at {agent.commit_sha[:12]}{skipped}")
+    elif job.state == CANCELLED:
+        st.session_state.notice = ("info", f"Cancelled: {job.description}")
+    else:
+        st.session_state.notice = ("error", f"Error processing repository: {job.error}")
+
+
+@st.fragment(run_every=1.0)
+def job_progress():
+    """Show the progress of the followed job, refreshing every second until it finishes."""
+    job = job_queue.get(st.session_state.job_id)
+    if job is None or job.state in FINISHED:
+        st.rerun()
+    snapshot = job.snapshot()
+    progress = snapshot["progress"]
+    if job.cancelled:
+        st.progress(0.0, text="Cancelling...")
+        return
+
+    if snapshot["state"] == QUEUED:
+        ahead = job_queue.position(job)
+        st.progress(0.0, text=f"{snapshot['description']}: waiting for {ahead} job{'s' if ahead != 1 else ''} ahead")
+    elif progress["total_batches"]:
+        st.progress(
+            progress["batches"] / progress["total_batches"],
+            text=f"Embedded batch {progress['batches']}/{progress['total_batches']}: {progress['files']} files, "
+                 f"{progress['bytes'] / 1024 / 1024:.1f} MiB read, {progress['chunks']} chunks",
+        )
+    else:
+        st.progress(0.0, text=f"{snapshot['description']}: cloning and scanning the repository...")
+    if st.button("Cancel"):
+        job_queue.cancel(job.id)
+
+
+def answer_text(events, status, sources):
+    """Turn the events of a streamed query into answer text for st.write_stream.
+
+    Tool calls are shown in the status placeholder and retrieved sources are
+    collected into the sources list as they arrive.
+    """
+    for event in events:
+        if event["type"] == "text":
+            yield event["text"]
+        elif event["type"] == "tool_call":
+            status.caption(f"Searching the repository with `{event['tool']}`...")
+        elif event["type"] == "sources":
+            sources.extend(event["sources"])
+            status.caption(f"Retrieved {len(sources)} source{'s' if len(sources) != 1 else ''}")
+        elif event["type"] == "error":
+            st.error(f"Error answering the question: {event['message']}")
+
+
+def also_in(source):
+    """Caption listing the duplicates of a source, which were left out of the index."""
+    duplicates = ", ".join(f"`{duplicate}`" for duplicate in source["duplicates"])
+    more = source.get("duplicate_count", len(source["duplicates"])) - len(source["duplicates"])
+    return f"Also in: {duplicates}" + (f" and {more} more" if more > 0 else "")
+
+
+if st.session_state.job_id:
+    adopt_finished_job()
+
+if st.session_state.ingested and st.session_state.user_rag_system.expired:
+    # the vector database was evicted after the session went idle; release what the
+    # workspace still holds of its other repositories
+    st.session_state.user_rag_system.release()
+    st.session_state.diagram = None
+    st.session_state.expanded_dirs = frozenset()
+    st.session_state.ingested = False
+    st.session_state.user_rag_system = None
+    st.query_params.pop("job", None)
+    st.session_state.notice = ("warning", "The repository index expired after being idle, please process it again")
 
 # sidebar
 with st.sidebar:
     st.header("Settings")
-    link = st.text_input("Enter Github Repository URL:")
+    urls = st.text_area("Enter Github Repository URLs, one per line:")
+    manifest = st.file_uploader("Or upload a manifest of repositories", type=["txt", "json"])
 
     # save button
-    if st.button("Save") and link:
-        if not st.session_state.ingested:
-            with st.spinner("Processing..."):
-                try:
-                    st.session_state.user_rag_system = create_github_agent()
-                    
-                    repo_path, file_list, diagram = clone_and_build_tree(link)
-                    st.session_state.user_rag_system.store_documents(file_list)
-                    st.session_state.diagram = diagram
-                    delete_repository(repo_path)
-                    st.success("Successfully Processed Repository")
-                    st.session_state.ingested = True
+    if st.button("Save") and (urls or manifest):
+        try:
+            links = parse_manifest(urls) + (parse_manifest(manifest.getvalue().decode("utf-8")) if manifest else [])
+        except ValueError as e:
+            links = []
+            st.error(str(e))
+        current = st.session_state.user_rag_system if st.session_state.ingested else None
+        if st.session_state.job_id:
+            st.warning("A repository is already being processed")
+        elif not links:
+            pass
+        elif current is not None:
+            # the new workspace shares the repositories of the current agent; a late cancellation only
+            # releases the added ones
+            submit_job(
+                f"Adding {len(links)} repositories" if len(links) > 1 else f"Adding {links[0]}",
+                functools.partial(load_repositories, links, load=load_repository, existing=current),
+                on_cancel=lambda workspace: workspace.release(keep=current),
+            )
+        elif len(links) > 1:
+            submit_job(
+                f"Processing {len(links)} repositories",
+                functools.partial(load_repositories, links, load=load_repository),
+                on_cancel=lambda workspace: workspace.release(),
+            )
+        elif links:
+            # ingestion runs on the job workers; the session only polls its progress
+            submit_job(f"Processing {links[0]}", functools.partial(load_repository, links[0]),
+                       on_cancel=lambda agent: agent.release())
 
-                except Exception as e:
-                    st.error(f"Error processing repository: {e}")
-                    st.session_state.user_rag_system = None
-        else:
-            st.warning("Already processed repository")
+    if st.session_state.job_id:
+        job_progress()
+
+    if st.session_state.notice:
+        level, text = st.session_state.notice
+        getattr(st, level)(text)
+        st.session_state.notice = None
 
     # display repository diagram
     if st.session_state.ingested and st.session_state.diagram:
-        st.header("Saved Repository")
-        st.markdown(f"{st.session_state.diagram}")
+        workspace = st.session_state.user_rag_system
+        st.header("Saved Repositories" if isinstance(workspace, Workspace) else "Saved Repository")
+        if isinstance(workspace, Workspace):
+            scope = st.selectbox("Search in", workspace.repositories(), index=None, placeholder="All repositories")
+            if scope != workspace.scope:
+                workspace.set_scope(scope)
+        diagram, collapsed = st.session_state.diagram.render(st.session_state.expanded_dirs)
+        st.markdown(diagram)
+        if collapsed:
+            expand = st.selectbox("Expand directory", collapsed, index=None, placeholder="Choose a directory")
+            if expand:
+                st.session_state.expanded_dirs = st.session_state.expanded_dirs | {expand}
+                st.rerun()
 
-    # reset button
+    # update and reset buttons
     if st.session_state.ingested:
         st.markdown("---")
+        if st.button("Update") and not st.session_state.job_id:
+            # update_repository releases the old index itself, so a late cancellation keeps the new one
+            agent = st.session_state.user_rag_system
+            if isinstance(agent, Workspace):
+                submit_job(f"Updating {len(agent.members)} repositories",
+                           functools.partial(update_repositories, agent, update=update_repository))
+            else:
+                submit_job(f"Updating {agent.repo_url}", functools.partial(update_repository, agent))
+            st.rerun()
+
         if st.button("Reset"):
             with st.spinner("Clearing..."):
                 try:
+                    if st.session_state.job_id:
+                        job_queue.cancel(st.session_state.job_id)
                     if st.session_state.user_rag_system:
-                        st.session_state.user_rag_system.reset_vector_db()
+                        st.session_state.user_rag_system.release()
                     
                     # Clear all session state
                     st.session_state.messages = []
                     st.session_state.diagram = None
+                    st.session_state.expanded_dirs = frozenset()
                     st.session_state.ingested = False
                     st.session_state.user_rag_system = None
+                    st.session_state.job_id = None
+                    st.query_params.pop("job", None)
                     
                     st.success("Successfully cleared repository and conversation history")
                     st.rerun()
@@ -85,6 +295,8 @@ for message in st.session_state.messages:
             with st.expander("View Sources"):
                 for idx, source in enumerate(message["sources"]):
                     st.markdown(f"`{source['file']}`")
+                    if source.get("duplicates"):
+                        st.caption(also_in(source))
                     st.code(source["text"])
                     st.markdown("---")
 
@@ -99,20 +311,24 @@ if prompt := st.chat_input():
     with st.chat_message("assistant"):
         
         answer = None
-        retrieved_sources = None
+        retrieved_sources = []
 
         if st.session_state.ingested and st.session_state.user_rag_system:
-            answer, retrieved_sources = st.session_state.user_rag_system.answer_query(prompt)
+            status = st.empty()
+            events = st.session_state.user_rag_system.stream_query(prompt)
+            answer = st.write_stream(answer_text(events, status, retrieved_sources))
+            status.empty()
         else:
             answer = answer_query_no_rag()
-
-        st.write(answer)
+            st.write(answer)
 
         # show sources
         if retrieved_sources and len(retrieved_sources) > 0:
             with st.expander("View Sources"):
                 for idx, source in enumerate(retrieved_sources):
                     st.markdown(f"`{source['file']}`")
+                    if source.get("duplicates"):
+                        st.caption(also_in(source))
                     st.code(source["text"])
                     st.markdown("---")
 
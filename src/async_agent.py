@@ -0,0 +1,854 @@
+import os
+import uuid
+import queue
+import asyncio
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional, TypeVar
+
+from llama_stack_client.lib.agents.agent import AsyncAgent
+
+from agent import (EMBEDDING_BATCH_SIZE, GithubAgent, agent_config, cached_answer_events, expired_events, on_ingest_batch,
+                   prompt_tokens, record_answer, retain_index)
+from answer_cache import answer_cache
+from chunking import CHUNK_CONFIG
+from conversation import CONVERSATION_SUMMARY_TOKENS, Conversation
+from embedding_cache import get_embedding_cache
+from github import RepositoryDiagram, diff_commits, resolve_head_commit
+from gitsource import RepositorySource, open_repository
+from ingest import INGEST_BATCH_MAX_BYTES, INGEST_BATCH_MAX_DOCS, file_size, make_batches
+from lexical import LexicalIndex
+from lifecycle import lifecycle
+from loader import ByteBudget
+from metrics import CONVERSATION_COMPACTIONS, EMBEDDED_TOKENS, EMBEDDING_CACHE, INGEST_CHUNKS, TURN_SECONDS, span
+from registry import RegistryEntry, make_key, new_vector_db_id, registry
+from resources import resources
+from snapshot import open_snapshot, save_snapshot
+from symbols import SymbolIndex
+
+ASYNC_MAX_CONCURRENCY = int(os.getenv("ASYNC_MAX_CONCURRENCY", "4"))
+
+T = TypeVar("T")
+
+
+class AsyncGithubAgent:
+    """Asyncio variant of GithubAgent built on the async LlamaStack client.
+
+    Ingestion and queries are coroutines, so a single event loop can serve
+    many sessions with long-running ingestions and agent turns in progress
+    without a thread per request. Blocking work (reading and chunking files,
+    cloning, the embedding cache) runs in the loop's default executor.
+
+    Instances are created with the create() and attach() coroutines. The
+    attributes are the same as those of GithubAgent.
+    """
+
+    # I/O free helpers shared with the synchronous agent
+    _prepare_document = GithubAgent._prepare_document
+    _deduplicate = GithubAgent._deduplicate
+    _vector_chunks = GithubAgent._vector_chunks
+    _index_chunks = GithubAgent._index_chunks
+    _turn_events = GithubAgent._turn_events
+    _answer_scope = GithubAgent._answer_scope
+    _get_sources = GithubAgent._get_sources
+    _get_content_and_filename = GithubAgent._get_content_and_filename
+    expired = GithubAgent.expired
+    touch = GithubAgent.touch
+    search_indexes = GithubAgent.search_indexes
+    # snapshot export and restore do synchronous I/O, run them with asyncio.to_thread
+    export_snapshot = GithubAgent.export_snapshot
+    restore_snapshot = GithubAgent.restore_snapshot
+    _insert_restored = GithubAgent._insert_restored
+    # so do the inserts of unchanged documents from the embedding cache when updating
+    _reuse_documents = GithubAgent._reuse_documents
+    _insert_cached_documents = GithubAgent._insert_cached_documents
+
+    def __init__(self, vector_db_id: Optional[str] = None, lexical_index: Optional[LexicalIndex] = None,
+                 symbol_index: Optional[SymbolIndex] = None):
+        """Initialize the agent state. Use create() or attach() to get a usable agent.
+
+        Args:
+            vector_db_id (Optional[str]): Identifier of the vector database to use,
+                or None to generate a unique one
+            lexical_index (Optional[LexicalIndex]): Lexical index of an existing
+                vector database, or None to start an empty one
+            symbol_index (Optional[SymbolIndex]): Symbol index of an existing
+                vector database, or None to start an empty one
+        """
+        self.doc_id_to_filename = {}
+        self.doc_count = 0
+        self._lock = threading.Lock()
+        self.vector_db_id = vector_db_id or new_vector_db_id()
+        self.registry_entry = None
+        self.diagram = None
+        self.ingest_summary = None
+        self.documents = {}
+        self.duplicates = {}
+        self.repo_url = None
+        self.commit_sha = None
+        self.lexical_index = lexical_index if lexical_index is not None else LexicalIndex()
+        self.symbol_index = symbol_index if symbol_index is not None else SymbolIndex()
+        self.rag_agent = None
+        self.session_id = None
+        self.conversation = Conversation()
+
+    @classmethod
+    async def create(cls, vector_db_id: Optional[str] = None, register: bool = True,
+                     lexical_index: Optional[LexicalIndex] = None,
+                     symbol_index: Optional[SymbolIndex] = None) -> "AsyncGithubAgent":
+        """Create an agent, registering its vector database and starting its session.
+
+        Args:
+            vector_db_id (Optional[str]): Identifier of the vector database to use,
+                or None to generate a unique one
+            register (bool): Whether to register the vector database, or use an existing one
+            lexical_index (Optional[LexicalIndex]): Lexical index of an existing
+                vector database, or None to start an empty one
+            symbol_index (Optional[SymbolIndex]): Symbol index of an existing
+                vector database, or None to start an empty one
+
+        Returns:
+            AsyncGithubAgent: Agent with its own RAG agent and session
+        """
+        agent = cls(vector_db_id, lexical_index, symbol_index)
+        if register:
+            await agent._register_vector_db()
+        await agent._create_agent()
+        return agent
+
+    @classmethod
+    async def attach(cls, entry: RegistryEntry) -> "AsyncGithubAgent":
+        """Create an agent that uses an already built, shared vector database.
+
+        Args:
+            entry (RegistryEntry): Ready registry entry of the shared index
+
+        Returns:
+            AsyncGithubAgent: Agent with its own session on the shared index
+        """
+        agent = await cls.create(vector_db_id=entry.vector_db_id, register=False,
+                                 lexical_index=entry.lexical, symbol_index=entry.symbols)
+        agent.registry_entry = entry
+        agent.doc_id_to_filename = entry.doc_id_to_filename
+        agent.doc_count = len(entry.doc_id_to_filename)
+        agent.diagram = entry.diagram
+        agent.ingest_summary = entry.summary
+        agent.documents = entry.documents
+        agent.duplicates = entry.duplicates
+        agent.repo_url, agent.commit_sha = entry.key[0], entry.key[1]
+        lifecycle.touch(entry.vector_db_id)
+        return agent
+
+    async def share(self) -> "AsyncGithubAgent":
+        """Create another agent with its own session on the index of this agent, as GithubAgent.share."""
+        entry = retain_index(self)
+        try:
+            return await AsyncGithubAgent.attach(entry)
+        except (Exception, asyncio.CancelledError):
+            registry.release(entry)
+            raise
+
+    async def _register_vector_db(self) -> None:
+        """Register the vector database of this agent with the LlamaStack server."""
+        lifecycle.track(self.vector_db_id)
+        try:
+            with span("register_vector_db"):
+                await resources.async_client().vector_dbs.register(
+                    vector_db_id=self.vector_db_id,
+                    embedding_model=await asyncio.to_thread(resources.embedding_model_id),
+                    embedding_dimension=await asyncio.to_thread(resources.embedding_dimension),
+                    provider_id=await asyncio.to_thread(resources.vector_io_provider_id),
+                )
+        except (Exception, asyncio.CancelledError):
+            lifecycle.forget(self.vector_db_id)
+            raise
+
+    async def _unregister_vector_db(self) -> None:
+        """Unregister the vector database of this agent, logging failures."""
+        if answer_cache:
+            answer_cache.invalidate(self.vector_db_id)
+        if not lifecycle.forget(self.vector_db_id):
+            # already unregistered by the lifecycle manager
+            return
+        try:
+            await resources.async_client().vector_dbs.unregister(vector_db_id=self.vector_db_id)
+            print(f"Successfully unregistered vector database: {self.vector_db_id}")
+        except Exception as e:
+            print(f"Warning: Could not unregister vector database {self.vector_db_id}: {e}")
+
+    async def release(self) -> None:
+        """Release the vector database of this agent.
+
+        A shared database is only unregistered once the last session attached
+        to it releases it.
+        """
+        if self.registry_entry is not None:
+            entry, self.registry_entry = self.registry_entry, None
+            if not registry.release(entry):
+                return
+        await self._unregister_vector_db()
+
+    async def _create_agent(self) -> None:
+        """Create a new RAG agent and session using the current vector database."""
+        config = await asyncio.to_thread(agent_config, self.search_indexes())
+        self.rag_agent = AsyncAgent(resources.async_client(), **config)
+        self.session_id = await self.rag_agent.create_session(session_name=f"s{uuid.uuid4().hex}")
+        self.conversation = Conversation(base_tokens=prompt_tokens(config))
+
+    async def _compact(self, reason: str) -> None:
+        """Fold older exchanges into the conversation summary and continue in a new session, as GithubAgent._compact."""
+        messages = self.conversation.summary_messages()
+        summary = None
+        if messages:
+            try:
+                with span("summarize"):
+                    response = await resources.async_client().inference.chat_completion(
+                        model_id=await asyncio.to_thread(resources.llm_id),
+                        messages=messages,
+                        sampling_params={"strategy": {"type": "greedy"}, "max_tokens": CONVERSATION_SUMMARY_TOKENS * 2},
+                    )
+                summary = response.completion_message.content
+            except Exception as e:
+                print(f"Warning: Could not summarize the conversation, falling back to an extractive summary: {e}")
+        self.conversation.compact(summary if isinstance(summary, str) else None)
+        self.session_id = await self.rag_agent.create_session(session_name=f"s{uuid.uuid4().hex}")
+        CONVERSATION_COMPACTIONS.inc(reason=reason)
+
+    async def _embed_documents(self, documents: list[dict]) -> list[list[dict]]:
+        """Embed prepared documents, reusing cached embeddings where possible.
+
+        Args:
+            documents (list[dict]): Documents from _prepare_document()
+
+        Returns:
+            list[list[dict]]: For each document, its chunks as dicts with 'content',
+                              'token_count', 'start_line', 'end_line' and 'embedding' keys
+        """
+        cache = get_embedding_cache()
+        results = {}
+        misses = {}
+        for document in documents:
+            key = document["key"]
+            if key in results or key in misses:
+                continue
+            cached = await asyncio.to_thread(cache.get, key) if cache else None
+            if cached is not None:
+                results[key] = cached
+            else:
+                misses[key] = document["chunks"]
+        EMBEDDING_CACHE.inc(len(results), result="hit")
+        EMBEDDING_CACHE.inc(len(misses), result="miss")
+
+        pending = [chunk for chunks in misses.values() for chunk in chunks]
+        EMBEDDED_TOKENS.inc(sum(chunk["token_count"] for chunk in pending))
+        model_id = await asyncio.to_thread(resources.embedding_model_id) if pending else None
+        for start in range(0, len(pending), EMBEDDING_BATCH_SIZE):
+            batch = pending[start:start + EMBEDDING_BATCH_SIZE]
+            with span("embed", chunks=len(batch)):
+                response = await resources.async_client().inference.embeddings(
+                    model_id=model_id,
+                    contents=[chunk["content"] for chunk in batch],
+                )
+            for chunk, embedding in zip(batch, response.embeddings):
+                chunk["embedding"] = embedding
+
+        for key, chunks in misses.items():
+            if cache:
+                await asyncio.to_thread(cache.put, key, chunks)
+            results[key] = chunks
+
+        return [results[document["key"]] for document in documents]
+
+    async def _insert_documents(self, loaded: list[tuple[str, dict]], root_path: Optional[str] = None) -> list[tuple[str, str]]:
+        """Embed a batch of loaded files and insert their chunks into the vector database with a single request.
+
+        If the batch fails, the files are retried one by one so that a single
+        bad document does not drop the whole batch.
+
+        Args:
+            loaded (list[tuple[str, dict]]): List of (filepath, prepared document) pairs
+            root_path (Optional[str]): Repository root used to derive relative paths
+
+        Returns:
+            list[tuple[str, str]]: (filepath, error) pairs of documents that could not be stored
+        """
+        try:
+            embedded = await self._embed_documents([document for _, document in loaded])
+
+            chunks = []
+            for (filepath, document), document_chunks in zip(loaded, embedded):
+                relpath = os.path.relpath(filepath, root_path) if root_path else filepath
+                chunks.extend(self._vector_chunks(relpath, document["key"], document_chunks))
+
+            if chunks:
+                with span("insert", chunks=len(chunks)):
+                    await resources.async_client().vector_io.insert(vector_db_id=self.vector_db_id, chunks=chunks)
+                INGEST_CHUNKS.inc(len(chunks))
+                await asyncio.to_thread(self._index_chunks, chunks)
+            return []
+        except Exception as e:
+            if len(loaded) == 1:
+                return [(loaded[0][0], str(e))]
+            print(f"Batch insert of {len(loaded)} documents failed, retrying individually: {e}")
+
+        failed = []
+        for item in loaded:
+            failed.extend(await self._insert_documents([item], root_path))
+        return failed
+
+    async def store_documents(
+        self,
+        files: list[str],
+        progress_callback: Optional[Callable[[dict], None]] = None,
+        root_path: Optional[str] = None,
+        max_concurrency: int = ASYNC_MAX_CONCURRENCY,
+        source: Optional[RepositorySource] = None,
+    ) -> dict:
+        """Store documents in the current vector database with bounded concurrency.
+
+        Files are grouped into the same size-bounded batches as
+        GithubAgent.store_documents, and at most max_concurrency batches are
+        read, embedded and inserted at once. Generated files and duplicates
+        are left out first, as by GithubAgent.store_documents.
+
+        Args:
+            files (list[str]): Paths of the files to store
+            progress_callback (Optional[Callable[[dict], None]]): Called with a
+                report dict after each batch, as in ingest.ingest_files
+            root_path (Optional[str]): Repository root used to derive relative paths
+            max_concurrency (int): Maximum number of batches in progress at once
+            source (Optional[RepositorySource]): Source the files are read
+                from, or None to read them from disk
+
+        Returns:
+            dict: Ingestion summary with the same keys as ingest.ingest_files
+        """
+        if answer_cache:
+            answer_cache.invalidate(self.vector_db_id)
+        files, dropped, texts = await asyncio.to_thread(self._deduplicate, files, root_path, source)
+        sizes = {}
+        size_of = source.size_of if source is not None else file_size
+
+        def record_size(filepath: str) -> int:
+            sizes[filepath] = size_of(filepath)
+            return sizes[filepath]
+
+        batches = make_batches(files, INGEST_BATCH_MAX_DOCS, INGEST_BATCH_MAX_BYTES, record_size)
+        summary = {"batches": len(batches), "files": 0, "bytes": 0, "stored": 0, "failed": [], "elapsed": 0.0}
+        budget = ByteBudget()
+        semaphore = asyncio.Semaphore(max_concurrency)
+        start = time.perf_counter()
+
+        async def run_batch(index: int, batch: list[str]) -> dict:
+            async with semaphore:
+                batch_start = time.perf_counter()
+                prepared = await asyncio.gather(
+                    *(asyncio.to_thread(self._prepare_document, filepath, budget, source, texts) for filepath in batch),
+                    return_exceptions=True,
+                )
+                loaded = []
+                failed = []
+                for filepath, document in zip(batch, prepared):
+                    if isinstance(document, Exception):
+                        failed.append((filepath, str(document)))
+                    else:
+                        loaded.append((filepath, document))
+                read_elapsed = time.perf_counter() - batch_start
+
+                if loaded:
+                    failed.extend(await self._insert_documents(loaded, root_path))
+
+                failed_paths = {filepath for filepath, _ in failed}
+                return {
+                    "batch": index + 1,
+                    "total_batches": len(batches),
+                    "files": len(batch),
+                    "bytes": sum(sizes[filepath] for filepath, _ in loaded),
+                    "stored": sum(1 for filepath, _ in loaded if filepath not in failed_paths),
+                    "failed": failed,
+                    "read_elapsed": read_elapsed,
+                    "elapsed": time.perf_counter() - batch_start,
+                }
+
+        tasks = [asyncio.ensure_future(run_batch(index, batch)) for index, batch in enumerate(batches)]
+        try:
+            with span("store_documents", files=len(files)):
+                for completed in asyncio.as_completed(tasks):
+                    report = await completed
+                    summary["files"] += report["files"]
+                    summary["bytes"] += report["bytes"]
+                    summary["stored"] += report["stored"]
+                    summary["failed"].extend(report["failed"])
+                    on_ingest_batch(self, progress_callback, report)
+        finally:
+            # when cancelled, stop the outstanding batches before the vector database is unregistered
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        summary["elapsed"] = time.perf_counter() - start
+        summary.update(dropped)
+        for filepath, error in summary["failed"]:
+            print(f"Error storing document {filepath}, will not store: {error}")
+        print(
+            f"Stored {summary['stored']}/{len(files)} documents in {summary['batches']} batches "
+            f"({summary['bytes']} bytes, {summary['elapsed']:.1f}s)"
+        )
+        return summary
+
+    async def update_documents(
+        self,
+        root_path: str,
+        files: list[str],
+        previous_documents: dict[str, str],
+        changes: Optional[dict[str, list]],
+        progress_callback: Optional[Callable[[dict], None]] = None,
+        source: Optional[RepositorySource] = None,
+        previous_duplicates: Optional[dict[str, list[str]]] = None,
+    ) -> dict:
+        """Store a new revision of a repository, embedding only what changed, as GithubAgent.update_documents.
+
+        Returns:
+            dict: Ingestion summary of the changed files, with an additional
+                  'reused' count of documents restored from the cache
+        """
+        to_store, reused = await asyncio.to_thread(self._reuse_documents, root_path, files, previous_documents,
+                                                   changes, previous_duplicates)
+        summary = await self.store_documents(to_store, progress_callback=progress_callback, root_path=root_path,
+                                             source=source)
+        summary["reused"] = reused
+        return summary
+
+    async def _create_turn_stream(self, query: str) -> AsyncIterator:
+        """Start a streamed turn, compacting the conversation as GithubAgent._create_turn_stream.
+
+        Args:
+            query (str): The user's question
+
+        Yields:
+            Turn response stream chunks from the LlamaStack agent
+        """
+        if self.conversation.over_budget(query):
+            await self._compact("budget")
+        for attempt in range(2):
+            answered = False
+            failed = False
+            async for chunk in await self.rag_agent.create_turn(
+                messages=[self.conversation.message(query)],
+                session_id=self.session_id,
+                stream=True,
+            ):
+                if hasattr(chunk, "error") and attempt == 0 and not answered:
+                    failed = True
+                    break
+                if not hasattr(chunk, "error") and chunk.event.payload.event_type == "step_progress":
+                    answered = answered or chunk.event.payload.delta.type == "text"
+                yield chunk
+            if not failed:
+                return
+            await self._compact("error")
+
+    async def _embed_query(self, query: str) -> Optional[list[float]]:
+        """Embed a question for the answer cache's similarity lookup, or return None on failure."""
+        try:
+            response = await resources.async_client().inference.embeddings(
+                model_id=await asyncio.to_thread(resources.embedding_model_id),
+                contents=[query],
+            )
+            return response.embeddings[0]
+        except Exception as e:
+            print(f"Warning: Could not embed query for the answer cache: {e}")
+            return None
+
+    async def stream_query(self, query: str) -> AsyncIterator[dict]:
+        """Answer a query using RAG, yielding events as the turn progresses.
+
+        Args:
+            query (str): The user's question about the GitHub repository
+
+        Yields:
+            dict: The events described in GithubAgent.stream_query
+        """
+        if not self.touch():
+            for event in expired_events():
+                yield event
+            return
+        start = time.perf_counter()
+        scope = await asyncio.to_thread(self._answer_scope) if answer_cache and self.conversation.fresh else None
+        embedding = None
+        if scope:
+            cached = answer_cache.get(scope, query)
+            if cached is None and answer_cache.similarity > 0:
+                embedding = await self._embed_query(query)
+                cached = answer_cache.get_similar(scope, embedding) if embedding else None
+            if cached is not None:
+                TURN_SECONDS.observe(time.perf_counter() - start, cached="true")
+                self.conversation.record_cached(query, cached.answer)
+                for event in cached_answer_events(cached):
+                    yield event
+                return
+
+        answer = []
+        sources = []
+        failed = False
+        async for chunk in self._create_turn_stream(query):
+            for event in self._turn_events(chunk, answer, sources):
+                failed = failed or event["type"] == "error"
+                yield event
+
+        record_answer(start, answer, failed)
+        if answer and not failed:
+            self.conversation.record(query, "".join(answer), sources)
+        if scope and answer and not failed:
+            answer_cache.put(scope, query, "".join(answer), sources, embedding)
+        yield {"type": "done", "answer": "".join(answer), "sources": sources}
+
+    async def answer_query(self, query: str) -> tuple[str, list[dict[str, str]]]:
+        """Answer a query using RAG.
+
+        Args:
+            query (str): The user's question about the GitHub repository
+
+        Returns:
+            tuple[str, list[dict[str, str]]]: The answer and its sources, as
+                returned by GithubAgent.answer_query
+        """
+        async for event in self.stream_query(query):
+            if event["type"] == "error":
+                raise RuntimeError(f"Turn did not complete. Error: {event['message']}")
+            if event["type"] == "done":
+                return event["answer"], event["sources"]
+        return "", []
+
+
+async def _build_repository_index(
+    link: str,
+    entry: RegistryEntry,
+    progress_callback: Optional[Callable[[dict], None]] = None,
+    previous: Optional[AsyncGithubAgent] = None,
+) -> AsyncGithubAgent:
+    """Clone a repository commit and build the index of a registry entry.
+
+    Follows agent._build_repository_index, restoring the index from a
+    snapshot in SNAPSHOT_DIR if there is one.
+
+    Args:
+        link (str): Git repository URL
+        entry (RegistryEntry): Entry owned by the caller, whose index is built
+        progress_callback (Optional[Callable[[dict], None]]): Called with a
+            report dict after each ingested batch
+        previous (Optional[AsyncGithubAgent]): Agent holding an index of an
+            older commit of the same repository; only the diff is re-embedded
+
+    Returns:
+        AsyncGithubAgent: Agent attached to the newly built index
+    """
+    agent = None
+    snapshot = None
+    with lifecycle.busy(entry.vector_db_id):
+        try:
+            snapshot = await asyncio.to_thread(open_snapshot, entry.key)
+            agent = await AsyncGithubAgent.create(vector_db_id=entry.vector_db_id,
+                                                  lexical_index=snapshot.lexical if snapshot is not None else None)
+            agent.registry_entry = entry
+            agent.repo_url, agent.commit_sha = entry.key[0], entry.key[1]
+            if snapshot is not None:
+                summary = await asyncio.to_thread(agent.restore_snapshot, snapshot, progress_callback)
+                diagram = snapshot.diagram
+            else:
+                summary, diagram = await _ingest_repository(agent, link, progress_callback, previous)
+        except (Exception, asyncio.CancelledError) as e:
+            registry.fail(entry, e)
+            registry.release(entry)
+            if agent is not None:
+                agent.registry_entry = None
+                await agent._unregister_vector_db()
+            raise
+
+        agent.diagram = diagram
+        agent.ingest_summary = summary
+        registry.publish(entry, agent.doc_id_to_filename, diagram, summary, agent.documents,
+                         agent.lexical_index, agent.symbol_index, agent.duplicates)
+    if snapshot is None:
+        await asyncio.to_thread(save_snapshot, agent, entry.key)
+    return agent
+
+
+async def _ingest_repository(
+    agent: AsyncGithubAgent,
+    link: str,
+    progress_callback: Optional[Callable[[dict], None]] = None,
+    previous: Optional[AsyncGithubAgent] = None,
+) -> tuple[dict, RepositoryDiagram]:
+    """Clone the commit of an agent and store its files, or only those changed since a previous index.
+
+    Follows agent._ingest_repository.
+
+    Returns:
+        tuple[dict, RepositoryDiagram]: Ingestion summary and diagram of the repository
+    """
+    commit_sha = agent.commit_sha
+    source = await asyncio.to_thread(open_repository, link, commit_sha)
+    try:
+        if previous is None:
+            summary = await agent.store_documents(source.file_list, progress_callback=progress_callback,
+                                                  root_path=source.root_path, source=source)
+        else:
+            try:
+                changes = await asyncio.to_thread(diff_commits, source.git_dir, previous.commit_sha, commit_sha)
+            except ValueError as e:
+                print(f"Could not diff against indexed commit, re-ingesting all files: {e}")
+                changes = None
+            summary = await agent.update_documents(
+                source.root_path, source.file_list, previous.documents, changes,
+                progress_callback=progress_callback, source=source,
+                previous_duplicates=previous.duplicates,
+            )
+    finally:
+        await asyncio.to_thread(source.close)
+    return summary, source.diagram
+
+
+async def load_repository(link: str, progress_callback: Optional[Callable[[dict], None]] = None,
+                          commit_sha: Optional[str] = None) -> AsyncGithubAgent:
+    """Create an AsyncGithubAgent for a repository, reusing an existing index of the same commit if possible.
+
+    Follows agent.load_repository, sharing its registry of indexes.
+
+    Args:
+        link (str): Git repository URL
+        progress_callback (Optional[Callable[[dict], None]]): Called with a
+            report dict after each ingested batch
+        commit_sha (Optional[str]): Commit to index, if the remote HEAD was
+            already resolved
+
+    Returns:
+        AsyncGithubAgent: Agent ready to answer questions about the repository
+    """
+    commit_sha = commit_sha or await asyncio.to_thread(resolve_head_commit, link)
+    key = make_key(link, commit_sha, CHUNK_CONFIG, await asyncio.to_thread(resources.embedding_model_id))
+    entry, owner = registry.acquire(key)
+    if owner:
+        return await _build_repository_index(link, entry, progress_callback)
+    return await _attach_repository_index(entry)
+
+
+async def _attach_repository_index(entry: RegistryEntry) -> AsyncGithubAgent:
+    """Wait for the index of a registry entry built by another session and attach to it.
+
+    Follows agent._attach_repository_index.
+    """
+    try:
+        await entry.wait_async()
+    except (Exception, asyncio.CancelledError):
+        registry.release(entry)
+        raise
+    print(f"Attaching to existing vector database {entry.vector_db_id} for {entry.key[0]}@{entry.key[1]}")
+    return await AsyncGithubAgent.attach(entry)
+
+
+async def update_repository(agent: AsyncGithubAgent, progress_callback: Optional[Callable[[dict], None]] = None,
+                            release: bool = True) -> AsyncGithubAgent:
+    """Bring an ingested repository up to date with its remote HEAD, as agent.update_repository.
+
+    Only files changed since the indexed commit are read and embedded, the
+    others are inserted from the embedding cache into the new index.
+
+    Args:
+        agent (AsyncGithubAgent): Agent holding the index of an older commit
+        progress_callback (Optional[Callable[[dict], None]]): Called with a
+            report dict after each ingested batch
+        release (bool): Whether to release the agent's reference to the old
+            index, or leave that to the caller
+
+    Returns:
+        AsyncGithubAgent: Agent for the new commit, or the given agent if the
+                          repository has no new commits
+    """
+    if agent.repo_url is None or agent.commit_sha is None:
+        raise ValueError("Agent has no ingested repository to update")
+
+    commit_sha = await asyncio.to_thread(resolve_head_commit, agent.repo_url)
+    if commit_sha == agent.commit_sha:
+        print(f"{agent.repo_url} is already up to date at {commit_sha}")
+        return agent
+
+    key = make_key(agent.repo_url, commit_sha, CHUNK_CONFIG, await asyncio.to_thread(resources.embedding_model_id))
+    entry, owner = registry.acquire(key)
+    if owner:
+        updated = await _build_repository_index(agent.repo_url, entry, progress_callback, previous=agent)
+    else:
+        updated = await _attach_repository_index(entry)
+
+    if release:
+        await agent.release()
+    return updated
+
+
+class EventLoopThread:
+    """An asyncio event loop running forever in a daemon thread."""
+
+    def __init__(self):
+        """Start the loop thread."""
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="async-agent-loop", daemon=True)
+        self._thread.start()
+
+    def run(
+        self,
+        coroutine: Awaitable[T],
+        reports: Optional[queue.Queue] = None,
+        callback: Optional[Callable[[dict], None]] = None,
+    ) -> T:
+        """Run a coroutine on the loop and wait for its result.
+
+        If the callback raises while the coroutine is running, for example
+        because the job it reports to was cancelled, the coroutine is
+        cancelled and the exception propagates once its cleanup has run.
+
+        Args:
+            coroutine: Coroutine to run
+            reports: Optional queue the coroutine puts progress reports into
+            callback: Called on the calling thread with each report from the queue
+
+        Returns:
+            The result of the coroutine
+        """
+        done = threading.Event()
+        task = asyncio.run_coroutine_threadsafe(self._start(coroutine, done), self.loop).result()
+        try:
+            while not done.wait(0.1 if reports is not None else None):
+                self._drain(reports, callback)
+        except BaseException:
+            self.loop.call_soon_threadsafe(task.cancel)
+            # e.g. a half-built vector database is unregistered before the caller moves on
+            done.wait()
+            raise
+        self._drain(reports, callback)
+        return task.result()
+
+    @staticmethod
+    async def _start(coroutine: Awaitable[T], done: threading.Event) -> asyncio.Task:
+        """Wrap a coroutine in a task on the loop that sets an event when it finishes."""
+        task = asyncio.ensure_future(coroutine)
+        task.add_done_callback(lambda _: done.set())
+        return task
+
+    def iterate(self, iterator: AsyncIterator[T]) -> Iterator[T]:
+        """Consume an async iterator on the loop, yielding its items on the calling thread.
+
+        Args:
+            iterator: Async iterator to consume
+
+        Yields:
+            The items of the iterator
+        """
+        while True:
+            try:
+                yield self.run(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+
+    @staticmethod
+    def _drain(reports: Optional[queue.Queue], callback: Optional[Callable[[dict], None]]) -> None:
+        """Hand queued progress reports to the callback."""
+        while reports is not None:
+            try:
+                report = reports.get_nowait()
+            except queue.Empty:
+                return
+            if callback is not None:
+                callback(report)
+
+
+_loop_thread = None
+_loop_thread_lock = threading.Lock()
+
+
+def get_event_loop_thread() -> EventLoopThread:
+    """Return the process-wide event loop shared by all sessions, starting it if needed."""
+    global _loop_thread
+    with _loop_thread_lock:
+        if _loop_thread is None:
+            _loop_thread = EventLoopThread()
+        return _loop_thread
+
+
+class SyncGithubAgent:
+    """Synchronous facade over an AsyncGithubAgent running on the shared event loop.
+
+    Offers the query and release methods of GithubAgent, so app.py can use
+    either agent. The waiting is done by the calling thread; the work itself
+    is multiplexed with every other session on the single loop thread.
+    """
+
+    def __init__(self, agent: AsyncGithubAgent):
+        """Wrap an async agent.
+
+        Args:
+            agent (AsyncGithubAgent): Agent created on the shared event loop
+        """
+        self._agent = agent
+        self._loop = get_event_loop_thread()
+
+    def __getattr__(self, name: str):
+        """Expose the state of the wrapped agent (diagram, documents, commit_sha, ...)."""
+        return getattr(self._agent, name)
+
+    def stream_query(self, query: str) -> Iterator[dict]:
+        """Answer a query, yielding the events described in GithubAgent.stream_query."""
+        return self._loop.iterate(self._agent.stream_query(query))
+
+    def answer_query(self, query: str) -> tuple[str, list[dict[str, str]]]:
+        """Answer a query, as GithubAgent.answer_query."""
+        return self._loop.run(self._agent.answer_query(query))
+
+    def release(self) -> None:
+        """Release the vector database of the wrapped agent."""
+        self._loop.run(self._agent.release())
+
+    def share(self) -> "SyncGithubAgent":
+        """Create another agent with its own session on the same index, as GithubAgent.share."""
+        return SyncGithubAgent(self._loop.run(self._agent.share()))
+
+
+def load_repository_sync(link: str, progress_callback: Optional[Callable[[dict], None]] = None,
+                         commit_sha: Optional[str] = None) -> SyncGithubAgent:
+    """Load a repository on the shared event loop, blocking until it is ready.
+
+    Progress reports are passed to progress_callback on the calling thread,
+    so it may update Streamlit elements.
+
+    Args:
+        link (str): Git repository URL
+        progress_callback (Optional[Callable[[dict], None]]): Called with a
+            report dict after each ingested batch
+        commit_sha (Optional[str]): Commit to index, if the remote HEAD was
+            already resolved
+
+    Returns:
+        SyncGithubAgent: Agent ready to answer questions about the repository
+    """
+    reports = queue.Queue()
+    agent = get_event_loop_thread().run(load_repository(link, reports.put, commit_sha), reports, progress_callback)
+    return SyncGithubAgent(agent)
+
+
+def update_repository_sync(agent: SyncGithubAgent, progress_callback: Optional[Callable[[dict], None]] = None,
+                           release: bool = True) -> SyncGithubAgent:
+    """Update a repository on the shared event loop, blocking until it is ready, see update_repository.
+
+    Args:
+        agent (SyncGithubAgent): Agent holding the index of an older commit
+        progress_callback (Optional[Callable[[dict], None]]): Called on the
+            calling thread with a report dict after each ingested batch
+        release (bool): Whether to release the agent's reference to the old index
+
+    Returns:
+        SyncGithubAgent: Agent for the new commit, or the given agent if the
+                         repository has no new commits
+    """
+    reports = queue.Queue()
+    updated = get_event_loop_thread().run(update_repository(agent._agent, reports.put, release), reports,
+                                          progress_callback)
+    return agent if updated is agent._agent else SyncGithubAgent(updated)
@@ -0,0 +1,347 @@
+import os
+import re
+import ast
+import bisect
+from typing import Iterable, Iterator, Optional
+
+CHUNK_SIZE_IN_TOKENS = int(os.getenv("CHUNK_SIZE_IN_TOKENS", "512"))
+# the overlap the server-side chunker used before chunking moved into the client
+CHUNK_OVERLAP_IN_TOKENS = int(os.getenv("CHUNK_OVERLAP_IN_TOKENS", "50"))
+CODE_AWARE_CHUNKING = os.getenv("CODE_AWARE_CHUNKING", "true").lower() == "true"
+
+# everything that changes the chunks of a document, for cache and registry keys
+CHUNK_CONFIG = (CHUNK_SIZE_IN_TOKENS, CHUNK_OVERLAP_IN_TOKENS, CODE_AWARE_CHUNKING)
+
+CODE_EXTENSIONS = {
+    ".py": "python", ".pyi": "python",
+    ".md": "markdown", ".markdown": "markdown", ".mdx": "markdown",
+    **{extension: "code" for extension in (
+        ".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".vue", ".svelte",
+        ".java", ".kt", ".kts", ".scala", ".groovy", ".go", ".rs", ".swift", ".dart",
+        ".c", ".h", ".cc", ".cpp", ".cxx", ".hpp", ".hh", ".cs", ".m", ".mm",
+        ".php", ".rb", ".lua", ".pl", ".r", ".jl", ".ex", ".exs", ".erl", ".hs", ".ml", ".clj",
+        ".sh", ".bash", ".zsh", ".sql", ".proto", ".tf",
+    )},
+}
+
+# words and individual punctuation marks approximate the tokenizer of the embedding model
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+NEWLINE_PATTERN = re.compile(r"\n")
+LINE_PATTERN = re.compile(r"[^\n]*\n|[^\n]+\Z")
+
+# lines that continue or close a block rather than starting a new one
+CLOSING_LINE = re.compile(r"\s*(?:[)\]}]|(?:end|else|elif|elsif|except|catch|finally|fi|done|esac)\b)")
+BLOCK_ENDINGS = ("}", ";", "end")
+MARKDOWN_HEADING = re.compile(r"(#{1,6})\s")
+FALLBACK_DEPTH = 1000
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the number of tokens in a piece of text.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Approximate token count
+    """
+    return sum(1 for _ in TOKEN_PATTERN.finditer(text))
+
+
+def _line_at(newlines: list[int], offset: int) -> int:
+    """Return the 1-based line number of a character offset, given the offsets of the newlines."""
+    return bisect.bisect_left(newlines, offset) + 1
+
+
+def chunk_text(
+    text: str,
+    chunk_size: int = CHUNK_SIZE_IN_TOKENS,
+    overlap: int = CHUNK_OVERLAP_IN_TOKENS,
+    first_line: int = 1,
+) -> list[dict]:
+    """Split text into windows of approximately chunk_size tokens.
+
+    Chunks are slices of the original text, so whitespace and formatting
+    are preserved. Consecutive chunks share overlap tokens.
+
+    Args:
+        text: Text to split
+        chunk_size: Maximum number of tokens per chunk
+        overlap: Number of tokens shared by consecutive chunks
+        first_line: Line number of the first line of text
+
+    Returns:
+        List of chunk dicts with 'content', 'token_count', 'start_line' and
+        'end_line' keys
+    """
+    spans = [m.span() for m in TOKEN_PATTERN.finditer(text)]
+    if not spans:
+        return []
+
+    newlines = [m.start() for m in NEWLINE_PATTERN.finditer(text)]
+    step = max(1, chunk_size - overlap)
+    chunks = []
+    for start in range(0, len(spans), step):
+        window = spans[start:start + chunk_size]
+        begin = spans[start - 1][1] if start > 0 else 0
+        end = window[-1][1] if start + chunk_size < len(spans) else len(text)
+        chunks.append({
+            "content": text[begin:end],
+            "token_count": len(window),
+            "start_line": first_line - 1 + _line_at(newlines, window[0][0]),
+            "end_line": first_line - 1 + _line_at(newlines, window[-1][1] - 1),
+        })
+        if start + chunk_size >= len(spans):
+            break
+    return chunks
+
+
+def chunk_stream(
+    pieces: Iterable[str],
+    chunk_size: int = CHUNK_SIZE_IN_TOKENS,
+    overlap: int = CHUNK_OVERLAP_IN_TOKENS,
+) -> Iterator[dict]:
+    """Split streamed text into the same chunks chunk_text() would produce.
+
+    Only about one chunk of text is buffered at a time, so large documents
+    can be chunked while they are being read.
+
+    Args:
+        pieces: Consecutive pieces of the text
+        chunk_size: Maximum number of tokens per chunk
+        overlap: Number of tokens shared by consecutive chunks
+
+    Yields:
+        Chunk dicts with 'content', 'token_count', 'start_line' and 'end_line' keys
+    """
+    step = max(1, chunk_size - overlap)
+    buffer = ""
+    first_line = 1
+    for piece in pieces:
+        buffer += piece
+        spans = [m.span() for m in TOKEN_PATTERN.finditer(buffer)]
+        # the last token may continue in the next piece, so it never ends a chunk here
+        while len(spans) > chunk_size:
+            end = spans[chunk_size - 1][1]
+            start_line = first_line + buffer.count("\n", 0, spans[0][0])
+            yield {
+                "content": buffer[:end],
+                "token_count": chunk_size,
+                "start_line": start_line,
+                "end_line": start_line + buffer.count("\n", spans[0][0], end - 1),
+            }
+            cut = spans[step - 1][1]
+            first_line += buffer.count("\n", 0, cut)
+            buffer = buffer[cut:]
+            spans = [(start - cut, end - cut) for start, end in spans[step:]]
+    yield from chunk_text(buffer, chunk_size, overlap, first_line)
+
+
+def chunking_strategy(filepath: str) -> str:
+    """Pick the chunking strategy of a file from its name.
+
+    Args:
+        filepath: Path or name of the file
+
+    Returns:
+        'python', 'markdown' or 'code' for files split on syntax boundaries,
+        'text' for files split into overlapping token windows
+    """
+    if not CODE_AWARE_CHUNKING:
+        return "text"
+    extension = os.path.splitext(filepath)[1].lower()
+    return CODE_EXTENSIONS.get(extension, "text")
+
+
+def _python_boundaries(text: str, lines: list[str]) -> Optional[list[tuple[int, int]]]:
+    """Find the lines starting module- and class-level statements of Python source.
+
+    Decorators and the comments directly above a statement belong to it.
+
+    Returns:
+        List of (line index, nesting depth) pairs, or None if the source does not parse
+    """
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+
+    boundaries = []
+    stack = [(tree.body, 0)]
+    while stack:
+        body, depth = stack.pop()
+        for node in body:
+            start = min([d.lineno for d in getattr(node, "decorator_list", [])] + [node.lineno]) - 1
+            while start > 0 and lines[start - 1].lstrip().startswith("#"):
+                start -= 1
+            boundaries.append((start, depth))
+            if isinstance(node, ast.ClassDef):
+                stack.append((node.body, depth + 1))
+    return boundaries
+
+
+def _heuristic_boundaries(lines: list[str]) -> list[tuple[int, int]]:
+    """Find the lines likely to start a declaration or block in source code of any language.
+
+    A line starts a block when it follows a blank line or the end of a
+    previous block or statement; its indentation gives its nesting depth.
+
+    Returns:
+        List of (line index, indentation) pairs
+    """
+    boundaries = []
+    for i in range(1, len(lines)):
+        line = lines[i]
+        if not line.strip() or CLOSING_LINE.match(line):
+            continue
+        previous = lines[i - 1].strip()
+        if previous and not previous.endswith(BLOCK_ENDINGS) and not CLOSING_LINE.match(previous):
+            continue
+        expanded = line.expandtabs(4)
+        boundaries.append((i, len(expanded) - len(expanded.lstrip())))
+    return boundaries
+
+
+def _markdown_boundaries(lines: list[str]) -> list[tuple[int, int]]:
+    """Find the heading lines of a Markdown document, ignoring fenced code blocks.
+
+    Returns:
+        List of (line index, heading level) pairs
+    """
+    boundaries = []
+    fenced = False
+    for i, line in enumerate(lines):
+        if line.startswith(("```", "~~~")):
+            fenced = not fenced
+        elif not fenced:
+            heading = MARKDOWN_HEADING.match(line)
+            if heading:
+                boundaries.append((i, len(heading.group(1))))
+    return boundaries
+
+
+def _split_lines(
+    start: int,
+    end: int,
+    boundaries: list[tuple[int, int]],
+    counts: list[int],
+    chunk_size: int,
+) -> list[tuple[int, int]]:
+    """Recursively split a range of lines on its outermost boundaries until every part fits.
+
+    Parts without inner boundaries that are still too large are split
+    between lines.
+
+    Returns:
+        List of consecutive (start, end) line ranges covering the input range
+    """
+    if sum(counts[start:end]) <= chunk_size or end - start == 1:
+        return [(start, end)]
+
+    inner = [(line, depth) for line, depth in boundaries if start < line < end]
+    if inner:
+        outermost = min(depth for _, depth in inner)
+        points = [line for line, depth in inner if depth == outermost]
+        parts = []
+        for part_start, part_end in zip([start] + points, points + [end]):
+            parts.extend(_split_lines(part_start, part_end, boundaries, counts, chunk_size))
+        return parts
+
+    parts = []
+    part_start = start
+    tokens = 0
+    for i in range(start, end):
+        if tokens and tokens + counts[i] > chunk_size:
+            parts.append((part_start, i))
+            part_start, tokens = i, 0
+        tokens += counts[i]
+    parts.append((part_start, end))
+    return parts
+
+
+def chunk_code(text: str, strategy: str, chunk_size: int = CHUNK_SIZE_IN_TOKENS) -> list[dict]:
+    """Split source code or Markdown into chunks that follow its structure.
+
+    Python is split on the module-level functions and classes and on the
+    methods of classes found by the ast module, Markdown on its headings, and
+    other languages (and the insides of long Python functions or Markdown
+    sections) on indentation and blank-line heuristics. Parts larger
+    than chunk_size are split on their next nesting level, and small
+    neighbouring parts are merged up to chunk_size, so chunks do not need any
+    overlap.
+
+    Args:
+        text: Source text
+        strategy: 'python', 'markdown' or 'code', see chunking_strategy()
+        chunk_size: Maximum number of tokens per chunk
+
+    Returns:
+        List of chunk dicts with 'content', 'token_count', 'start_line' and
+        'end_line' keys
+    """
+    # only \n ends a line, as in ast line numbers and chunk_text()
+    lines = LINE_PATTERN.findall(text)
+    counts = [count_tokens(line) for line in lines]
+
+    boundaries = None
+    if strategy == "python":
+        boundaries = _python_boundaries(text, lines)
+    elif strategy == "markdown":
+        boundaries = _markdown_boundaries(lines)
+    heuristic = _heuristic_boundaries(lines)
+    if boundaries is None:
+        boundaries = heuristic
+    else:
+        # inside parts without structural boundaries, e.g. long functions, fall back to the heuristics
+        boundaries += [(line, FALLBACK_DEPTH + depth) for line, depth in heuristic]
+
+    merged = []
+    for start, end in _split_lines(0, len(lines), boundaries, counts, chunk_size):
+        tokens = sum(counts[start:end])
+        if merged and merged[-1][2] + tokens <= chunk_size:
+            merged[-1] = (merged[-1][0], end, merged[-1][2] + tokens)
+        else:
+            merged.append((start, end, tokens))
+
+    chunks = []
+    for start, end, tokens in merged:
+        if not tokens:
+            continue
+        content = "".join(lines[start:end])
+        if tokens > chunk_size:
+            # a single line longer than a chunk, e.g. minified code
+            chunks.extend(chunk_text(content, chunk_size, 0, start + 1))
+            continue
+        while not lines[start].strip():
+            start += 1
+        while not lines[end - 1].strip():
+            end -= 1
+        chunks.append({"content": content, "token_count": tokens, "start_line": start + 1, "end_line": end})
+    return chunks
+
+
+def chunk_document(
+    pieces: Iterable[str],
+    filepath: str,
+    chunk_size: int = CHUNK_SIZE_IN_TOKENS,
+    overlap: int = CHUNK_OVERLAP_IN_TOKENS,
+) -> Iterator[dict]:
+    """Split a streamed document with the chunking strategy matching its file name.
+
+    Plain text is chunked while it streams in; source code and Markdown are
+    buffered and split on their structure (see chunk_code).
+
+    Args:
+        pieces: Consecutive pieces of the document text
+        filepath: Path or name of the document, used to pick the strategy
+        chunk_size: Maximum number of tokens per chunk
+        overlap: Number of tokens shared by consecutive plain text chunks
+
+    Yields:
+        Chunk dicts with 'content', 'token_count', 'start_line' and 'end_line' keys
+    """
+    strategy = chunking_strategy(filepath)
+    if strategy == "text":
+        yield from chunk_stream(pieces, chunk_size, overlap)
+    else:
+        yield from chunk_code("".join(pieces), strategy, chunk_size)
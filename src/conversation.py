@@ -0,0 +1,190 @@
+import os
+from typing import Optional
+
+from chunking import TOKEN_PATTERN, count_tokens
+
+# context window of the LLM, in tokens
+CONVERSATION_CONTEXT_TOKENS = int(os.getenv("CONVERSATION_CONTEXT_TOKENS", "8192"))
+# kept free for the next turn: its question, retrieved chunks, tool calls and answer
+CONVERSATION_TURN_RESERVE_TOKENS = int(os.getenv("CONVERSATION_TURN_RESERVE_TOKENS", "4096"))
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "400"))
+# most recent exchanges carried verbatim into a compacted session, besides the summary
+CONVERSATION_KEEP_TURNS = int(os.getenv("CONVERSATION_KEEP_TURNS", "1"))
+# tokens of each answer carried verbatim
+CONVERSATION_KEPT_ANSWER_TOKENS = int(os.getenv("CONVERSATION_KEPT_ANSWER_TOKENS", "300"))
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and an assistant about a GitHub repository. "
+    "Merge the new exchanges into the current summary. Keep the user's goals, the files, functions and facts "
+    "that were established and any open questions; drop greetings and repetition. "
+    "Reply with the updated summary only, in at most {words} words."
+)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text after max_tokens tokens, as counted by count_tokens(), marking the cut with '...'."""
+    for index, match in enumerate(TOKEN_PATTERN.finditer(text)):
+        if index == max_tokens:
+            return text[:match.start()].rstrip() + " ..."
+    return text
+
+
+def carried_exchanges(exchanges: list["Exchange"]) -> str:
+    """Format exchanges carried verbatim into the first message of a session."""
+    return "Most recent exchanges:\n" + "\n\n".join(
+        f"User: {exchange.query}\nAssistant: {truncate_tokens(exchange.answer, CONVERSATION_KEPT_ANSWER_TOKENS)}"
+        for exchange in exchanges
+    )
+
+
+class Exchange:
+    """A question and its answer not yet folded into the summary.
+
+    Attributes:
+        query (str): Question of the user
+        answer (str): Answer of the agent
+        tokens (int): Tokens the exchange added to the session history,
+            including the tool outputs retrieved to answer it
+    """
+
+    def __init__(self, query: str, answer: str, tokens: int):
+        self.query = query
+        self.answer = answer
+        self.tokens = tokens
+
+
+class Conversation:
+    """Token budget of the history of an agent session, compacted before it overflows the context.
+
+    LlamaStack keeps the history of a session on the server and replays all
+    of it, tool outputs included, on every turn, so prompts grow with the
+    length of a chat. The conversation estimates that history from the
+    questions, answers and retrieved sources of each turn. Once the next
+    turn would no longer fit into the context window, the agent compacts
+    it: older exchanges are folded into a rolling summary, the agent starts
+    a new session, and the first question of the new session carries the
+    summary and the most recent exchanges instead of the full history and
+    its stale tool outputs.
+    """
+
+    def __init__(self, context_tokens: int = CONVERSATION_CONTEXT_TOKENS,
+                 reserve_tokens: int = CONVERSATION_TURN_RESERVE_TOKENS, base_tokens: int = 0):
+        """Initialize an empty conversation.
+
+        Args:
+            context_tokens: Context window of the LLM
+            reserve_tokens: Tokens kept free for the next turn
+            base_tokens: Tokens of the instructions and tool definitions sent with every turn
+        """
+        self.context_tokens = context_tokens
+        self.reserve_tokens = reserve_tokens
+        self.base_tokens = base_tokens
+        self.summary = ""
+        self.exchanges = []
+        self.history_tokens = 0
+        self.compactions = 0
+        self._seed = None
+
+    @property
+    def fresh(self) -> bool:
+        """Whether no question was asked yet, so that an answer does not depend on earlier turns."""
+        return not self.exchanges and self._seed is None and not self.summary
+
+    def message(self, query: str) -> dict:
+        """Build the user message of a turn, carrying the compacted history after a compaction."""
+        if self._seed is None:
+            return {"role": "user", "content": query}
+        return {"role": "user", "content": f"{self._seed}\n\nCurrent question: {query}"}
+
+    def record(self, query: str, answer: str, sources: list[dict[str, str]]) -> None:
+        """Account a completed turn to the session history.
+
+        Args:
+            query: Question of the turn
+            answer: Answer of the turn
+            sources: Sources retrieved by its tool calls
+        """
+        tokens = count_tokens(self.message(query)["content"]) + count_tokens(answer)
+        tokens += sum(count_tokens(source["text"]) + count_tokens(source["file"]) for source in sources)
+        self.exchanges.append(Exchange(query, answer, tokens))
+        self.history_tokens += tokens
+        self._seed = None
+
+    def record_cached(self, query: str, answer: str) -> None:
+        """Account a turn answered from the answer cache, which the agent session never saw.
+
+        The exchange is carried into the message of the next question, as
+        the most recent exchanges are after a compaction.
+
+        Args:
+            query: Question of the turn
+            answer: Cached answer
+        """
+        self.exchanges.append(Exchange(query, answer, 0))
+        self._seed = carried_exchanges(self.exchanges[-1:])
+
+    def over_budget(self, query: str) -> bool:
+        """Return whether a turn asking query might overflow the context window with the current history."""
+        if not self.history_tokens:
+            return False
+        needed = self.base_tokens + self.history_tokens + count_tokens(query) + self.reserve_tokens
+        return needed > self.context_tokens
+
+    def _to_summarize(self) -> list[Exchange]:
+        return self.exchanges[:max(0, len(self.exchanges) - CONVERSATION_KEEP_TURNS)]
+
+    def summary_messages(self) -> Optional[list[dict]]:
+        """Build the chat completion messages folding the older exchanges into the summary.
+
+        Returns:
+            The messages, or None if there is nothing new to summarize
+        """
+        exchanges = self._to_summarize()
+        if not exchanges:
+            return None
+        transcript = "\n\n".join(
+            f"User: {exchange.query}\nAssistant: {truncate_tokens(exchange.answer, CONVERSATION_SUMMARY_TOKENS * 2)}"
+            for exchange in exchanges
+        )
+        return [
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS.format(words=CONVERSATION_SUMMARY_TOKENS * 3 // 4)},
+            {"role": "user", "content": f"Current summary:\n{self.summary or '(empty)'}\n\nNew exchanges:\n{transcript}"},
+        ]
+
+    def _fallback_summary(self) -> str:
+        """Summarize without the LLM: the previous summary followed by the start of each exchange."""
+        lines = [self.summary] if self.summary else []
+        lines += [f"- Asked: {truncate_tokens(exchange.query, 40)} Answered: {truncate_tokens(exchange.answer, 40)}"
+                  for exchange in self._to_summarize()]
+        text = "\n".join(lines)
+        # keep the most recent part when over budget
+        tokens = [match.start() for match in TOKEN_PATTERN.finditer(text)]
+        if len(tokens) > CONVERSATION_SUMMARY_TOKENS:
+            text = "... " + text[tokens[-CONVERSATION_SUMMARY_TOKENS]:]
+        return text
+
+    def compact(self, summary: Optional[str] = None) -> None:
+        """Fold the older exchanges into the summary; the agent must then start a new session.
+
+        Args:
+            summary: Updated summary written by the LLM from summary_messages(),
+                     or None to fall back to an extractive summary
+        """
+        if summary is not None and summary.strip():
+            self.summary = truncate_tokens(summary.strip(), CONVERSATION_SUMMARY_TOKENS)
+        elif self._to_summarize():
+            self.summary = self._fallback_summary()
+
+        kept = self.exchanges[len(self._to_summarize()):]
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of our conversation so far:\n{self.summary}")
+        if kept:
+            parts.append(carried_exchanges(kept))
+        if parts:
+            parts.append("Sources retrieved earlier are no longer shown; search the repository again if you need them.")
+        self._seed = "\n\n".join(parts) if parts else None
+        # carried exchanges are summarized by a later compaction, if they are not carried again
+        self.exchanges = kept
+        self.history_tokens = 0
+        self.compactions += 1
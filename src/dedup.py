@@ -0,0 +1,290 @@
+import os
+import re
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from chunking import TOKEN_PATTERN
+from ingest import INGEST_READ_WORKERS
+from loader import ByteBudget, SkippedFile
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+# skip files marked as generated or made of very long lines, such as minified bundles
+DEDUP_GENERATED = os.getenv("DEDUP_GENERATED", "true").lower() == "true"
+# estimated Jaccard similarity of token shingles above which files are near-duplicates, 0 disables
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.85"))
+DEDUP_SHINGLE_TOKENS = int(os.getenv("DEDUP_SHINGLE_TOKENS", "5"))
+# files with fewer shingles are only matched exactly
+DEDUP_MIN_SHINGLES = int(os.getenv("DEDUP_MIN_SHINGLES", "20"))
+# duplicates listed in the metadata of every chunk of their representative
+DEDUP_METADATA_PATHS = int(os.getenv("DEDUP_METADATA_PATHS", "3"))
+# characters of the files read for fingerprinting kept in memory to be chunked without reading them again
+DEDUP_TEXT_CHARS = int(os.getenv("DEDUP_TEXT_CHARS", str(256 * 1024 * 1024)))
+
+# MinHash signature length and LSH banding: 16 bands of 4 rows make files
+# with a similarity of 0.85 candidates with a probability above 0.99
+MINHASH_SIZE = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_SIZE // LSH_BANDS
+
+GENERATED_HEADER_LINES = 10
+# comments of the header lines, the only place generator markers are looked for
+COMMENT_LINE = re.compile(r"^\s*(?:#|//|/\*|\*|<!--|--)(.*)$")
+GENERATED_MARKERS = re.compile(
+    r"@generated\b|\bcode generated\b.*\bdo not edit\b|\b(?:auto-?)?generated by\b",
+    re.IGNORECASE,
+)
+# prose is often written with one paragraph per line, so its line lengths say nothing
+PROSE_EXTENSIONS = ("", ".md", ".markdown", ".mdx", ".rst", ".txt", ".adoc")
+# minified bundles and data dumps: large files of the extensions below made of a few very long lines
+BUNDLE_EXTENSIONS = (".js", ".mjs", ".cjs", ".css", ".json", ".map")
+BUNDLE_MIN_CHARS = 10_000
+BUNDLE_MAX_LINES = 20
+BUNDLE_MIN_AVERAGE_LINE = 200
+
+
+def generated_reason(filepath: str, text: str) -> Optional[str]:
+    """Tell whether a file was generated by a tool rather than written by hand.
+
+    Files that are not prose are generated if a comment in their header
+    carries a marker such as 'Code generated ... DO NOT EDIT', '@generated'
+    or 'Generated by'. Markers in docstrings and strings are ignored, since
+    they often describe what the code generates. Scripts, stylesheets and
+    JSON are also generated if they are large and made of a few very long
+    lines, like minified bundles and data dumps; hand-written fixtures and
+    sources with a long literal are kept.
+
+    Args:
+        filepath: Path of the file
+        text: Content of the file
+
+    Returns:
+        Why the file is considered generated, or None if it is not
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension in PROSE_EXTENSIONS:
+        return None
+    for line in text[:4096].splitlines()[:GENERATED_HEADER_LINES]:
+        comment = COMMENT_LINE.match(line)
+        marker = GENERATED_MARKERS.search(comment.group(1)) if comment else None
+        if marker:
+            return f"generated file marker '{marker.group(0)}'"
+
+    if extension not in BUNDLE_EXTENSIONS or len(text) < BUNDLE_MIN_CHARS:
+        return None
+    lengths = [len(line) for line in text.splitlines() if line.strip()]
+    if lengths and len(lengths) <= BUNDLE_MAX_LINES and sum(lengths) / len(lengths) >= BUNDLE_MIN_AVERAGE_LINE:
+        return f"minified or data file ({len(lengths)} lines of up to {max(lengths):,} characters)"
+    return None
+
+
+def minhash(text: str, shingle_tokens: int = DEDUP_SHINGLE_TOKENS,
+            min_shingles: int = DEDUP_MIN_SHINGLES) -> Optional[tuple[int, ...]]:
+    """Compute the MinHash signature of the token shingles of a text.
+
+    Uses one-permutation hashing: every shingle is hashed once, the hash
+    picks one of MINHASH_SIZE bins and the smallest value of each bin forms
+    the signature. Empty bins borrow the value of the next filled bin.
+    Tokenizing with chunking.TOKEN_PATTERN makes the signature insensitive
+    to whitespace and line wrapping.
+
+    Args:
+        text: Content of the file
+        shingle_tokens: Tokens per shingle
+        min_shingles: Minimum number of shingles of a signature
+
+    Returns:
+        The signature, or None if the text has too few shingles to be compared
+    """
+    tokens = TOKEN_PATTERN.findall(text)
+    count = len(tokens) - shingle_tokens + 1
+    if count < min_shingles:
+        return None
+
+    bins = [None] * MINHASH_SIZE
+    for start in range(count):
+        shingle = "\0".join(tokens[start:start + shingle_tokens]).encode("utf-8", errors="surrogatepass")
+        value = int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "little")
+        index, value = value % MINHASH_SIZE, value // MINHASH_SIZE
+        if bins[index] is None or value < bins[index]:
+            bins[index] = value
+
+    # values are below 2**58; the distance to the borrowed bin keeps them distinct
+    signature = []
+    for index in range(MINHASH_SIZE):
+        for distance in range(MINHASH_SIZE):
+            value = bins[(index + distance) % MINHASH_SIZE]
+            if value is not None:
+                signature.append(value + (distance << 58))
+                break
+    return tuple(signature)
+
+
+def similarity(first: tuple[int, ...], second: tuple[int, ...]) -> float:
+    """Estimate the Jaccard similarity of two texts from their MinHash signatures."""
+    return sum(a == b for a, b in zip(first, second)) / MINHASH_SIZE
+
+
+class Fingerprint:
+    """What duplicate detection needs to know about the content of a file.
+
+    Attributes:
+        digest (str): Hash of the exact content
+        signature (Optional[tuple[int, ...]]): MinHash signature, or None if
+            the file is too short or near-duplicate detection is disabled
+        generated (Optional[str]): Why the file is considered generated, or None
+    """
+
+    def __init__(self, digest: str, signature: Optional[tuple[int, ...]], generated: Optional[str]):
+        self.digest = digest
+        self.signature = signature
+        self.generated = generated
+
+    @classmethod
+    def of(cls, filepath: str, text: str, near: bool = True, generated: bool = True) -> "Fingerprint":
+        """Fingerprint the content of a file.
+
+        Args:
+            filepath: Path of the file
+            text: Content of the file
+            near: Whether to compute the MinHash signature
+            generated: Whether to check for generated files
+        """
+        return cls(
+            hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest(),
+            minhash(text) if near else None,
+            generated_reason(filepath, text) if generated else None,
+        )
+
+
+def preference(filepath: str) -> tuple:
+    """Sort key picking the representative of a cluster: the shallowest path, then the first in order.
+
+    Vendored and copied files tend to live deeper in the tree than the
+    original they were copied from.
+    """
+    return os.path.normpath(filepath).count(os.sep), filepath
+
+
+def cluster(fingerprints: dict[str, Fingerprint], threshold: float = DEDUP_SIMILARITY) -> dict[str, list[str]]:
+    """Group exact and near-duplicate files, picking one representative per group.
+
+    Files are visited in preference() order. A file whose content equals
+    that of a representative, or whose signature is at least threshold
+    similar to that of a representative with the same extension, joins its
+    cluster; any other file becomes a representative. Near-duplicate
+    candidates are found by locality-sensitive hashing of signature bands,
+    so files are not compared pairwise.
+
+    Args:
+        fingerprints: Fingerprints of the files, keyed by path
+        threshold: Minimum estimated similarity of near-duplicates, 0 to
+            only group exact duplicates
+
+    Returns:
+        Mapping of representatives to their alternates, for clusters with
+        more than one file
+    """
+    by_digest = {}
+    buckets = {}
+    signatures = {}
+    duplicates = {}
+    for filepath in sorted(fingerprints, key=preference):
+        fingerprint = fingerprints[filepath]
+        representative = by_digest.get(fingerprint.digest)
+        bands = []
+        if fingerprint.signature is not None and threshold > 0:
+            extension = os.path.splitext(filepath)[1].lower()
+            bands = [(extension, band, fingerprint.signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])
+                     for band in range(LSH_BANDS)]
+            if representative is None:
+                candidates = {candidate for band in bands for candidate in buckets.get(band, ())}
+                # the most similar candidate, the preferred one among equally similar ones
+                scored = [(similarity(fingerprint.signature, signatures[candidate]), candidate)
+                          for candidate in sorted(candidates, key=preference)]
+                best = max(scored, key=lambda item: item[0], default=None)
+                if best is not None and best[0] >= threshold:
+                    representative = best[1]
+
+        if representative is not None:
+            duplicates.setdefault(representative, []).append(filepath)
+            continue
+        by_digest[fingerprint.digest] = filepath
+        if bands:
+            signatures[filepath] = fingerprint.signature
+            for band in bands:
+                buckets.setdefault(band, []).append(filepath)
+    return duplicates
+
+
+class DedupResult:
+    """Outcome of deduplicate().
+
+    Attributes:
+        files (list[str]): Files to embed, in their original order
+        duplicates (dict[str, list[str]]): Alternates of the representatives
+            among files, which are not embedded
+        generated (dict[str, str]): Generated files that are not embedded,
+            with the reason
+        texts (dict[str, str]): Content of files to embed that was kept from
+            fingerprinting, so they need not be read again
+    """
+
+    def __init__(self, files: list[str], duplicates: dict[str, list[str]], generated: dict[str, str],
+                 texts: Optional[dict[str, str]] = None):
+        self.files = files
+        self.duplicates = duplicates
+        self.generated = generated
+        self.texts = texts if texts is not None else {}
+
+
+def deduplicate(
+    files: list[str],
+    read: Callable[[str], str],
+    threshold: float = DEDUP_SIMILARITY,
+    skip_generated: bool = DEDUP_GENERATED,
+    workers: int = INGEST_READ_WORKERS,
+    keep_chars: int = DEDUP_TEXT_CHARS,
+) -> DedupResult:
+    """Drop generated files and all but one file of every group of duplicates before they are embedded.
+
+    Files are read and fingerprinted on a thread pool. Files that cannot
+    be read, e.g. binary files, are kept, so that ingestion reports them.
+    The text of the files read is kept for chunking, up to keep_chars
+    characters over all files; larger repositories have the rest read again.
+
+    Args:
+        files: Paths of the files to ingest
+        read: Function returning the text of a file
+        threshold: Minimum estimated similarity of near-duplicates, 0 to
+            only drop exact duplicates
+        skip_generated: Whether to drop generated files
+        workers: Number of threads reading files
+        keep_chars: Maximum number of characters of text to keep
+
+    Returns:
+        The files to embed with the text kept of them, the dropped alternates
+        and the dropped generated files
+    """
+    kept = ByteBudget(keep_chars)
+    texts = {}
+
+    def fingerprint(filepath: str) -> Optional[Fingerprint]:
+        try:
+            text = read(filepath)
+        except (SkippedFile, OSError, ValueError):
+            return None
+        if kept.consume(len(text)):
+            texts[filepath] = text
+        return Fingerprint.of(filepath, text, near=threshold > 0, generated=skip_generated)
+
+    with ThreadPoolExecutor(max_workers=workers) as readers:
+        fingerprints = dict(zip(files, readers.map(fingerprint, files)))
+
+    generated = {filepath: fingerprint.generated for filepath, fingerprint in fingerprints.items()
+                 if fingerprint is not None and fingerprint.generated}
+    duplicates = cluster({filepath: fingerprint for filepath, fingerprint in fingerprints.items()
+                          if fingerprint is not None and filepath not in generated}, threshold)
+    dropped = set(generated) | {alternate for alternates in duplicates.values() for alternate in alternates}
+    return DedupResult([filepath for filepath in files if filepath not in dropped], duplicates, generated,
+                       {filepath: text for filepath, text in texts.items() if filepath not in dropped})
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import Optional
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "github-rag-assistant"),
+)
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+
+def key_hasher(chunk_size: int, overlap: int, embedding_model: str, strategy: str = "text") -> "hashlib._Hash":
+    """Create a hash object for computing a cache key incrementally.
+
+    Feed it the UTF-8 encoded content with update() and take hexdigest()
+    to get the same value as cache_key().
+
+    Args:
+        chunk_size: Chunk size in tokens
+        overlap: Chunk overlap in tokens
+        embedding_model: Identifier of the embedding model
+        strategy: Chunking strategy of the document, see chunking.chunking_strategy()
+
+    Returns:
+        A sha256 hash object seeded with the chunking parameters
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{embedding_model}\0{strategy}\0{chunk_size}\0{overlap}\0".encode())
+    return digest
+
+
+def cache_key(content: str, chunk_size: int, overlap: int, embedding_model: str, strategy: str = "text") -> str:
+    """Compute the cache key of a document's chunks and embeddings.
+
+    The key covers the content bytes and every parameter that changes the
+    chunks or their embeddings, so identical files share an entry no matter
+    which repository or path they come from.
+
+    Args:
+        content: Document content
+        chunk_size: Chunk size in tokens
+        overlap: Chunk overlap in tokens
+        embedding_model: Identifier of the embedding model
+        strategy: Chunking strategy of the document, see chunking.chunking_strategy()
+
+    Returns:
+        Hex digest identifying the cache entry
+    """
+    digest = key_hasher(chunk_size, overlap, embedding_model, strategy)
+    digest.update(content.encode("utf-8", errors="surrogatepass"))
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk cache of document chunks and their embeddings with size-based LRU eviction.
+
+    Entries live in a single SQLite database. Each entry stores the chunk
+    texts, token counts and line ranges as compressed JSON and the embeddings as a packed
+    float32 array. When the total size exceeds max_bytes, the least recently
+    used entries are evicted.
+    """
+
+    def __init__(self, directory: str = EMBEDDING_CACHE_DIR, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES):
+        """Open (or create) the cache database.
+
+        Args:
+            directory: Directory holding the cache database
+            max_bytes: Maximum total size of the cached entries
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "embeddings.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL, "
+            "chunks BLOB NOT NULL, embeddings BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key: str) -> Optional[list[dict]]:
+        """Look up the chunks of a document.
+
+        Args:
+            key: Cache key from cache_key()
+
+        Returns:
+            List of chunk dicts with 'content', 'token_count', 'start_line',
+            'end_line' and 'embedding' keys, or None if the entry is not cached
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT chunks, embeddings FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+
+        chunks = json.loads(zlib.decompress(row[0]))
+        embeddings = array("f")
+        embeddings.frombytes(row[1])
+        dimension = len(embeddings) // len(chunks) if chunks else 0
+        for i, chunk in enumerate(chunks):
+            chunk["embedding"] = embeddings[i * dimension:(i + 1) * dimension].tolist()
+        return chunks
+
+    def put(self, key: str, chunks: list[dict]) -> None:
+        """Store the chunks of a document, evicting old entries if needed.
+
+        Args:
+            key: Cache key from cache_key()
+            chunks: List of chunk dicts with 'content', 'token_count', 'start_line',
+                    'end_line' and 'embedding' keys
+        """
+        payload = zlib.compress(json.dumps(
+            [{k: v for k, v in c.items() if k != "embedding"} for c in chunks]
+        ).encode())
+        embeddings = array("f")
+        for chunk in chunks:
+            embeddings.extend(chunk["embedding"])
+        blob = embeddings.tobytes()
+        size = len(payload) + len(blob)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, size, last_access, chunks, embeddings) VALUES (?, ?, ?, ?, ?)",
+                (key, size, time.time(), payload, blob),
+            )
+            self.total_bytes += size - (previous[0] if previous else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the cache fits in max_bytes. Caller holds the lock."""
+        while self.total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                return
+            for key, size in rows:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Return the process-wide embedding cache shared by all sessions.
+
+    Returns:
+        The shared EmbeddingCache, or None if caching is disabled or the
+        cache directory cannot be used
+    """
+    global _cache, EMBEDDING_CACHE_ENABLED
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = EmbeddingCache()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Warning: Could not open embedding cache in {EMBEDDING_CACHE_DIR}, caching disabled: {e}")
+                EMBEDDING_CACHE_ENABLED = False
+        return _cache
@@ -1,11 +1,40 @@
 import subprocess
 import os
+import sys
+import bisect
+from collections import OrderedDict
 import shutil
-import fnmatch
-from typing import Optional
+import hashlib
+import tempfile
+import threading
+from typing import Callable, Iterator, Optional
+
+from ignore import HONOR_GITIGNORE, IGNORE_PATTERNS, IgnoreMatcher, is_ignored, load_gitignore
+from metrics import REPOSITORY_FILES, span
+from registry import normalize_repo_url
+
+GIT_CLONE_DEPTH = int(os.getenv("GIT_CLONE_DEPTH", "1"))
+GIT_CLONE_FILTER = os.getenv("GIT_CLONE_FILTER", "")
+GIT_SPARSE_CHECKOUT = os.getenv("GIT_SPARSE_CHECKOUT", "false").lower() == "true"
+GIT_MIRROR_CACHE_DIR = os.getenv("GIT_MIRROR_CACHE_DIR", "")
+CLONE_DIR_PREFIX = "github-rag-"
+DIAGRAM_MAX_DEPTH = int(os.getenv("DIAGRAM_MAX_DEPTH", "3"))
+DIAGRAM_MAX_CHILDREN = int(os.getenv("DIAGRAM_MAX_CHILDREN", "50"))
+DIAGRAM_MAX_LINES = int(os.getenv("DIAGRAM_MAX_LINES", "300"))
+
+_mirror_locks = {}
+_mirror_locks_guard = threading.Lock()
+
 
 class Node:
-    """Node class for representing structure of Github repositories."""
+    """Node class for representing structure of Github repositories.
+    
+    Nodes use __slots__ and interned names to stay small on large monorepos.
+    Only the root stores its full path; the path of any other node is derived
+    from its ancestors on demand.
+    """
+    
+    __slots__ = ('name', 'is_dir', 'parent', 'children', '_path')
     
     def __init__(self, filepath: str, is_dir: bool = False, parent: Optional['Node'] = None):
         """Initialize a new Node.
@@ -15,11 +44,45 @@ class Node:
             is_dir: Whether this node represents a directory
             parent: Parent node in the tree
         """
-        self.name = os.path.basename(filepath)
-        self.filepath = filepath
+        self.name = sys.intern(os.path.basename(filepath))
         self.is_dir = is_dir
         self.parent = parent
         self.children = [] if is_dir else None
+        self._path = filepath if parent is None else None
+    
+    @classmethod
+    def child(cls, name: str, is_dir: bool, parent: 'Node') -> 'Node':
+        """Create a node from its name alone, without building its full path.
+        
+        The caller is responsible for appending it to parent.children.
+        
+        Args:
+            name: Name of the file or directory
+            is_dir: Whether this node represents a directory
+            parent: Parent node in the tree
+            
+        Returns:
+            The new node
+        """
+        node = cls.__new__(cls)
+        node.name = sys.intern(name)
+        node.is_dir = is_dir
+        node.parent = parent
+        node.children = [] if is_dir else None
+        node._path = None
+        return node
+    
+    @property
+    def filepath(self) -> str:
+        """Path to the file or directory, derived from the root's path."""
+        parts = []
+        node = self
+        while node._path is None and node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        if not parts:
+            return node._path if node._path is not None else node.name
+        return os.path.join(node._path or node.name, *reversed(parts))
 
     def add_child(self, child_node: 'Node'):
         """Add a child node and maintain sorted order.
@@ -28,13 +91,24 @@ class Node:
             child_node: Child node to add
         """
         if self.children is not None:
-            self.children.append(child_node)
             child_node.parent = self
-            self.children.sort(key=lambda x: x.name.lower())
+            child_node._path = None
+            bisect.insort(self.children, child_node, key=_sort_key)
+
+
+def _sort_key(node: Node) -> str:
+    """Sort key of nodes within a directory."""
+    return node.name.lower()
+
 
 def build_tree(root_path: str) -> Optional[Node]:
     """Build a tree of file nodes from a root directory path.
     
+    Ignored directories are pruned before they are descended into. Paths are
+    matched against the built-in ignore rules and, if HONOR_GITIGNORE is set,
+    against the repository's own .gitignore files. The children of each
+    directory are sorted once, when the directory is scanned.
+    
     Args:
         root_path: Path to the root directory
         
@@ -46,111 +120,78 @@ def build_tree(root_path: str) -> Optional[Node]:
     if os.path.isfile(root_path):
         return Node(root_path, is_dir=False)
     
+    def list_directory(prefix: str) -> Optional[list[tuple[str, bool]]]:
+        directory = os.path.join(root_path, prefix)
+        try:
+            with os.scandir(directory) as it:
+                return [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in it]
+        except OSError as e:
+            print(f"Error scanning {directory}: {e}")
+            return None
+
     root_node = Node(root_path, is_dir=True)
-    node_map = {root_path: root_node}
+    populate_tree(root_node, list_directory,
+                  lambda prefix: load_gitignore(os.path.join(root_path, prefix), prefix.rstrip('/')))
+    return root_node
 
-    for root, dirs, files in os.walk(root_path):
-        parent_node = node_map.get(root)
-        if parent_node is None:
-            continue
 
-        # filter out ignored files
-        dirs[:] = [d for d in dirs if not isIgnored(d)]
-        files[:] = [f for f in files if not isIgnored(f)]
+def populate_tree(
+    root_node: Node,
+    list_directory: Callable[[str], Optional[list[tuple[str, bool]]]],
+    read_gitignore: Callable[[str], Optional[IgnoreMatcher]],
+) -> None:
+    """Add the files and directories below a root node, walking them from a listing function.
+    
+    Ignored directories are pruned before they are listed. Paths are matched
+    against the built-in ignore rules and, if HONOR_GITIGNORE is set,
+    against the repository's own .gitignore files. The children of each
+    directory are sorted once, when the directory is listed.
+    
+    Args:
+        root_node: Root directory node, without children yet
+        list_directory: Returns the (name, is_dir) entries of a directory
+            given its path relative to the root, '' or ending in '/', or None
+            if it cannot be listed
+        read_gitignore: Returns the matcher of the .gitignore file of a
+            directory given its relative path, or None
+    """
+    stack = [(root_node, '', ())]
 
-        # add nodes
-        for d in dirs:
-            dir_path = os.path.join(root, d)
-            dir_node = Node(dir_path, is_dir=True)
-            parent_node.add_child(dir_node)
-            node_map[dir_path] = dir_node
+    while stack:
+        parent_node, prefix, gitignores = stack.pop()
+        entries = list_directory(prefix)
+        if entries is None:
+            continue
 
-        for f in files:
-            file_path = os.path.join(root, f)
-            file_node = Node(file_path)
-            parent_node.add_child(file_node)
+        if HONOR_GITIGNORE and ('.gitignore', False) in entries:
+            matcher = read_gitignore(prefix)
+            if matcher is not None:
+                gitignores = gitignores + (matcher,)
 
-    return root_node
+        # filter out ignored files, pruning ignored directories before descending
+        entries = [(name, is_dir) for name, is_dir in entries if not is_ignored(prefix + name, is_dir, gitignores)]
+        entries.sort(key=lambda entry: entry[0].lower())
 
+        # add nodes
+        children = parent_node.children
+        for name, is_dir in entries:
+            node = Node.child(name, is_dir, parent_node)
+            children.append(node)
+            if is_dir:
+                stack.append((node, f"{prefix}{name}/", gitignores))
 
-def isIgnored(filepath: str) -> bool:
+
+def isIgnored(filepath: str, is_dir: bool = False) -> bool:
     """Check if a file should be ignored for ingestion.
     
     Args:
-        filepath: Path to the file to check
+        filepath: Path to the file to check, relative to the repository root
+        is_dir: Whether the path is a directory
         
     Returns:
         True if file should be ignored, False otherwise
     """
-    filename = os.path.basename(filepath)
-    patterns = [
-        # Python - compiled and cache files
-        '*.pyc','*.pyo','*.pyd','__pycache__','.pytest_cache','.coverage','.tox','.nox','.mypy_cache','.ruff_cache','.hypothesis','poetry.lock','Pipfile.lock','init.py','__init__.py','.python-version','uv.lock','pyproject.toml',
-        # JavaScript/Node - dependencies and build artifacts
-        'node_modules','bower_components','package-lock.json','yarn.lock','.npm','.yarn','.pnpm-store','bun.lock','bun.lockb','.eslintcache','.parcel-cache',
-        # Java - compiled files
-        '*.class','*.jar','*.war','*.ear','*.nar','.gradle/','build/','.settings/','.classpath','gradle-app.setting','*.gradle',
-        # C/C++ - compiled artifacts
-        '*.o','*.obj','*.dll','*.dylib','*.exe','*.lib','*.out','*.a','*.pdb','*.so','*.dylib',
-        # Swift/Xcode
-        '.build/','*.xcodeproj/','*.xcworkspace/','*.pbxuser','*.mode1v3','*.mode2v3','*.perspectivev3','*.xcuserstate','xcuserdata/','.swiftpm/',
-        # Ruby
-        '*.gem','.bundle/','vendor/bundle','Gemfile.lock','.ruby-version','.ruby-gemset','.rvmrc',
-        # Rust
-        'Cargo.lock','**/*.rs.bk',
-        # Go
-        'pkg/','go.sum',
-        # .NET/C#
-        'obj/','*.suo','*.user','*.userosscache','*.sln.docstates','packages/','*.nupkg','*.exe.config',
-        # PHP
-        'vendor/','composer.lock',
-        # Build directories and artifacts
-        'build/','dist/','target/','out/','bin/','*.egg-info','*.egg','*.whl',
-        # Version control
-        '.git','.svn','.hg','.gitignore','.gitattributes','.gitmodules',
-        # Virtual environments
-        'venv/','.venv/','env/','virtualenv/','venv','bin','lib',
-        # IDEs and editors
-        '.project','.vscode/','.idea/','.vs/','.settings/','*.swp','*.swo','*~',
-        # OS-specific files
-        '.DS_Store','Thumbs.db','desktop.ini','ehthumbs.db',
-        # Temporary and cache files
-        '*.log','*.bak','*.tmp','*.temp','.cache/','.sass-cache/','*.orig',
-        # Documentation build directories
-        'site-packages/','.docusaurus/','.next/','.nuxt/','_site/','public/',
-        # Archives and compressed files
-        '*.zip','*.tar','*.gz','*.tar.gz','*.tar.xz','*.tar.bz2','*.rar','*.7z','*.xz','*.bz2',
-        # Images (binary files not useful for RAG)
-        '*.jpg','*.jpeg','*.png','*.gif','*.bmp','*.tiff','*.webp','*.svg','*.ico','*.cur','*.ani','img',
-        # Audio/Video files
-        '*.mp3','*.wav','*.flac','*.aac','*.ogg','*.wma','*.mp4','*.avi','*.mov','*.wmv','*.flv','*.webm',
-        # Font files
-        '*.ttf','*.otf','*.woff','*.woff2','*.eot',
-        # Database files
-        '*.db','*.sqlite','*.sqlite3','*.mdb','*.accdb',
-        # Minified files
-        '*.min.js','*.min.css',
-        # Source maps
-        '*.map',
-        # Terraform
-        '.terraform/','*.tfstate*',
-        # Docker
-        '.dockerignore',
-        # Package manager lock files
-        'yarn.lock','pnpm-lock.yaml','composer.lock','Gemfile.lock','Pipfile.lock',
-        # Other common patterns
-        'LICENSE','LICENSE.txt','CHANGELOG','CHANGELOG.md','.helmignore','*.pdf','*.csv','.ansible-lint','.env','.pkl',
-        # Binary executables
-        '*.exe','*.msi','*.dmg','*.pkg','*.deb','*.rpm',
-        # Certificate files
-        '*.pem','*.crt','*.key','*.p12','*.pfx'
-    ]
-
-    for pattern in patterns:
-        if fnmatch.fnmatch(filename, pattern):
-            return True
-
-    return False
+    return is_ignored(filepath.replace(os.sep, '/'), is_dir)
 
 def get_file_list(root_node: Node) -> list[str]:
     """Create a list of file paths from a tree structure.
@@ -162,73 +203,455 @@ def get_file_list(root_node: Node) -> list[str]:
         List of file paths
     """
     files = []
-    stack = [root_node]
+    stack = [(root_node, root_node.filepath)]
     while stack:
-        node = stack.pop()
+        node, path = stack.pop()
         if not node.is_dir:
-            files.append(node.filepath)
+            files.append(path)
         elif node.children:
             for child in node.children:
-                stack.append(child)
+                stack.append((child, os.path.join(path, child.name)))
     return files
 
-def generate_diagram(root_node: Node) -> str:
-    """Generate a markdown visualization of a file tree.
+def count_files(root_node: Node) -> dict[Node, int]:
+    """Count the files below every directory of a tree.
+    
+    Args:
+        root_node: Root node of the tree
+        
+    Returns:
+        Mapping of directory nodes to the number of files in their subtree
+    """
+    counts = {}
+    stack = [(root_node, False)]
+    while stack:
+        node, visited = stack.pop()
+        if not node.is_dir:
+            continue
+        if visited:
+            counts[node] = sum(counts[c] if c.is_dir else 1 for c in node.children)
+        else:
+            stack.append((node, True))
+            stack.extend((c, False) for c in node.children if c.is_dir)
+    return counts
+
+
+def iter_diagram_lines(
+    root_node: Node,
+    max_depth: int = DIAGRAM_MAX_DEPTH,
+    max_children: int = DIAGRAM_MAX_CHILDREN,
+    max_lines: int = DIAGRAM_MAX_LINES,
+    expanded: frozenset[str] = frozenset(),
+    file_counts: Optional[dict[Node, int]] = None,
+    collapsed: Optional[list[str]] = None,
+) -> Iterator[str]:
+    """Iteratively yield the lines of a bounded markdown visualization of a file tree.
+    
+    Directories deeper than max_depth are collapsed into a single summary
+    line such as '**vendor** … 1,240 files'. A directory listed in expanded
+    shows its direct children regardless of depth. At most max_children
+    entries are shown per directory and max_lines lines overall.
+    
+    Args:
+        root_node: Root node of the tree to visualize
+        max_depth: Number of directory levels shown below the root
+        max_children: Maximum entries shown per directory
+        max_lines: Maximum number of lines yielded
+        expanded: Paths, relative to the root, of directories to expand
+        file_counts: Result of count_files(), computed if not given
+        collapsed: Optional list receiving the relative paths of collapsed directories
+        
+    Yields:
+        Markdown lines of the diagram
+    """
+    if file_counts is None:
+        file_counts = count_files(root_node)
+    open_paths = set(expanded)
+    for path in expanded:
+        parts = path.split('/')
+        open_paths.update('/'.join(parts[:i]) for i in range(1, len(parts)))
+
+    emitted = 0
+    # (node, prefix, relative path, remaining depth)
+    stack = [(root_node, "", "", max_depth)]
+    while stack:
+        if emitted >= max_lines:
+            yield "… (diagram truncated)"
+            return
+        node, prefix, relpath, depth = stack.pop()
+        emitted += 1
+
+        if node is None:
+            # summary of entries hidden by max_children
+            yield f"{prefix}… {relpath} more"
+            continue
+        if not node.is_dir:
+            yield f"{prefix}{node.name}"
+            continue
+
+        is_open = relpath in open_paths or not relpath
+        if relpath in expanded:
+            depth = max(depth, 1)
+        if node.children and depth <= 0 and not is_open:
+            if collapsed is not None:
+                collapsed.append(relpath)
+            count = file_counts[node]
+            yield f"{prefix}**{node.name}** … {count:,} file{'' if count == 1 else 's'}"
+            continue
+        yield f"{prefix}**{node.name}**"
+
+        children = node.children or []
+        shown = children[:max_children]
+        entries = []
+        for i, child in enumerate(shown):
+            is_last_child = i == len(shown) - 1 and len(children) <= max_children
+            connector = "└── " if is_last_child else "├── "
+            child_path = f"{relpath}/{child.name}" if relpath else child.name
+            entries.append((child, prefix + connector, child_path, depth - 1))
+        if len(children) > max_children:
+            entries.append((None, prefix + "└── ", f"{len(children) - max_children:,}", 0))
+        stack.extend(reversed(entries))
+
+
+def generate_diagram(
+    root_node: Node,
+    max_depth: int = DIAGRAM_MAX_DEPTH,
+    max_children: int = DIAGRAM_MAX_CHILDREN,
+    max_lines: int = DIAGRAM_MAX_LINES,
+) -> str:
+    """Generate a bounded markdown visualization of a file tree.
     
     Args:
         root_node: Root node of the tree to visualize
+        max_depth: Number of directory levels shown below the root
+        max_children: Maximum entries shown per directory
+        max_lines: Maximum number of lines in the diagram
         
     Returns:
         Markdown-formatted string representation of the tree
     """
-    lines = []
+    return "  \n".join(iter_diagram_lines(root_node, max_depth, max_children, max_lines))
+
 
-    def traverse_and_format(node: Node, level: int = 0, prefix: str = ""):
+def combine_trees(trees: dict[str, Node], name: str = "repositories") -> Node:
+    """Combine the trees of several repositories under a common root.
+    
+    Every repository becomes a directory of the root named after it. The
+    repository trees are shared, not copied, and are not modified.
+    
+    Args:
+        trees: Mapping of repository names to the root nodes of their trees
+        name: Name of the common root
+        
+    Returns:
+        Root node of the combined tree
+    """
+    root = Node(name, is_dir=True)
+    for repo_name, tree in sorted(trees.items(), key=lambda item: item[0].lower()):
+        child = Node.child(repo_name, True, root)
+        child.children = tree.children
+        root.children.append(child)
+    return root
 
-        filename = node.name
-        if node.is_dir:
-            filename = f"**{filename}**" 
 
-        line = f"{prefix}{filename}"
-        lines.append(line)
+def tree_to_json(root_node: Node) -> list:
+    """Convert a tree into nested lists for JSON: a directory is [name, children], a file its name.
 
-        if node.is_dir and node.children:
+    Args:
+        root_node: Root node of the tree
 
-            # add each child
-            for i, child in enumerate(node.children):
-                
-                is_last_child = (i == len(node.children) - 1)
-                connector = "└── " if is_last_child else "├── "
-                traverse_and_format(child, level + 1, prefix + connector)
+    Returns:
+        The root directory as [name, children]
+    """
+    tree = [root_node.name, []]
+    stack = [(root_node, tree[1])]
+    while stack:
+        node, entries = stack.pop()
+        for child in node.children:
+            if child.is_dir:
+                entry = [child.name, []]
+                stack.append((child, entry[1]))
+            else:
+                entry = child.name
+            entries.append(entry)
+    return tree
 
-    traverse_and_format(root_node)
 
-    return "  \n".join(lines)
+def tree_from_json(tree: list) -> Node:
+    """Rebuild a tree converted by tree_to_json().
 
+    Args:
+        tree: The root directory as [name, children]
 
-def clone_repository(link: str) -> str:
-    """Clone a git repository and return its local path.
+    Returns:
+        Root node of the tree, whose path is its name
+    """
+    root_node = Node(tree[0], is_dir=True)
+    stack = [(root_node, tree[1])]
+    while stack:
+        parent_node, entries = stack.pop()
+        for entry in entries:
+            if isinstance(entry, str):
+                parent_node.children.append(Node.child(entry, False, parent_node))
+            else:
+                node = Node.child(entry[0], True, parent_node)
+                parent_node.children.append(node)
+                stack.append((node, entry[1]))
+    return root_node
+
+
+class RepositoryDiagram:
+    """Cached, expandable diagram of an ingested repository.
+    
+    Keeps the compact tree so collapsed directories can be expanded on
+    demand, and caches the rendered markdown for each set of expanded
+    directories so reruns of the app do not re-render the tree.
+    """
+    
+    def __init__(self, root_node: Node, cache_size: int = 32):
+        """Initialize the diagram of a tree.
+        
+        Args:
+            root_node: Root node of the repository tree
+            cache_size: Maximum number of rendered variants kept
+        """
+        self.root_node = root_node
+        self.file_counts = count_files(root_node)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def render(self, expanded: frozenset[str] = frozenset()) -> tuple[str, list[str]]:
+        """Render the diagram with some directories expanded.
+        
+        Args:
+            expanded: Paths, relative to the root, of directories to expand
+            
+        Returns:
+            Tuple of (markdown, collapsed) where collapsed lists the relative
+            paths of the directories that can still be expanded
+        """
+        expanded = frozenset(expanded)
+        with self._lock:
+            if expanded in self._cache:
+                self._cache.move_to_end(expanded)
+                return self._cache[expanded]
+        
+        collapsed = []
+        lines = iter_diagram_lines(
+            self.root_node, expanded=expanded, file_counts=self.file_counts, collapsed=collapsed
+        )
+        result = ("  \n".join(lines), collapsed)
+        with self._lock:
+            self._cache[expanded] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+    
+    def __str__(self) -> str:
+        return self.render()[0]
+
+
+def resolve_head_commit(link: str) -> str:
+    """Resolve the commit SHA of a remote repository's HEAD without cloning it.
+    
+    Args:
+        link: Git repository URL
+        
+    Returns:
+        Commit SHA of the remote HEAD
+        
+    Raises:
+        ValueError: If the remote cannot be queried
+    """
+    try:
+        result = subprocess.run(
+            ['git', 'ls-remote', link, 'HEAD'],
+            check=True, capture_output=True, text=True
+        )
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"Failed to query repository {link}: {e.stderr.strip()}") from e
+    
+    line = result.stdout.strip()
+    if not line:
+        raise ValueError(f"Repository {link} has no HEAD")
+    return line.split()[0]
+
+
+def _mirror_path(link: str) -> str:
+    """Return the path of the bare mirror of a repository in the mirror cache.
+    
+    Args:
+        link: Git repository URL
+        
+    Returns:
+        Path to the mirror directory
+    """
+    digest = hashlib.sha1(normalize_repo_url(link).encode()).hexdigest()
+    return os.path.join(GIT_MIRROR_CACHE_DIR, f"{digest}.git")
+
+
+def update_mirror(link: str) -> str:
+    """Create or incrementally update the bare mirror of a repository.
+    
+    Args:
+        link: Git repository URL
+        
+    Returns:
+        Path to the up-to-date mirror
+        
+    Raises:
+        subprocess.CalledProcessError: If cloning or fetching fails
+    """
+    mirror = _mirror_path(link)
+    with _mirror_locks_guard:
+        lock = _mirror_locks.setdefault(mirror, threading.Lock())
+    with lock:
+        if os.path.isdir(mirror):
+            subprocess.run(['git', '-C', mirror, 'fetch', '--prune', '--quiet', 'origin'], check=True)
+        else:
+            os.makedirs(GIT_MIRROR_CACHE_DIR, exist_ok=True)
+            tmp = tempfile.mkdtemp(prefix="mirror-", dir=GIT_MIRROR_CACHE_DIR)
+            try:
+                subprocess.run(['git', 'clone', '--mirror', '--quiet', link, tmp], check=True)
+                os.replace(tmp, mirror)
+            except Exception:
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise
+    return mirror
+
+
+def sparse_checkout_patterns() -> list[str]:
+    """Build non-cone sparse-checkout patterns that exclude ignored paths.
+    
+    Returns:
+        List of patterns including everything except the ignore rules
+    """
+    return ['/*'] + [f'!{pattern}' for pattern in IGNORE_PATTERNS]
+
+
+def clone_repository(link: str, commit_sha: Optional[str] = None) -> str:
+    """Clone a git repository into a unique temporary directory and return its local path.
+    
+    Only the working tree is read after cloning, so by default the clone is
+    shallow (GIT_CLONE_DEPTH). A partial clone filter (GIT_CLONE_FILTER, e.g.
+    'blob:limit=1m') and a sparse checkout that skips ignored paths
+    (GIT_SPARSE_CHECKOUT) reduce transfer and disk I/O further. When
+    GIT_MIRROR_CACHE_DIR is set, the repository is fetched incrementally into
+    a local bare mirror and the working tree is cloned from it instead.
     
     Args:
         link: Git repository URL to clone
+        commit_sha: Optional commit to check out instead of the default branch
         
     Returns:
         Path to the cloned repository directory
     """
-    repo_name = link.split('/')[-1]
+    repo_name = link.rstrip('/').split('/')[-1]
     repo_name = repo_name.replace('.git', '')
+    filepath = os.path.join(tempfile.mkdtemp(prefix=CLONE_DIR_PREFIX), repo_name)
     try:
-        subprocess.run(['git', 'clone', link], check=True)
-        filepath = os.path.join(os.getcwd(), repo_name)
+        if GIT_MIRROR_CACHE_DIR:
+            source = update_mirror(link)
+            command = ['git', 'clone', '--shared', '--no-checkout', '--quiet', source, filepath]
+        else:
+            source = link
+            command = ['git', 'clone', '--no-checkout', '--quiet']
+            if GIT_CLONE_DEPTH > 0:
+                command += ['--depth', str(GIT_CLONE_DEPTH)]
+            if GIT_CLONE_FILTER:
+                command += [f'--filter={GIT_CLONE_FILTER}']
+            command += [link, filepath]
+        subprocess.run(command, check=True)
+        
+        if GIT_SPARSE_CHECKOUT:
+            subprocess.run(['git', '-C', filepath, 'sparse-checkout', 'set', '--no-cone', '--stdin'],
+                           input='\n'.join(sparse_checkout_patterns()), text=True, check=True)
+        
+        revision = commit_sha or 'HEAD'
+        if commit_sha:
+            has_commit = subprocess.run(
+                ['git', '-C', filepath, 'cat-file', '-e', f'{commit_sha}^{{commit}}'],
+                capture_output=True
+            ).returncode == 0
+            if not has_commit:
+                fetch = ['git', '-C', filepath, 'fetch', '--quiet']
+                if GIT_CLONE_DEPTH > 0 and not GIT_MIRROR_CACHE_DIR:
+                    fetch += ['--depth', str(GIT_CLONE_DEPTH)]
+                subprocess.run(fetch + ['origin', commit_sha], check=True)
+        subprocess.run(['git', '-C', filepath, 'checkout', '--quiet', '--detach', revision], check=True)
+        
         print(f'Successfully cloned repository to: {filepath}')
         return filepath
     except subprocess.CalledProcessError as e:
         print(f"Failed to clone repository: {e}")
+        delete_repository(filepath)
         return ""
 
 
+def diff_commits(repo_path: str, old_sha: str, new_sha: str) -> dict[str, list]:
+    """List the files that changed between two commits of a cloned repository.
+    
+    The old commit is fetched from the remote first if the clone does not
+    contain it (e.g. a shallow clone).
+    
+    Args:
+        repo_path: Path to the cloned repository
+        old_sha: Commit the existing index was built from
+        new_sha: Commit being ingested
+        
+    Returns:
+        Dict with 'added', 'modified' and 'deleted' lists of paths, and a
+        'renamed' list of (old_path, new_path, similarity) tuples, where all
+        paths are relative to the repository root
+        
+    Raises:
+        ValueError: If the old commit cannot be found or the diff fails
+    """
+    has_commit = subprocess.run(
+        ['git', '-C', repo_path, 'cat-file', '-e', f'{old_sha}^{{commit}}'],
+        capture_output=True
+    ).returncode == 0
+    try:
+        if not has_commit:
+            subprocess.run(
+                ['git', '-C', repo_path, 'fetch', '--depth', '1', 'origin', old_sha],
+                check=True, capture_output=True
+            )
+        result = subprocess.run(
+            ['git', '-C', repo_path, 'diff', '--name-status', '-M', '-z', old_sha, new_sha],
+            check=True, capture_output=True, text=True
+        )
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"Failed to diff {old_sha}..{new_sha}: {e.stderr}") from e
+    
+    changes = {"added": [], "modified": [], "deleted": [], "renamed": []}
+    fields = result.stdout.split('\0')
+    i = 0
+    while i < len(fields) and fields[i]:
+        status = fields[i]
+        if status[0] in 'RC':
+            old_path, new_path = fields[i + 1], fields[i + 2]
+            if status[0] == 'R':
+                changes["renamed"].append((old_path, new_path, int(status[1:] or 0)))
+            else:
+                changes["added"].append(new_path)
+            i += 3
+            continue
+        path = fields[i + 1]
+        if status[0] == 'A':
+            changes["added"].append(path)
+        elif status[0] == 'D':
+            changes["deleted"].append(path)
+        else:
+            changes["modified"].append(path)
+        i += 2
+    
+    return changes
+
+
 def delete_repository(filepath: str) -> None:
-    """Delete a repository directory.
+    """Delete a repository directory, and the temporary directory created for it by clone_repository.
     
     Args:
         filepath: Path to the repository directory to delete
@@ -236,33 +659,44 @@ def delete_repository(filepath: str) -> None:
     if not os.path.exists(filepath):
         print("Repository does not exist")
     try:
+        parent = os.path.dirname(filepath)
+        if os.path.basename(parent).startswith(CLONE_DIR_PREFIX):
+            filepath = parent
         shutil.rmtree(filepath)
         print("Repository deleted")
     except Exception as e:
         print(f"Error deleting repository: {e}")
     
-def clone_and_build_tree(link: str) -> tuple[str, list[str], str]:
+def clone_and_build_tree(link: str, commit_sha: Optional[str] = None) -> tuple[str, list[str], RepositoryDiagram]:
     """Clone a repository and build its file tree structure.
     
     Args:
         link: Git repository URL to clone
+        commit_sha: Optional commit to check out instead of the default branch
         
     Returns:
         Tuple of (root_path, file_list, diagram) where:
         - root_path: Path to cloned repository
         - file_list: List of file paths in the repository
-        - diagram: Markdown visualization of the tree structure
+        - diagram: Expandable, cached visualization of the tree structure
         
     Raises:
         ValueError: If tree building fails
     """
     
-    root_path = clone_repository(link)
-    root_node = build_tree(root_path)
-    if root_node is None:
-        raise ValueError("Failed to build tree")
-    
-    file_list = get_file_list(root_node)
-    diagram = generate_diagram(root_node)
+    with span("clone_and_build_tree", repository=link):
+        with span("clone", repository=link):
+            root_path = clone_repository(link, commit_sha)
+        with span("build_tree"):
+            root_node = build_tree(root_path)
+        if root_node is None:
+            raise ValueError("Failed to build tree")
+        
+        with span("file_list") as current:
+            file_list = get_file_list(root_node)
+            current.set_attribute("files", len(file_list))
+        REPOSITORY_FILES.observe(len(file_list))
+        with span("diagram"):
+            diagram = RepositoryDiagram(root_node)
 
-    return root_path, file_list, diagram
\ No newline at end of file
+    return root_path, file_list, diagram
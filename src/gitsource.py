@@ -0,0 +1,328 @@
+import os
+import tempfile
+import subprocess
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, Optional, Union
+
+from github import (CLONE_DIR_PREFIX, GIT_CLONE_DEPTH, GIT_CLONE_FILTER, GIT_MIRROR_CACHE_DIR, Node,
+                    RepositoryDiagram, clone_and_build_tree, delete_repository, get_file_list, populate_tree,
+                    update_mirror)
+from ignore import IgnoreMatcher, parse_gitignore
+from ingest import file_size
+from loader import MAX_FILE_BYTES, ByteBudget, SkippedFile, iter_document, iter_text
+from metrics import REPOSITORY_FILES, span
+from registry import normalize_repo_url
+
+# read files straight from git objects instead of checking out a working tree
+GIT_OBJECT_SOURCE = os.getenv("GIT_OBJECT_SOURCE", "true").lower() == "true"
+
+# git modes of entries that are not regular files: symbolic links and submodules
+_SKIPPED_MODES = (b"120000", b"160000")
+
+# sources opened ahead of their ingestion by prefetch_repository(), keyed by (normalized URL, commit)
+_prefetched = {}
+_prefetched_lock = threading.Lock()
+_prefetch_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clone-prefetch")
+
+
+class WorkingTree:
+    """Files of a repository checked out on disk by clone_and_build_tree().
+
+    Attributes:
+        root_path (str): Path of the working tree
+        git_dir (str): Repository to run git commands such as diff_commits() in
+        file_list (list[str]): Paths of the files to ingest
+        diagram (RepositoryDiagram): Diagram of the repository
+    """
+
+    def __init__(self, link: str, commit_sha: Optional[str] = None):
+        """Clone a repository, check out a commit and scan its working tree.
+
+        Args:
+            link: Git repository URL
+            commit_sha: Commit to check out instead of the default branch
+        """
+        self.root_path, self.file_list, self.diagram = clone_and_build_tree(link, commit_sha)
+        self.git_dir = self.root_path
+
+    size_of = staticmethod(file_size)
+    iter_document = staticmethod(iter_document)
+
+    def close(self) -> None:
+        """Delete the working tree."""
+        delete_repository(self.root_path)
+
+
+class GitObjectSource:
+    """Files of a repository commit read straight from git objects, without a checkout.
+
+    The repository is cloned bare, or read from the local mirror when
+    GIT_MIRROR_CACHE_DIR is set, so the only disk writes are its packs.
+    Paths and blob sizes come from a single 'git ls-tree -r -l -z', which
+    also feeds the tree builder, and blob contents are streamed through one
+    long-lived 'git cat-file --batch' process shared by the ingestion
+    threads. File paths are virtual: the relative path of a file joined to
+    root_path, which does not exist on disk.
+
+    Attributes:
+        root_path (str): Virtual root of the file paths
+        git_dir (str): Bare repository the objects are read from
+        file_list (list[str]): Paths of the files to ingest
+        diagram (RepositoryDiagram): Diagram of the repository
+    """
+
+    def __init__(self, link: str, commit_sha: Optional[str] = None):
+        """Fetch a repository commit and list its files.
+
+        Args:
+            link: Git repository URL
+            commit_sha: Commit to read instead of the default branch
+
+        Raises:
+            ValueError: If the repository cannot be fetched or listed
+        """
+        self._lock = threading.Lock()
+        self._process = None
+        self._owned = not GIT_MIRROR_CACHE_DIR
+        repo_name = link.rstrip('/').split('/')[-1].replace('.git', '')
+        with span("clone_and_build_tree", repository=link, source="git"):
+            with span("clone", repository=link):
+                self.git_dir = self._fetch(link, commit_sha, repo_name)
+            try:
+                self.root_path = os.path.join(os.path.dirname(self.git_dir), repo_name)
+                with span("build_tree"):
+                    self._blobs = {}
+                    root_node = self._build_tree(commit_sha or 'HEAD')
+                with span("file_list") as current:
+                    self.file_list = get_file_list(root_node)
+                    current.set_attribute("files", len(self.file_list))
+                REPOSITORY_FILES.observe(len(self.file_list))
+                with span("diagram"):
+                    self.diagram = RepositoryDiagram(root_node)
+            except BaseException:
+                self.close()
+                raise
+
+    def _fetch(self, link: str, commit_sha: Optional[str], repo_name: str) -> str:
+        """Make the commit available in a bare repository and return its path."""
+        if GIT_MIRROR_CACHE_DIR:
+            try:
+                return update_mirror(link)
+            except subprocess.CalledProcessError as e:
+                raise ValueError(f"Failed to fetch repository {link}: {e}") from e
+
+        git_dir = os.path.join(tempfile.mkdtemp(prefix=CLONE_DIR_PREFIX), f"{repo_name}.git")
+        command = ['git', 'clone', '--bare', '--quiet']
+        if GIT_CLONE_DEPTH > 0:
+            command += ['--depth', str(GIT_CLONE_DEPTH)]
+        if GIT_CLONE_FILTER:
+            command += [f'--filter={GIT_CLONE_FILTER}']
+        try:
+            subprocess.run(command + [link, git_dir], check=True, capture_output=True, text=True)
+            if commit_sha and subprocess.run(
+                ['git', '-C', git_dir, 'cat-file', '-e', f'{commit_sha}^{{commit}}'], capture_output=True
+            ).returncode != 0:
+                fetch = ['git', '-C', git_dir, 'fetch', '--quiet']
+                if GIT_CLONE_DEPTH > 0:
+                    fetch += ['--depth', str(GIT_CLONE_DEPTH)]
+                subprocess.run(fetch + ['origin', commit_sha], check=True, capture_output=True, text=True)
+        except subprocess.CalledProcessError as e:
+            delete_repository(git_dir)
+            raise ValueError(f"Failed to clone repository {link}: {e.stderr.strip()}") from e
+        print(f'Successfully cloned bare repository to: {git_dir}')
+        return git_dir
+
+    def _build_tree(self, revision: str) -> Node:
+        """List the blobs of a revision and build the tree of the files to ingest."""
+        try:
+            listing = subprocess.run(
+                ['git', '-C', self.git_dir, 'ls-tree', '-r', '-l', '-z', revision],
+                check=True, capture_output=True
+            ).stdout
+        except subprocess.CalledProcessError as e:
+            raise ValueError(f"Failed to list {revision}: {e.stderr.decode(errors='replace').strip()}") from e
+
+        # entries of every directory, keyed by its relative path ('' or ending in '/')
+        directories = {'': {}}
+        blobs = {}
+        for record in listing.split(b'\0'):
+            if not record:
+                continue
+            info, _, path = record.partition(b'\t')
+            mode, kind, sha, size = info.split()
+            if kind != b'blob' or mode in _SKIPPED_MODES:
+                continue
+            relpath = os.fsdecode(path)
+            blobs[relpath] = (sha.decode(), int(size))
+            prefix = ''
+            *parents, name = relpath.split('/')
+            for parent in parents:
+                entries = directories[prefix]
+                prefix = f"{prefix}{parent}/"
+                if parent not in entries:
+                    entries[parent] = True
+                    directories[prefix] = {}
+            directories[prefix][name] = False
+
+        def read_gitignore(prefix: str) -> Optional[IgnoreMatcher]:
+            try:
+                text = self.read_blob(blobs[f"{prefix}.gitignore"][0]).decode('utf-8', errors='replace')
+            except (KeyError, OSError):
+                return None
+            patterns = parse_gitignore(text)
+            return IgnoreMatcher(patterns, prefix.rstrip('/')) if patterns else None
+
+        root_node = Node(self.root_path, is_dir=True)
+        populate_tree(root_node, lambda prefix: list(directories.get(prefix, {}).items()), read_gitignore)
+        # keep only the blobs of files that survived the ignore rules
+        for filepath in get_file_list(root_node):
+            self._blobs[filepath] = blobs[os.path.relpath(filepath, self.root_path)]
+        return root_node
+
+    def read_blob(self, sha: str) -> bytes:
+        """Read the content of a blob through the shared 'git cat-file --batch' process.
+
+        Args:
+            sha: Object id of the blob
+
+        Returns:
+            Content of the blob
+
+        Raises:
+            OSError: If the object is missing or git exited
+        """
+        with self._lock:
+            if self._process is None:
+                self._process = subprocess.Popen(
+                    ['git', '-C', self.git_dir, 'cat-file', '--batch'],
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                )
+            try:
+                self._process.stdin.write(f"{sha}\n".encode())
+                self._process.stdin.flush()
+                header = self._process.stdout.readline().split()
+                if len(header) != 3:
+                    raise OSError(f"git object {sha} is missing")
+                size = int(header[2])
+                data = self._process.stdout.read(size)
+                self._process.stdout.read(1)
+            except (BrokenPipeError, ValueError) as e:
+                raise OSError(f"Could not read git object {sha}: {e}") from e
+            if len(data) != size:
+                raise OSError(f"git exited while reading object {sha}")
+            return data
+
+    def size_of(self, filepath: str) -> int:
+        """Return the size of a file in bytes, or 0 if it is not part of the commit."""
+        blob = self._blobs.get(filepath)
+        return blob[1] if blob is not None else 0
+
+    def iter_document(self, filepath: str, budget: Optional[ByteBudget] = None,
+                      max_file_bytes: int = MAX_FILE_BYTES) -> Iterator[str]:
+        """Stream the decoded text of a file in blocks, as loader.iter_document.
+
+        Files over max_file_bytes are rejected by their listed size, without
+        reading their blob.
+
+        Raises:
+            SkippedFile: If the file is binary, too large or over budget
+            OSError: If the file is not part of the commit or cannot be read
+        """
+        blob = self._blobs.get(filepath)
+        if blob is None:
+            raise OSError(f"{filepath} is not part of the commit")
+        sha, size = blob
+        if size > max_file_bytes:
+            raise SkippedFile(f"file is {size:,} bytes, larger than the {max_file_bytes:,} byte limit")
+        yield from iter_text(self.read_blob(sha), budget, max_file_bytes)
+
+    def close(self) -> None:
+        """Stop the cat-file process and delete the bare clone, but not the mirror."""
+        with self._lock:
+            process, self._process = self._process, None
+        if process is not None:
+            process.stdin.close()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            process.stdout.close()
+        if self._owned:
+            delete_repository(self.git_dir)
+
+
+RepositorySource = Union[WorkingTree, GitObjectSource]
+
+
+def open_repository(link: str, commit_sha: Optional[str] = None) -> RepositorySource:
+    """Fetch a repository commit and list the files to ingest.
+
+    A source of the same commit opened by prefetch_repository() is taken
+    over, waiting for it if needed. The caller must close() the source.
+
+    Args:
+        link: Git repository URL
+        commit_sha: Commit to ingest instead of the default branch
+
+    Returns:
+        A GitObjectSource, or a checked out WorkingTree if GIT_OBJECT_SOURCE is disabled
+
+    Raises:
+        ValueError: If the repository cannot be fetched or its tree not built
+    """
+    future = _take_prefetched(link, commit_sha)
+    if future is not None:
+        # only the time still spent waiting for the prefetch
+        with span("clone_prefetched", repository=link):
+            return future.result()
+    return _open_repository(link, commit_sha)
+
+
+def _open_repository(link: str, commit_sha: Optional[str]) -> RepositorySource:
+    if GIT_OBJECT_SOURCE:
+        return GitObjectSource(link, commit_sha)
+    return WorkingTree(link, commit_sha)
+
+
+def prefetch_repository(link: str, commit_sha: str) -> None:
+    """Start fetching a repository commit and building its tree in the background.
+
+    The next open_repository() call for the same commit takes over the
+    result instead of fetching again, so the clone of one repository can
+    overlap with the ingestion of another. Sources that are never taken over
+    must be dropped with discard_prefetched().
+
+    Args:
+        link: Git repository URL
+        commit_sha: Commit to fetch
+    """
+    key = (normalize_repo_url(link), commit_sha)
+    with _prefetched_lock:
+        if key not in _prefetched:
+            _prefetched[key] = _prefetch_pool.submit(_open_repository, link, commit_sha)
+
+
+def _take_prefetched(link: str, commit_sha: Optional[str]) -> Optional[Future]:
+    """Take over the prefetched source of a repository commit, if there is one."""
+    if commit_sha is None:
+        return None
+    with _prefetched_lock:
+        return _prefetched.pop((normalize_repo_url(link), commit_sha), None)
+
+
+def discard_prefetched(link: str, commit_sha: str) -> None:
+    """Close the prefetched source of a repository commit if no ingestion took it over.
+
+    Args:
+        link: Git repository URL passed to prefetch_repository()
+        commit_sha: Commit passed to prefetch_repository()
+    """
+    future = _take_prefetched(link, commit_sha)
+    if future is None or future.cancel():
+        return
+    try:
+        source = future.result()
+    except Exception:
+        return
+    source.close()
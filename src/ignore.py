@@ -0,0 +1,319 @@
+import os
+import re
+from typing import Optional
+
+HONOR_GITIGNORE = os.getenv("HONOR_GITIGNORE", "true").lower() == "true"
+
+IGNORE_PATTERNS = [
+    # Python - compiled and cache files
+    '*.pyc','*.pyo','*.pyd','__pycache__','.pytest_cache','.coverage','.tox','.nox','.mypy_cache','.ruff_cache','.hypothesis','poetry.lock','Pipfile.lock','init.py','__init__.py','.python-version','uv.lock','pyproject.toml',
+    # JavaScript/Node - dependencies and build artifacts
+    'node_modules','bower_components','package-lock.json','yarn.lock','.npm','.yarn','.pnpm-store','bun.lock','bun.lockb','.eslintcache','.parcel-cache',
+    # Java - compiled files
+    '*.class','*.jar','*.war','*.ear','*.nar','.gradle/','build/','.settings/','.classpath','gradle-app.setting','*.gradle',
+    # C/C++ - compiled artifacts
+    '*.o','*.obj','*.dll','*.dylib','*.exe','*.lib','*.out','*.a','*.pdb','*.so','*.dylib',
+    # Swift/Xcode
+    '.build/','*.xcodeproj/','*.xcworkspace/','*.pbxuser','*.mode1v3','*.mode2v3','*.perspectivev3','*.xcuserstate','xcuserdata/','.swiftpm/',
+    # Ruby
+    '*.gem','.bundle/','vendor/bundle','Gemfile.lock','.ruby-version','.ruby-gemset','.rvmrc',
+    # Rust
+    'Cargo.lock','**/*.rs.bk',
+    # Go; pkg/ holds library sources in most modules
+    'go.sum',
+    # .NET/C#
+    'obj/','*.suo','*.user','*.userosscache','*.sln.docstates','*.nupkg','*.exe.config',
+    # PHP
+    'vendor/','composer.lock',
+    # Build directories and artifacts
+    'build/','dist/','target/','out/','bin/','*.egg-info','*.egg','*.whl',
+    # Version control
+    '.git','.svn','.hg','.gitignore','.gitattributes','.gitmodules',
+    # Virtual environments
+    'venv/','.venv/','env/','virtualenv/','venv','bin','lib',
+    # IDEs and editors
+    '.project','.vscode/','.idea/','.vs/','.settings/','*.swp','*.swo','*~',
+    # OS-specific files
+    '.DS_Store','Thumbs.db','desktop.ini','ehthumbs.db',
+    # Temporary and cache files
+    '*.log','*.bak','*.tmp','*.temp','.cache/','.sass-cache/','*.orig',
+    # Documentation build directories
+    'site-packages/','.docusaurus/','.next/','.nuxt/','_site/',
+    # Archives and compressed files
+    '*.zip','*.tar','*.gz','*.tar.gz','*.tar.xz','*.tar.bz2','*.rar','*.7z','*.xz','*.bz2',
+    # Images (binary files not useful for RAG)
+    '*.jpg','*.jpeg','*.png','*.gif','*.bmp','*.tiff','*.webp','*.svg','*.ico','*.cur','*.ani','img',
+    # Audio/Video files
+    '*.mp3','*.wav','*.flac','*.aac','*.ogg','*.wma','*.mp4','*.avi','*.mov','*.wmv','*.flv','*.webm',
+    # Font files
+    '*.ttf','*.otf','*.woff','*.woff2','*.eot',
+    # Database files
+    '*.db','*.sqlite','*.sqlite3','*.mdb','*.accdb',
+    # Minified files
+    '*.min.js','*.min.css',
+    # Source maps
+    '*.map',
+    # Terraform
+    '.terraform/','*.tfstate*',
+    # Docker
+    '.dockerignore',
+    # Package manager lock files
+    'yarn.lock','pnpm-lock.yaml','composer.lock','Gemfile.lock','Pipfile.lock',
+    # Other common patterns
+    'LICENSE','LICENSE.txt','CHANGELOG','CHANGELOG.md','.helmignore','*.pdf','*.csv','.ansible-lint','.env','.pkl',
+    # Binary executables
+    '*.exe','*.msi','*.dmg','*.pkg','*.deb','*.rpm',
+    # Certificate files
+    '*.pem','*.crt','*.key','*.p12','*.pfx'
+]
+
+GLOB_CHARS = re.compile(r"[*?\[\\]")
+
+
+def glob_to_regex(pattern: str) -> str:
+    """Translate a gitignore glob into a regular expression.
+
+    '*' and '?' do not match '/', '**' matches across directories and
+    bracket expressions are passed through.
+
+    Args:
+        pattern: Glob without leading '!' or trailing '/'
+
+    Returns:
+        Regular expression source matching the whole glob
+    """
+    i, n = 0, len(pattern)
+    parts = []
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**', i):
+                at_start = i == 0 or pattern[i - 1] == '/'
+                if at_start and pattern.startswith('**/', i):
+                    parts.append('(?:.*/)?')
+                    i += 3
+                    continue
+                if at_start and i + 2 == n:
+                    parts.append('.*')
+                    i += 2
+                    continue
+                parts.append('[^/]*')
+                i += 2
+                continue
+            parts.append('[^/]*')
+        elif c == '?':
+            parts.append('[^/]')
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        elif c == '[':
+            end = pattern.find(']', i + 2 if pattern.startswith('[!', i) or pattern.startswith('[^', i) else i + 1)
+            if end == -1:
+                parts.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                parts.append(f'[{body}]')
+                i = end
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return ''.join(parts)
+
+
+class IgnoreRule:
+    """A single parsed gitignore pattern."""
+
+    __slots__ = ('pattern', 'negated', 'dir_only', 'anchored', 'glob')
+
+    def __init__(self, line: str):
+        """Parse a gitignore line (assumed not blank and not a comment).
+
+        Args:
+            line: Pattern line from a .gitignore file or IGNORE_PATTERNS
+        """
+        self.pattern = line
+        self.negated = line.startswith('!')
+        if self.negated:
+            line = line[1:]
+        elif line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+        self.dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        # a slash at the start or in the middle anchors the pattern to the .gitignore directory
+        self.anchored = '/' in line
+        self.glob = line.lstrip('/')
+
+
+def parse_gitignore(text: str) -> list[str]:
+    """Extract the patterns of a .gitignore file.
+
+    Args:
+        text: Content of the .gitignore file
+
+    Returns:
+        List of pattern lines with comments and blank lines removed
+    """
+    patterns = []
+    for line in text.splitlines():
+        if not line.strip() or line.startswith('#'):
+            continue
+        # trailing spaces are ignored unless escaped with a backslash
+        stripped = line.rstrip(' ')
+        if stripped.endswith('\\') and len(stripped) < len(line):
+            stripped += ' '
+        patterns.append(stripped)
+    return patterns
+
+
+class IgnoreMatcher:
+    """Precompiled matcher for a list of gitignore patterns.
+
+    Plain names are looked up in hash sets, '*.ext' patterns in a suffix set
+    and all remaining globs are combined into a single regular expression per
+    kind (basename or anchored path, files or directories only). Pattern
+    lists containing negations are evaluated rule by rule, last match wins,
+    as git does.
+    """
+
+    def __init__(self, patterns: list[str], base: str = ""):
+        """Compile a list of patterns.
+
+        Args:
+            patterns: Gitignore pattern lines
+            base: Directory of the .gitignore relative to the repository root,
+                  or '' for patterns that apply to the whole repository
+        """
+        self.base = base.strip('/')
+        self.rules = [IgnoreRule(p) for p in patterns]
+        self.ordered = any(rule.negated for rule in self.rules)
+
+        self.names = set()
+        self.dir_names = set()
+        self.suffixes = set()
+        self.dir_suffixes = set()
+        regexes = {(anchored, dir_only): [] for anchored in (False, True) for dir_only in (False, True)}
+
+        for rule in self.rules:
+            if self.ordered:
+                continue
+            if not rule.anchored and not GLOB_CHARS.search(rule.glob):
+                (self.dir_names if rule.dir_only else self.names).add(rule.glob)
+            elif not rule.anchored and rule.glob.startswith('*') and not GLOB_CHARS.search(rule.glob[1:]):
+                (self.dir_suffixes if rule.dir_only else self.suffixes).add(rule.glob[1:])
+            else:
+                regexes[(rule.anchored, rule.dir_only)].append(glob_to_regex(rule.glob))
+
+        self.suffix_lengths = sorted({len(s) for s in self.suffixes})
+        self.dir_suffix_lengths = sorted({len(s) for s in self.dir_suffixes})
+        self.regexes = {
+            kind: re.compile('(?:' + '|'.join(sources) + r')\Z') if sources else None
+            for kind, sources in regexes.items()
+        }
+        self.rule_regexes = [re.compile(glob_to_regex(rule.glob) + r'\Z') for rule in self.rules] if self.ordered else []
+
+    def _relative(self, relpath: str) -> Optional[str]:
+        """Return relpath relative to the matcher's base, or None if it lies outside."""
+        if not self.base:
+            return relpath
+        if relpath.startswith(self.base + '/'):
+            return relpath[len(self.base) + 1:]
+        return None
+
+    def match(self, relpath: str, is_dir: bool = False) -> Optional[bool]:
+        """Decide whether a path is ignored by these patterns.
+
+        Args:
+            relpath: Path relative to the repository root, with '/' separators
+            is_dir: Whether the path is a directory
+
+        Returns:
+            True if ignored, False if explicitly re-included by a negated
+            pattern, or None if no pattern matches
+        """
+        path = self._relative(relpath)
+        if path is None:
+            return None
+        name = path.rsplit('/', 1)[-1]
+
+        if self.ordered:
+            for rule, regex in zip(reversed(self.rules), reversed(self.rule_regexes)):
+                if rule.dir_only and not is_dir:
+                    continue
+                if regex.match(path if rule.anchored else name):
+                    return not rule.negated
+            return None
+
+        if name in self.names:
+            return True
+        for length in self.suffix_lengths:
+            if name[-length:] in self.suffixes:
+                return True
+        regex = self.regexes[(False, False)]
+        if regex is not None and regex.match(name):
+            return True
+        regex = self.regexes[(True, False)]
+        if regex is not None and regex.match(path):
+            return True
+
+        if is_dir:
+            if name in self.dir_names:
+                return True
+            for length in self.dir_suffix_lengths:
+                if name[-length:] in self.dir_suffixes:
+                    return True
+            regex = self.regexes[(False, True)]
+            if regex is not None and regex.match(name):
+                return True
+            regex = self.regexes[(True, True)]
+            if regex is not None and regex.match(path):
+                return True
+        return None
+
+
+DEFAULT_MATCHER = IgnoreMatcher(IGNORE_PATTERNS)
+
+
+def load_gitignore(directory: str, base: str) -> Optional[IgnoreMatcher]:
+    """Compile the .gitignore file of a directory, if it has one.
+
+    Args:
+        directory: Absolute path of the directory
+        base: Path of the directory relative to the repository root
+
+    Returns:
+        Matcher for the file's patterns, or None if there is no usable .gitignore
+    """
+    path = os.path.join(directory, '.gitignore')
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            patterns = parse_gitignore(f.read())
+    except OSError:
+        return None
+    return IgnoreMatcher(patterns, base) if patterns else None
+
+
+def is_ignored(relpath: str, is_dir: bool, gitignores: tuple[IgnoreMatcher, ...] = ()) -> bool:
+    """Decide whether a repository path should be skipped for ingestion.
+
+    The built-in IGNORE_PATTERNS always apply. The repository's own .gitignore
+    matchers are consulted from the deepest directory up, and the first one
+    with a matching pattern decides, so nested files override their parents.
+
+    Args:
+        relpath: Path relative to the repository root, with '/' separators
+        is_dir: Whether the path is a directory
+        gitignores: Matchers of the .gitignore files of the path's ancestors,
+                    ordered from the root down
+
+    Returns:
+        True if the path should be ignored
+    """
+    if DEFAULT_MATCHER.match(relpath, is_dir):
+        return True
+    for matcher in reversed(gitignores):
+        decision = matcher.match(relpath, is_dir)
+        if decision is not None:
+            return decision
+    return False
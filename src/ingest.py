@@ -0,0 +1,173 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Optional
+
+INGEST_BATCH_MAX_DOCS = int(os.getenv("INGEST_BATCH_MAX_DOCS", "32"))
+INGEST_BATCH_MAX_BYTES = int(os.getenv("INGEST_BATCH_MAX_BYTES", str(2 * 1024 * 1024)))
+INGEST_READ_WORKERS = int(os.getenv("INGEST_READ_WORKERS", "8"))
+INGEST_MAX_IN_FLIGHT = int(os.getenv("INGEST_MAX_IN_FLIGHT", "4"))
+
+
+def file_size(filepath: str) -> int:
+    """Return the size of a file in bytes, or 0 if it cannot be read.
+
+    Args:
+        filepath: Path to the file
+
+    Returns:
+        Size of the file in bytes
+    """
+    try:
+        return os.path.getsize(filepath)
+    except OSError:
+        return 0
+
+
+def make_batches(
+    files: list[str],
+    max_docs: int = INGEST_BATCH_MAX_DOCS,
+    max_bytes: int = INGEST_BATCH_MAX_BYTES,
+    size_of: Callable[[str], int] = file_size,
+) -> list[list[str]]:
+    """Group files into batches bounded by document count and total bytes.
+
+    A single file larger than max_bytes is placed in a batch of its own.
+
+    Args:
+        files: File paths to group
+        max_docs: Maximum number of files per batch
+        max_bytes: Maximum total size of the files in a batch
+        size_of: Function returning the size of a file in bytes
+
+    Returns:
+        List of batches, each a list of file paths
+    """
+    batches = []
+    current = []
+    current_bytes = 0
+    for filepath in files:
+        size = size_of(filepath)
+        if current and (len(current) >= max_docs or current_bytes + size > max_bytes):
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(filepath)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def ingest_files(
+    files: list[str],
+    load: Callable[[str], Optional[Any]],
+    insert: Callable[[list[tuple[str, Any]]], list[tuple[str, str]]],
+    on_batch: Optional[Callable[[dict], None]] = None,
+    max_docs: int = INGEST_BATCH_MAX_DOCS,
+    max_bytes: int = INGEST_BATCH_MAX_BYTES,
+    read_workers: int = INGEST_READ_WORKERS,
+    max_in_flight: int = INGEST_MAX_IN_FLIGHT,
+    size_of: Callable[[str], int] = file_size,
+) -> dict:
+    """Load and insert files in size-bounded batches with bounded concurrency.
+
+    Files of a batch are read in parallel on a shared thread pool, and up to
+    max_in_flight batches are inserted at the same time. Progress callbacks
+    are invoked from the calling thread, so they may safely update UI state.
+
+    Args:
+        files: File paths to ingest
+        load: Function returning the loaded content of a file, or None (or
+              raising) if it cannot be loaded
+        insert: Function storing a list of (filepath, content) pairs and
+                returning the (filepath, error) pairs that could not be stored
+        on_batch: Optional callback receiving a report dict after each batch
+        max_docs: Maximum number of files per batch
+        max_bytes: Maximum total size of the files in a batch
+        read_workers: Number of threads used to read files
+        max_in_flight: Maximum number of batches inserted concurrently
+        size_of: Function returning the size of a file in bytes
+
+    Returns:
+        Summary dict with the number of batches, files, bytes and stored
+        files, the list of (filepath, error) failures and the elapsed time
+    """
+    sizes = {}
+
+    def record_size(filepath: str) -> int:
+        sizes[filepath] = size_of(filepath)
+        return sizes[filepath]
+
+    batches = make_batches(files, max_docs, max_bytes, record_size)
+    summary = {
+        "batches": len(batches),
+        "files": 0,
+        "bytes": 0,
+        "stored": 0,
+        "failed": [],
+        "elapsed": 0.0,
+    }
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=read_workers) as readers, \
+            ThreadPoolExecutor(max_workers=max_in_flight) as inserters:
+
+        def safe_load(filepath: str) -> tuple[Optional[Any], Optional[str]]:
+            try:
+                content = load(filepath)
+            except Exception as e:
+                return None, str(e)
+            return content, None if content is not None else "could not be loaded"
+
+        def run_batch(index: int, batch: list[str]) -> dict:
+            batch_start = time.perf_counter()
+            loaded = []
+            failed = []
+            for filepath, (content, error) in zip(batch, readers.map(safe_load, batch)):
+                if error is not None:
+                    failed.append((filepath, error))
+                else:
+                    loaded.append((filepath, content))
+            read_elapsed = time.perf_counter() - batch_start
+
+            if loaded:
+                try:
+                    failed.extend(insert(loaded))
+                except Exception as e:
+                    failed.extend((filepath, str(e)) for filepath, _ in loaded)
+
+            failed_paths = {filepath for filepath, _ in failed}
+            return {
+                "batch": index + 1,
+                "total_batches": len(batches),
+                "files": len(batch),
+                "bytes": sum(sizes[filepath] for filepath, _ in loaded),
+                "stored": sum(1 for filepath, _ in loaded if filepath not in failed_paths),
+                "failed": failed,
+                "read_elapsed": read_elapsed,
+                "elapsed": time.perf_counter() - batch_start,
+            }
+
+        pending = set()
+        remaining = iter(enumerate(batches))
+        while True:
+            for index, batch in remaining:
+                pending.add(inserters.submit(run_batch, index, batch))
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                report = future.result()
+                summary["files"] += report["files"]
+                summary["bytes"] += report["bytes"]
+                summary["stored"] += report["stored"]
+                summary["failed"].extend(report["failed"])
+                if on_batch is not None:
+                    on_batch(report)
+
+    summary["elapsed"] = time.perf_counter() - start
+    return summary
@@ -0,0 +1,272 @@
+import os
+import time
+import uuid
+import threading
+import collections
+from typing import Any, Callable, Optional
+
+# ingestion jobs running at once in this process, across all users
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# seconds a finished job is kept for sessions to reattach to
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised from the progress callback of a job that was cancelled, to stop its ingestion."""
+
+
+class Job:
+    """An ingestion running in the background, independently of the session that submitted it.
+
+    Attributes:
+        id (str): Job identifier, stable across page reloads
+        owner (str): User the job is queued for
+        description (str): What the job does, for display
+        state (str): One of 'queued', 'running', 'succeeded', 'failed' or 'cancelled'
+        progress (dict): Batches, files, bytes, stored files and chunks
+            ingested so far, accumulated from the batch reports
+        result: Return value of the job's function once it succeeded
+        error (Optional[str]): Error message once it failed
+    """
+
+    def __init__(self, owner: str, description: str, fn: Callable[[Callable[[dict], None]], Any],
+                 on_cancel: Optional[Callable[[Any], None]] = None):
+        """Initialize a queued job.
+
+        Args:
+            owner: User the job is queued for
+            description: What the job does, for display
+            fn: Function doing the work, called with a progress callback
+                taking the batch reports of ingest_files()
+            on_cancel: Called with the result of fn if the job was cancelled
+                after fn could no longer be interrupted, to release it. If
+                None, such a job succeeds with the result instead.
+        """
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.description = description
+        self.state = QUEUED
+        self.progress = {"batches": 0, "total_batches": 0, "files": 0, "bytes": 0, "stored": 0, "failed": 0, "chunks": 0}
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._fn = fn
+        self._on_cancel = on_cancel
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._adopted = False
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether cancellation of the job was requested."""
+        return self._cancel.is_set()
+
+    def cancel(self) -> None:
+        """Request cancellation.
+
+        A queued job is dropped before it starts. A running job stops at its
+        next batch boundary, and the vector database it was building is
+        unregistered.
+        """
+        self._cancel.set()
+
+    def adopt(self) -> tuple[Any, bool]:
+        """Return the result of the job, and whether this is the first time it is taken over.
+
+        Only the first session may use the result itself; later ones, e.g.
+        another tab following the same job, must attach their own agent.
+        """
+        with self._lock:
+            first = not self._adopted
+            self._adopted = True
+            return self.result, first
+
+    def report(self, report: dict) -> None:
+        """Accumulate a batch report from ingest_files() into the job's progress.
+
+        Raises:
+            JobCancelled: If the job was cancelled and batches are still outstanding
+        """
+        with self._lock:
+            progress = self.progress
+            progress["batches"] += 1
+            progress["total_batches"] = report["total_batches"]
+            progress["files"] += report["files"]
+            progress["bytes"] += report["bytes"]
+            progress["stored"] += report["stored"]
+            progress["failed"] += len(report["failed"])
+            progress["chunks"] = report.get("chunks", progress["chunks"])
+            outstanding = progress["batches"] < progress["total_batches"]
+        # once the last batch is in there is nothing left to save by interrupting the ingestion
+        if self.cancelled and outstanding:
+            raise JobCancelled("Job was cancelled")
+
+    def snapshot(self) -> dict:
+        """Return the state of the job for display."""
+        with self._lock:
+            return {
+                "id": self.id,
+                "description": self.description,
+                "state": self.state,
+                "progress": dict(self.progress),
+                "error": self.error,
+                "elapsed": (self.finished_at or time.time()) - (self.started_at or time.time()),
+            }
+
+    def run(self) -> None:
+        """Run the job on the calling worker thread, recording its outcome."""
+        if self.cancelled:
+            self._finish(CANCELLED)
+            return
+        with self._lock:
+            self.state = RUNNING
+            self.started_at = time.time()
+        try:
+            result = self._fn(self.report)
+        except JobCancelled:
+            self._finish(CANCELLED)
+            return
+        except Exception as e:
+            print(f"Job {self.id} ({self.description}) failed: {e}")
+            self._finish(FAILED, error=str(e))
+            return
+
+        if self.cancelled and self._on_cancel is not None:
+            try:
+                self._on_cancel(result)
+            except Exception as e:
+                print(f"Warning: Could not release the result of cancelled job {self.id}: {e}")
+            self._finish(CANCELLED)
+        else:
+            self._finish(SUCCEEDED, result=result)
+
+    def _finish(self, state: str, result: Any = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.state = state
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+        print(f"Job {self.id} ({self.description}) {state}")
+
+
+class JobQueue:
+    """Runs jobs on a fixed pool of worker threads, taking turns between users.
+
+    Every user has their own FIFO queue, and idle workers serve the users
+    round-robin, so one user submitting many repositories cannot starve the
+    others. JOB_WORKERS bounds how many clones and ingestions run at once in
+    the process, whatever the number of sessions.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, retention: float = JOB_RETENTION):
+        """Initialize the queue; worker threads are started on the first submission.
+
+        Args:
+            workers: Number of jobs run concurrently
+            retention: Seconds finished jobs are kept for get()
+        """
+        self.workers = max(1, workers)
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._queues = collections.OrderedDict()
+        self._jobs = {}
+        self._threads = []
+
+    def submit(self, owner: str, description: str, fn: Callable[[Callable[[dict], None]], Any],
+               on_cancel: Optional[Callable[[Any], None]] = None) -> Job:
+        """Queue a job for a user.
+
+        Args:
+            owner: User the job is queued for
+            description: What the job does, for display
+            fn: Function doing the work, called with a progress callback
+            on_cancel: Called with the result of fn if the job was cancelled
+                after fn could no longer be interrupted, see Job
+
+        Returns:
+            Job: The queued job
+        """
+        job = Job(owner, description, fn, on_cancel)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+            self._queues.setdefault(owner, collections.deque()).append(job)
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"ingest-job-{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._wakeup.notify()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job by id, or None if it is unknown or expired."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Request cancellation of a job.
+
+        Returns:
+            True if the job exists and had not finished
+        """
+        job = self.get(job_id)
+        if job is None or job.state in FINISHED:
+            return False
+        job.cancel()
+        return True
+
+    def position(self, job: Job) -> int:
+        """Return how many jobs will start before a queued job, or 0 if it is not queued.
+
+        Workers serve users round-robin, so the jobs ahead of it are those
+        queued ahead of it for its own user plus, for every other user, as
+        many jobs again, and one more for users whose turn comes first.
+        """
+        with self._lock:
+            queue = self._queues.get(job.owner)
+            if queue is None or job not in queue:
+                return 0
+            rank = queue.index(job)
+            owners = list(self._queues)
+            turn = owners.index(job.owner)
+            return rank + sum(min(len(self._queues[owner]), rank + (i < turn)) for i, owner in enumerate(owners) if i != turn)
+
+    def _next(self) -> Optional[Job]:
+        """Pop the next job round-robin across users. Must be called with the lock held."""
+        for owner in list(self._queues):
+            queue = self._queues.pop(owner)
+            job = queue.popleft()
+            if queue:
+                # the user goes to the back of the line with the rest of their jobs
+                self._queues[owner] = queue
+            return job
+        return None
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                job = self._next()
+                while job is None:
+                    self._wakeup.wait()
+                    job = self._next()
+            job.run()
+
+    def _prune(self) -> None:
+        """Forget jobs that finished more than retention seconds ago. Must be called with the lock held."""
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+
+job_queue = JobQueue()
@@ -0,0 +1,218 @@
+import os
+import re
+import json
+import math
+import zlib
+import struct
+import heapq
+import threading
+from array import array
+from collections import Counter
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+WORD_PATTERN = re.compile(r"[A-Za-z0-9_]+")
+# parts of camelCase and PascalCase words, keeping acronyms together: HTTPServer -> HTTP, Server
+CAMEL_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+# words of natural language questions that say nothing about the code
+QUERY_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or the this to what when "
+    "where which who why with you your".split()
+)
+
+INDEX_MAGIC = b"GRLX1\0"
+
+
+def code_tokens(text: str) -> list[str]:
+    """Split text into lower-cased search terms, splitting identifiers into their words.
+
+    Every identifier is kept whole and, when it is made of several words,
+    also split on underscores and camelCase boundaries, so 'parse_gitignore'
+    and 'IgnoreMatcher' match searches for 'gitignore' and 'matcher'.
+
+    Args:
+        text: Text or source code
+
+    Returns:
+        List of terms, with repetitions
+    """
+    tokens = []
+    for word in WORD_PATTERN.findall(text):
+        tokens.append(word.lower())
+        parts = [part.lower() for piece in word.split("_") for part in CAMEL_PART.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class LexicalIndex:
+    """In-memory BM25 index over the chunks of a repository.
+
+    Postings are stored per term as two parallel arrays of chunk ids and
+    term frequencies, chunk contents as zlib-compressed bytes. Chunks can be
+    added concurrently while the repository is being ingested.
+    """
+
+    def __init__(self):
+        """Initialize an empty index."""
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._lengths = array("I")
+        self._contents = []
+        self._metadata = []
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, content: str, metadata: dict) -> None:
+        """Index a chunk.
+
+        Args:
+            content: Text of the chunk
+            metadata: Metadata returned with search results, e.g. file and lines
+        """
+        terms = Counter(code_tokens(content))
+        length = sum(terms.values())
+        compressed = zlib.compress(content.encode("utf-8", errors="surrogatepass"))
+        with self._lock:
+            chunk_id = len(self._lengths)
+            self._lengths.append(length)
+            self._contents.append(compressed)
+            self._metadata.append(metadata)
+            self._total_length += length
+            for term, frequency in terms.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = (array("I"), array("I"))
+                postings[0].append(chunk_id)
+                postings[1].append(frequency)
+
+    def chunk(self, chunk_id: int) -> tuple[str, dict]:
+        """Return the content and metadata of a chunk, numbered in the order the chunks were added."""
+        with self._lock:
+            content, metadata = self._contents[chunk_id], self._metadata[chunk_id]
+        return zlib.decompress(content).decode("utf-8", errors="surrogatepass"), metadata
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[float, str, dict]]:
+        """Rank the chunks matching a query with BM25.
+
+        Args:
+            query: Search query
+            limit: Maximum number of results
+
+        Returns:
+            List of (score, content, metadata) tuples, best first
+        """
+        terms = [t for t in dict.fromkeys(code_tokens(query)) if t not in QUERY_STOPWORDS]
+        with self._lock:
+            count = len(self._lengths)
+            if not count or not terms:
+                return []
+            average = self._total_length / count
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                ids, frequencies = postings
+                idf = math.log(1 + (count - len(ids) + 0.5) / (len(ids) + 0.5))
+                for chunk_id, frequency in zip(ids, frequencies):
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[chunk_id] / average)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [
+                (score, zlib.decompress(self._contents[chunk_id]).decode("utf-8", errors="surrogatepass"),
+                 self._metadata[chunk_id])
+                for chunk_id, score in best
+            ]
+
+    def save(self, path: str) -> None:
+        """Write the index to a file.
+
+        Args:
+            path: File to write, replaced atomically
+        """
+        with self._lock:
+            terms = []
+            ids = array("I")
+            frequencies = array("I")
+            for term, (term_ids, term_frequencies) in self._postings.items():
+                terms.append((term, len(term_ids)))
+                ids.extend(term_ids)
+                frequencies.extend(term_frequencies)
+            header = json.dumps({
+                "terms": terms,
+                "metadata": self._metadata,
+                "content_sizes": [len(content) for content in self._contents],
+            }).encode()
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(INDEX_MAGIC)
+                f.write(struct.pack("<QQ", len(header), len(self._lengths)))
+                f.write(header)
+                f.write(self._lengths.tobytes())
+                f.write(ids.tobytes())
+                f.write(frequencies.tobytes())
+                for content in self._contents:
+                    f.write(content)
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        """Read an index written by save().
+
+        Args:
+            path: File to read
+
+        Returns:
+            The loaded index
+
+        Raises:
+            ValueError: If the file is not a saved index
+        """
+        index = cls()
+        with open(path, "rb") as f:
+            if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                raise ValueError(f"{path} is not a lexical index")
+            header_size, count = struct.unpack("<QQ", f.read(16))
+            header = json.loads(f.read(header_size))
+            index._lengths.frombytes(f.read(count * index._lengths.itemsize))
+            postings = sum(size for _, size in header["terms"])
+            ids = array("I")
+            ids.frombytes(f.read(postings * ids.itemsize))
+            frequencies = array("I")
+            frequencies.frombytes(f.read(postings * frequencies.itemsize))
+            index._contents = [f.read(size) for size in header["content_sizes"]]
+
+        offset = 0
+        for term, size in header["terms"]:
+            index._postings[term] = (ids[offset:offset + size], frequencies[offset:offset + size])
+            offset += size
+        index._metadata = header["metadata"]
+        index._total_length = sum(index._lengths)
+        return index
+
+
+def reciprocal_rank_fusion(rankings: list[list], key=lambda item: item, k: int = 60) -> list:
+    """Merge rankings by summing 1 / (k + rank) for every item over all rankings.
+
+    Args:
+        rankings: Lists of items, best first
+        key: Function identifying the same item across rankings
+        k: Smoothing constant; larger values flatten the head of each ranking
+
+    Returns:
+        The distinct items, best first; an item keeps its first occurrence
+    """
+    scores = {}
+    items = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            item_key = key(item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1.0 / (k + rank)
+            items.setdefault(item_key, item)
+    return [items[item_key] for item_key in sorted(scores, key=scores.get, reverse=True)]
+
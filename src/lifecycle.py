@@ -0,0 +1,288 @@
+import os
+import re
+import time
+import threading
+import contextlib
+from collections import OrderedDict
+from typing import Iterator
+
+from answer_cache import answer_cache
+from metrics import VECTOR_DB_EVICTIONS
+from registry import VECTOR_DB_ID_PREFIX, registry
+from resources import resources
+
+# seconds a vector database may go without queries or ingestion before it is unregistered, 0 disables
+VECTOR_DB_TTL = float(os.getenv("VECTOR_DB_TTL", str(60 * 60)))
+# budgets over all vector databases of the process, 0 disables
+VECTOR_DB_MAX_COUNT = int(os.getenv("VECTOR_DB_MAX_COUNT", "100"))
+VECTOR_DB_MAX_BYTES = int(os.getenv("VECTOR_DB_MAX_BYTES", str(4 * 1024 * 1024 * 1024)))
+VECTOR_DB_SWEEP_INTERVAL = float(os.getenv("VECTOR_DB_SWEEP_INTERVAL", "60"))
+# unregister databases left behind by earlier runs of the app; only those with this deployment's
+# VECTOR_DB_ID_PREFIX are considered, which must not be shared with any other running process
+VECTOR_DB_SWEEP_ORPHANS = os.getenv("VECTOR_DB_SWEEP_ORPHANS", "false").lower() == "true"
+# seconds a database this process does not track must have been listed before it is
+# swept, e.g. leaving those of the pod being replaced alone during a rolling update
+VECTOR_DB_ORPHAN_GRACE = float(os.getenv("VECTOR_DB_ORPHAN_GRACE", "900"))
+
+# ids generated by registry.new_vector_db_id() in this deployment
+APP_VECTOR_DB_ID = re.compile(rf"^v{VECTOR_DB_ID_PREFIX}_[0-9a-f]{{32}}$")
+
+
+def approximate_size(chunks: list[dict]) -> int:
+    """Estimate the bytes a vector_io provider keeps for chunks: content, metadata and float32 embeddings."""
+    return sum(len(chunk["content"]) + len(str(chunk["metadata"])) + 4 * len(chunk["embedding"]) for chunk in chunks)
+
+
+class TrackedDatabase:
+    """A vector database registered by this process.
+
+    Attributes:
+        vector_db_id (str): Identifier of the database
+        created (float): time.monotonic() when it was registered
+        last_access (float): time.monotonic() of the last query or insert
+        size (int): Approximate bytes of the inserted chunks
+    """
+
+    def __init__(self, vector_db_id: str):
+        self.vector_db_id = vector_db_id
+        self.created = self.last_access = time.monotonic()
+        self.size = 0
+
+
+class VectorDBLifecycle:
+    """Keeps the vector databases of the process within an idle TTL and a count and memory budget.
+
+    Agents track every database before registering it and touch it on every
+    query and insert. A reaper thread unregisters databases idle for longer
+    than the TTL, then the least recently used ones while the count or the
+    approximate size of all databases exceeds its budget. Databases that are
+    being built are never evicted. Evicted databases are dropped from the
+    registry, so the next session asking for the repository builds it anew,
+    and agents still holding one report it as expired.
+
+    If orphan sweeping is enabled, databases with an id generated by the app
+    under this deployment's VECTOR_DB_ID_PREFIX that this process does not
+    track are taken for leftovers of earlier runs. LlamaStack does not report when a database was created, so each
+    pass records when such a database was first listed, and it is only
+    unregistered once it has been listed for the grace period.
+    """
+
+    def __init__(self, ttl: float = VECTOR_DB_TTL, max_count: int = VECTOR_DB_MAX_COUNT,
+                 max_bytes: int = VECTOR_DB_MAX_BYTES, interval: float = VECTOR_DB_SWEEP_INTERVAL,
+                 orphan_grace: float = VECTOR_DB_ORPHAN_GRACE):
+        """Initialize the manager; the reaper runs once start() is called.
+
+        Args:
+            ttl: Idle seconds before a database is unregistered, 0 to keep idle databases
+            max_count: Maximum number of databases, 0 for no limit
+            max_bytes: Maximum approximate size of all databases, 0 for no limit
+            interval: Seconds between reaper passes
+            orphan_grace: Seconds an untracked database is listed before it is swept
+        """
+        self.ttl = ttl
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.orphan_grace = orphan_grace
+        self._lock = threading.Lock()
+        self._databases = OrderedDict()
+        self._busy = {}
+        self._bytes = 0
+        self._wakeup = threading.Event()
+        self._thread = None
+        # untracked databases by id, with the time.monotonic() they were first listed
+        self._orphans = {}
+
+    def track(self, vector_db_id: str) -> None:
+        """Start tracking a database about to be registered."""
+        with self._lock:
+            self._databases[vector_db_id] = TrackedDatabase(vector_db_id)
+            if self.max_count and len(self._databases) > self.max_count:
+                self._wakeup.set()
+
+    def forget(self, vector_db_id: str) -> bool:
+        """Stop tracking a database, e.g. because it is being unregistered.
+
+        Returns:
+            True if the database was tracked, False if it was already
+            evicted or forgotten and must not be unregistered again
+        """
+        with self._lock:
+            database = self._databases.pop(vector_db_id, None)
+            if database is None:
+                return False
+            self._bytes -= database.size
+            return True
+
+    def touch(self, vector_db_id: str, added_bytes: int = 0) -> bool:
+        """Record an access to a database.
+
+        Args:
+            vector_db_id: Database that was queried or inserted into
+            added_bytes: Approximate size of inserted chunks
+
+        Returns:
+            False if the database is not tracked, i.e. it was evicted
+        """
+        with self._lock:
+            database = self._databases.get(vector_db_id)
+            if database is None:
+                return False
+            database.last_access = time.monotonic()
+            database.size += added_bytes
+            self._bytes += added_bytes
+            self._databases.move_to_end(vector_db_id)
+            if self.max_bytes and self._bytes > self.max_bytes:
+                self._wakeup.set()
+        return True
+
+    def tracked(self, vector_db_id: str) -> bool:
+        """Return whether a database is tracked, i.e. registered and not evicted."""
+        with self._lock:
+            return vector_db_id in self._databases
+
+    @contextlib.contextmanager
+    def busy(self, vector_db_id: str) -> Iterator[None]:
+        """Protect a database from eviction while it is being built."""
+        with self._lock:
+            self._busy[vector_db_id] = self._busy.get(vector_db_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._busy[vector_db_id] -= 1
+                if not self._busy[vector_db_id]:
+                    del self._busy[vector_db_id]
+            self.touch(vector_db_id)
+
+    def stats(self) -> dict:
+        """Return the number and approximate total size of the tracked databases."""
+        with self._lock:
+            return {"databases": len(self._databases), "bytes": self._bytes}
+
+    def _victims(self) -> list[tuple[str, str]]:
+        """Pick the databases to evict, least recently used first, as (vector_db_id, reason) pairs."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [db for db in self._databases.values() if db.vector_db_id not in self._busy]
+            count = len(self._databases)
+            size = self._bytes
+        victims = []
+        for database in candidates:
+            if self.ttl and now - database.last_access > self.ttl:
+                reason = "idle"
+            elif self.max_count and count > self.max_count:
+                reason = "count"
+            elif self.max_bytes and size > self.max_bytes:
+                reason = "memory"
+            else:
+                continue
+            victims.append((database.vector_db_id, reason))
+            count -= 1
+            size -= database.size
+        return victims
+
+    def evict(self, vector_db_id: str, reason: str) -> None:
+        """Unregister a tracked database and drop it from the registry.
+
+        Args:
+            vector_db_id: Database to evict
+            reason: 'idle', 'count' or 'memory', for logs and metrics
+        """
+        if not self.forget(vector_db_id):
+            return
+        registry.evict(vector_db_id)
+        if answer_cache:
+            answer_cache.invalidate(vector_db_id)
+        try:
+            resources.client().vector_dbs.unregister(vector_db_id=vector_db_id)
+            print(f"Evicted vector database {vector_db_id} ({reason})")
+        except Exception as e:
+            print(f"Warning: Could not unregister evicted vector database {vector_db_id}: {e}")
+        VECTOR_DB_EVICTIONS.inc(reason=reason)
+
+    def reap(self) -> int:
+        """Evict idle databases and the least recently used ones beyond the budgets.
+
+        Returns:
+            Number of evicted databases
+        """
+        victims = self._victims()
+        for vector_db_id, reason in victims:
+            self.evict(vector_db_id, reason)
+        return len(victims)
+
+    def sweep_orphans(self) -> int:
+        """Unregister databases with an app-generated id that this process has not tracked for the grace period.
+
+        Only ids with this deployment's VECTOR_DB_ID_PREFIX are considered.
+        Every other process registering databases with the same prefix on
+        the same LlamaStack server, such as another replica, would have its
+        live databases swept, so the sweep is for single-replica deployments.
+
+        Returns:
+            Number of unregistered databases
+        """
+        try:
+            databases = resources.client().vector_dbs.list()
+        except Exception as e:
+            print(f"Warning: Could not list vector databases to sweep orphans: {e}")
+            return 0
+        now = time.monotonic()
+        orphans = {}
+        swept = 0
+        for database in databases:
+            vector_db_id = database.identifier
+            if not APP_VECTOR_DB_ID.match(vector_db_id) or self.tracked(vector_db_id):
+                continue
+            first_seen = self._orphans.get(vector_db_id, now)
+            if now - first_seen < self.orphan_grace:
+                orphans[vector_db_id] = first_seen
+                continue
+            try:
+                resources.client().vector_dbs.unregister(vector_db_id=vector_db_id)
+                swept += 1
+            except Exception as e:
+                orphans[vector_db_id] = first_seen
+                print(f"Warning: Could not unregister orphaned vector database {vector_db_id}: {e}")
+        # databases unregistered by their owner in the meantime are forgotten
+        self._orphans = orphans
+        if swept:
+            print(f"Unregistered {swept} orphaned vector databases")
+            VECTOR_DB_EVICTIONS.inc(swept, reason="orphan")
+        return swept
+
+    def start(self, sweep_orphans: bool = VECTOR_DB_SWEEP_ORPHANS) -> None:
+        """Start the reaper thread, once per process.
+
+        Args:
+            sweep_orphans: Whether every pass unregisters databases left over
+                from earlier runs, see sweep_orphans()
+        """
+        if sweep_orphans and not VECTOR_DB_ID_PREFIX:
+            print("Warning: Not sweeping orphaned vector databases, VECTOR_DB_ID_PREFIX is not set")
+            sweep_orphans = False
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(sweep_orphans,),
+                                            name="vector-db-reaper", daemon=True)
+        self._thread.start()
+
+    def _run(self, sweep_orphans: bool) -> None:
+        if sweep_orphans:
+            self.sweep_orphans()
+        while True:
+            # a pass is due every interval, or as soon as a budget is exceeded
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.reap()
+                if sweep_orphans:
+                    self.sweep_orphans()
+            except Exception as e:
+                print(f"Warning: Vector database reaper pass failed: {e}")
+
+
+# Global lifecycle manager of the vector databases registered by this process
+lifecycle = VectorDBLifecycle()
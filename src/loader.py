@@ -0,0 +1,199 @@
+import os
+import mmap
+import codecs
+import threading
+from typing import Iterator, Optional
+
+try:
+    from charset_normalizer import from_bytes
+except ImportError:  # charset-normalizer is optional, installed with requests
+    from_bytes = None
+
+LOADER_SAMPLE_BYTES = int(os.getenv("LOADER_SAMPLE_BYTES", "8192"))
+LOADER_BLOCK_BYTES = int(os.getenv("LOADER_BLOCK_BYTES", str(64 * 1024)))
+LOADER_MMAP_THRESHOLD = int(os.getenv("LOADER_MMAP_THRESHOLD", str(1024 * 1024)))
+MAX_FILE_BYTES = int(os.getenv("MAX_FILE_BYTES", str(2 * 1024 * 1024)))
+MAX_REPO_BYTES = int(os.getenv("MAX_REPO_BYTES", str(512 * 1024 * 1024)))
+
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+# bytes that do not appear in text files besides \t, \n, \f, \r and ESC
+CONTROL_BYTES = bytes(set(range(32)) - {9, 10, 12, 13, 27}) + b"\x7f"
+
+
+class SkippedFile(Exception):
+    """Raised when a file is not worth ingesting (binary, too large or over budget)."""
+
+
+class ByteBudget:
+    """Thread-safe budget of bytes that may be ingested for one repository."""
+
+    def __init__(self, max_bytes: int = MAX_REPO_BYTES):
+        """Initialize the budget.
+
+        Args:
+            max_bytes: Total number of bytes that may be consumed
+        """
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def consume(self, size: int) -> bool:
+        """Reserve bytes from the budget.
+
+        Args:
+            size: Number of bytes to reserve
+
+        Returns:
+            True if the bytes were reserved, False if the budget is exhausted
+        """
+        with self._lock:
+            if self.used + size > self.max_bytes:
+                return False
+            self.used += size
+            return True
+
+
+def is_binary(sample: bytes) -> bool:
+    """Guess whether a block of bytes comes from a binary file.
+
+    Args:
+        sample: First block of the file
+
+    Returns:
+        True if the block contains NUL bytes or mostly control characters
+    """
+    if not sample:
+        return False
+    if any(sample.startswith(bom) for bom, _ in BOMS):
+        return False
+    if b"\x00" in sample:
+        return True
+    control = len(sample) - len(sample.translate(None, CONTROL_BYTES))
+    return control / len(sample) > 0.1
+
+
+def detect_encoding(sample: bytes) -> str:
+    """Detect the text encoding of a file from its first block.
+
+    Args:
+        sample: First block of the file
+
+    Returns:
+        Name of a Python codec able to decode the file
+    """
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # the sample may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    if from_bytes is not None:
+        match = from_bytes(sample).best()
+        if match is not None:
+            return match.encoding
+    return "cp1252"
+
+
+def iter_document(filepath: str, budget: Optional[ByteBudget] = None,
+                  max_file_bytes: int = MAX_FILE_BYTES) -> Iterator[str]:
+    """Stream the decoded text of a file in blocks.
+
+    The first block is sampled to reject binary files and detect the
+    encoding before anything is decoded. Files larger than max_file_bytes or
+    exceeding the repository budget are rejected without being read. Large
+    files are memory-mapped, smaller ones read in blocks, so peak memory per
+    file stays around one block.
+
+    Args:
+        filepath: Path to the file to read
+        budget: Optional per-repository byte budget to charge the file against
+        max_file_bytes: Maximum size of a single file
+
+    Yields:
+        Decoded text blocks
+
+    Raises:
+        SkippedFile: If the file is binary, too large or over budget
+        OSError: If the file cannot be read
+    """
+    size = os.path.getsize(filepath)
+    if size > max_file_bytes:
+        raise SkippedFile(f"file is {size:,} bytes, larger than the {max_file_bytes:,} byte limit")
+
+    with open(filepath, "rb") as f:
+        sample = f.read(LOADER_SAMPLE_BYTES)
+        if is_binary(sample):
+            raise SkippedFile("file appears to be binary")
+        if budget is not None and not budget.consume(size):
+            raise SkippedFile(f"repository byte budget of {budget.max_bytes:,} bytes exhausted")
+
+        decoder = codecs.getincrementaldecoder(detect_encoding(sample))(errors="replace")
+        if size >= LOADER_MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for start in range(0, len(view), LOADER_BLOCK_BYTES):
+                        text = decoder.decode(view[start:start + LOADER_BLOCK_BYTES])
+                        if text:
+                            yield text
+                finally:
+                    view.release()
+        else:
+            block = sample
+            while block:
+                text = decoder.decode(block)
+                if text:
+                    yield text
+                block = f.read(LOADER_BLOCK_BYTES)
+
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+
+def iter_text(data: bytes, budget: Optional[ByteBudget] = None,
+              max_file_bytes: int = MAX_FILE_BYTES) -> Iterator[str]:
+    """Stream the decoded text of a file already in memory in blocks, as iter_document.
+
+    Args:
+        data: Content of the file, e.g. a git blob
+        budget: Optional per-repository byte budget to charge the file against
+        max_file_bytes: Maximum size of a single file
+
+    Yields:
+        Decoded text blocks
+
+    Raises:
+        SkippedFile: If the file is binary, too large or over budget
+    """
+    size = len(data)
+    if size > max_file_bytes:
+        raise SkippedFile(f"file is {size:,} bytes, larger than the {max_file_bytes:,} byte limit")
+    sample = data[:LOADER_SAMPLE_BYTES]
+    if is_binary(sample):
+        raise SkippedFile("file appears to be binary")
+    if budget is not None and not budget.consume(size):
+        raise SkippedFile(f"repository byte budget of {budget.max_bytes:,} bytes exhausted")
+
+    decoder = codecs.getincrementaldecoder(detect_encoding(sample))(errors="replace")
+    view = memoryview(data)
+    try:
+        for start in range(0, size, LOADER_BLOCK_BYTES):
+            text = decoder.decode(view[start:start + LOADER_BLOCK_BYTES])
+            if text:
+                yield text
+    finally:
+        view.release()
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
@@ -0,0 +1,259 @@
+import os
+import time
+import bisect
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Optional
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+# port of the Prometheus scrape endpoint, 0 disables it
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+METRICS_PREFIX = "github_rag_"
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "github-rag-ui")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """Monotonic counter with labels, exported in the Prometheus text format."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = METRICS_PREFIX + name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """Add to the counter of a label combination."""
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}_total{_format_labels(self.labels, key)} {value}"
+
+
+class Histogram:
+    """Histogram with labels and cumulative buckets, exported in the Prometheus text format."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = METRICS_PREFIX + name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels) -> None:
+        """Record an observation of a label combination."""
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = {key: (list(counts), count, total) for key, (counts, count, total) in self._values.items()}
+        for key, (counts, count, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(self.labels, key, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            bucket_labels = _format_labels(self.labels, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{bucket_labels} {count}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {total}"
+
+
+REGISTRY = []
+
+STAGE_SECONDS = Histogram("stage_seconds", "Duration of pipeline stages", ("stage",))
+INGEST_BATCH_SECONDS = Histogram("ingest_batch_seconds", "Duration of ingestion batches by phase", ("phase",))
+INGEST_FILES = Counter("ingest_files", "Files processed by ingestion", ("outcome",))
+INGEST_BYTES = Counter("ingest_bytes", "Bytes of stored files")
+INGEST_CHUNKS = Counter("ingest_chunks", "Chunks inserted into vector databases")
+EMBEDDED_TOKENS = Counter("embedded_tokens", "Tokens of chunks sent to the embedding model")
+DEDUP_FILES = Counter("dedup_files", "Files left out of embedding as duplicates or generated", ("reason",))
+EMBEDDING_CACHE = Counter("embedding_cache_documents", "Documents looked up in the embedding cache", ("result",))
+REPOSITORY_FILES = Histogram("repository_files", "Files of cloned repositories",
+                             buckets=(10, 100, 1000, 5000, 10000, 50000, 100000))
+TURN_SECONDS = Histogram("turn_seconds", "Duration of answered questions", ("cached",))
+TURN_STEP_SECONDS = Histogram("turn_step_seconds", "Duration of agent turn steps", ("step_type",))
+TURN_INFERENCE_ITERATIONS = Histogram("turn_inference_iterations", "Inference steps per agent turn",
+                                      buckets=(1, 2, 3, 4, 5, 6, 8, 10))
+TOOL_CALLS = Counter("tool_calls", "Tool calls made by agents", ("tool",))
+ANSWER_TOKENS = Counter("answer_tokens", "Tokens of streamed answers")
+TURN_ERRORS = Counter("turn_errors", "Agent turns that ended with an error")
+CONVERSATION_COMPACTIONS = Counter("conversation_compactions", "Session histories folded into a summary", ("reason",))
+VECTOR_DB_EVICTIONS = Counter("vector_db_evictions", "Vector databases unregistered by the lifecycle manager", ("reason",))
+
+
+def render() -> str:
+    """Render every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        name = metric.name + ("_total" if metric.kind == "counter" else "")
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> None:
+    """Serve /metrics for Prometheus on a background thread, once per process.
+
+    Args:
+        port: Port to listen on; 0 disables the endpoint
+    """
+    global _server
+    if not port:
+        return
+    with _server_lock:
+        if _server is not None:
+            return
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        except OSError as e:
+            print(f"Warning: Could not serve metrics on port {port}: {e}")
+            _server = False
+            return
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        print(f"Serving Prometheus metrics on port {port}")
+
+
+def _configure_tracing() -> Optional[object]:
+    """Return the OpenTelemetry tracer, exporting over OTLP if an endpoint is configured."""
+    if trace is None:
+        return None
+    if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") or os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT"):
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError as e:
+            print(f"Warning: OpenTelemetry SDK or OTLP exporter not installed, not exporting traces: {e}")
+        else:
+            provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            trace.set_tracer_provider(provider)
+    return trace.get_tracer("github-rag")
+
+
+tracer = _configure_tracing()
+
+
+class _NoSpan:
+    """Stand-in for an OpenTelemetry span when tracing is not available."""
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+
+@contextlib.contextmanager
+def span(stage: str, **attributes) -> Iterator[object]:
+    """Time a pipeline stage into STAGE_SECONDS and trace it as an OpenTelemetry span.
+
+    Spans nest along the call stack of the current thread.
+
+    Args:
+        stage: Name of the stage, e.g. 'clone' or 'embed'
+        **attributes: Span attributes
+
+    Yields:
+        The span, for setting attributes known only at the end of the stage
+    """
+    start = time.perf_counter()
+    try:
+        if tracer is None:
+            yield _NoSpan()
+        else:
+            with tracer.start_as_current_span(stage, attributes=attributes) as current:
+                yield current
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def record_ingest_batch(report: dict) -> None:
+    """Record the timings and file counts of an ingestion batch report from ingest_files()."""
+    read = report.get("read_elapsed", 0.0)
+    INGEST_BATCH_SECONDS.observe(read, phase="read")
+    INGEST_BATCH_SECONDS.observe(report["elapsed"] - read, phase="insert")
+    INGEST_BATCH_SECONDS.observe(report["elapsed"], phase="total")
+    INGEST_FILES.inc(report["stored"], outcome="stored")
+    INGEST_FILES.inc(len(report["failed"]), outcome="failed")
+    INGEST_BYTES.inc(report["bytes"])
+
+
+def record_turn_steps(turn) -> None:
+    """Record the step durations and inference iterations of a completed agent turn.
+
+    Args:
+        turn: Turn of a turn_complete event, with steps carrying step_type,
+              started_at and completed_at
+    """
+    iterations = 0
+    for step in getattr(turn, "steps", None) or []:
+        step_type = getattr(step, "step_type", "unknown")
+        if step_type == "inference":
+            iterations += 1
+        started, completed = getattr(step, "started_at", None), getattr(step, "completed_at", None)
+        if started is not None and completed is not None and hasattr(completed, "timestamp"):
+            TURN_STEP_SECONDS.observe(max(0.0, completed.timestamp() - started.timestamp()), step_type=step_type)
+    if iterations:
+        TURN_INFERENCE_ITERATIONS.observe(iterations)
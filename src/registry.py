@@ -0,0 +1,314 @@
+import os
+import re
+import asyncio
+import hashlib
+import threading
+import uuid
+from typing import Optional
+
+# seconds a session waits for another session to build the index it asked for
+REGISTRY_WAIT_TIMEOUT = float(os.getenv("REGISTRY_WAIT_TIMEOUT", "3600"))
+# prefix of the vector database ids of this deployment, e.g. its release name, so the orphan
+# sweep of lifecycle.py can tell them from those of other deployments on the same LlamaStack server
+VECTOR_DB_ID_PREFIX = re.sub(r"[^a-z0-9]+", "_", os.getenv("VECTOR_DB_ID_PREFIX", "").lower()).strip("_")
+
+
+def normalize_repo_url(link: str) -> str:
+    """Normalize a repository URL so that equivalent links map to the same repository.
+
+    Handles scp-style SSH links, http vs https, letter case of the host,
+    trailing slashes and a trailing '.git'.
+
+    Args:
+        link: Repository URL as entered by the user
+
+    Returns:
+        Normalized https URL
+    """
+    url = link.strip()
+    match = re.match(r"^(?:ssh://)?git@([^:/]+)[:/](.+)$", url)
+    if match:
+        url = f"https://{match.group(1)}/{match.group(2)}"
+    url = re.sub(r"^http://", "https://", url)
+    url = url.rstrip("/")
+    if url.endswith(".git"):
+        url = url[:-4]
+
+    match = re.match(r"^(https://)([^/]+)(.*)$", url)
+    if match:
+        url = f"{match.group(1)}{match.group(2).lower()}{match.group(3)}"
+    return url
+
+
+def repository_name(link: str) -> str:
+    """Short name of a repository for display and filtering, e.g. 'owner/name'.
+
+    Args:
+        link: Repository URL
+
+    Returns:
+        The last two path components of the normalized URL
+    """
+    return "/".join(normalize_repo_url(link).split("/")[-2:])
+
+
+def new_vector_db_id(digest: str = "") -> str:
+    """Generate a unique vector database id: 'v', VECTOR_DB_ID_PREFIX and '_' if set, and 32 hex digits.
+
+    Args:
+        digest: Hex digest whose first 24 digits start the id, so ids of the
+            same registry key are recognizable, or '' for a random id
+    """
+    unique = f"{digest[:24]}{uuid.uuid4().hex[:8]}" if digest else uuid.uuid4().hex
+    return f"v{VECTOR_DB_ID_PREFIX}_{unique}" if VECTOR_DB_ID_PREFIX else f"v{unique}"
+
+
+def make_key(link: str, commit_sha: str, chunk_config: tuple, embedding_model: str) -> tuple:
+    """Build the registry key identifying an index of a repository.
+
+    Args:
+        link: Repository URL
+        commit_sha: Commit the index was built from
+        chunk_config: Tuple of the parameters used to chunk documents
+        embedding_model: Identifier of the embedding model
+
+    Returns:
+        Hashable key
+    """
+    return (normalize_repo_url(link), commit_sha, tuple(chunk_config), embedding_model)
+
+
+class RegistryEntry:
+    """A vector database shared by every session asking about the same repository commit.
+
+    Attributes:
+        key (tuple): Registry key from make_key()
+        vector_db_id (str): Identifier of the shared vector database
+        refcount (int): Number of sessions attached to the database
+        doc_id_to_filename (dict): Mapping of document IDs to filenames
+        diagram (RepositoryDiagram): Diagram of the repository
+        summary (dict): Ingestion summary from the session that built the index
+        documents (dict): Mapping of relative paths to embedding cache keys
+        lexical (Optional[LexicalIndex]): Lexical index of the chunks
+        symbols (Optional[SymbolIndex]): Symbol index of the source files
+        duplicates (dict): Mapping of relative paths of stored documents to
+            their duplicates, which were not embedded
+        evicted (bool): Whether the lifecycle manager unregistered the database
+    """
+
+    def __init__(self, key: tuple):
+        """Initialize an entry whose index has not been built yet.
+
+        Args:
+            key: Registry key from make_key()
+        """
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        self.key = key
+        self.vector_db_id = new_vector_db_id(digest)
+        self.refcount = 0
+        self.doc_id_to_filename = {}
+        self.diagram = None
+        self.summary = None
+        self.documents = {}
+        self.lexical = None
+        self.symbols = None
+        self.duplicates = {}
+        self.evicted = False
+        self.error = None
+        self._ready = threading.Event()
+        self._waiters_lock = threading.Lock()
+        self._waiters = []
+
+    def wait(self, timeout: Optional[float] = REGISTRY_WAIT_TIMEOUT) -> None:
+        """Block until the index is built.
+
+        Args:
+            timeout: Maximum number of seconds to wait, or None to wait forever
+
+        Raises:
+            RuntimeError: If building the index failed or timed out
+        """
+        if not self._ready.wait(timeout):
+            raise RuntimeError("Timed out waiting for repository to be processed")
+        self._raise_error()
+
+    async def wait_async(self, timeout: Optional[float] = REGISTRY_WAIT_TIMEOUT) -> None:
+        """Wait until the index is built without blocking the event loop, as wait().
+
+        The waiting coroutine holds no thread: the entry resolves a future
+        on the waiter's loop once the index is published or failed.
+
+        Raises:
+            RuntimeError: If building the index failed or timed out
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._waiters_lock:
+            ready = self._ready.is_set()
+            if not ready:
+                self._waiters.append((loop, future))
+        if not ready:
+            try:
+                await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                raise RuntimeError("Timed out waiting for repository to be processed") from None
+            finally:
+                with self._waiters_lock:
+                    if (loop, future) in self._waiters:
+                        self._waiters.remove((loop, future))
+        self._raise_error()
+
+    def _raise_error(self) -> None:
+        """Raise the error that stopped the build of the index, if any."""
+        if self.error is not None:
+            raise RuntimeError(f"Processing repository failed: {self.error}")
+
+    def _set_ready(self) -> None:
+        """Mark the entry as built or failed and wake up the threads and coroutines waiting for it."""
+        with self._waiters_lock:
+            self._ready.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                # the waiter's loop is closed, nobody is waiting anymore
+                pass
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class VectorDBRegistry:
+    """Maps (repository, commit, chunking config, embedding model) to a shared vector database.
+
+    The first session asking for a key builds the index; later sessions attach
+    to it and wait until it is ready. Entries are reference counted so the
+    vector database can be unregistered once no session uses it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def acquire(self, key: tuple) -> tuple[RegistryEntry, bool]:
+        """Take a reference to the entry of a key, creating it if needed.
+
+        Args:
+            key: Registry key from make_key()
+
+        Returns:
+            Tuple of (entry, owner) where owner is True if the caller created
+            the entry and must build the index, then call publish() or fail()
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = RegistryEntry(key)
+                self._entries[key] = entry
+            entry.refcount += 1
+            return entry, owner
+
+    def retain(self, entry: RegistryEntry) -> bool:
+        """Take another reference to an entry whose index is built and still registered.
+
+        Args:
+            entry: Entry the caller already holds a reference to
+
+        Returns:
+            False if the entry failed, was evicted or was released by its last session
+        """
+        with self._lock:
+            if self._entries.get(entry.key) is not entry or not entry._ready.is_set() or entry.error is not None:
+                return False
+            entry.refcount += 1
+            return True
+
+    def contains(self, key: tuple) -> bool:
+        """Return whether an index of a key is built or being built."""
+        with self._lock:
+            return key in self._entries
+
+    def publish(
+        self,
+        entry: RegistryEntry,
+        doc_id_to_filename: dict,
+        diagram,
+        summary: Optional[dict] = None,
+        documents: Optional[dict] = None,
+        lexical=None,
+        symbols=None,
+        duplicates: Optional[dict] = None,
+    ) -> None:
+        """Mark the index of an entry as built and wake up waiting sessions.
+
+        Args:
+            entry: Entry returned by acquire()
+            doc_id_to_filename: Mapping of document IDs to filenames
+            diagram: RepositoryDiagram of the repository
+            summary: Ingestion summary
+            documents: Mapping of relative paths to embedding cache keys
+            lexical: LexicalIndex of the chunks
+            symbols: SymbolIndex of the source files
+            duplicates: Mapping of relative paths of stored documents to their duplicates
+        """
+        entry.doc_id_to_filename = doc_id_to_filename
+        entry.diagram = diagram
+        entry.summary = summary
+        entry.documents = documents or {}
+        entry.lexical = lexical
+        entry.symbols = symbols
+        entry.duplicates = duplicates or {}
+        entry._set_ready()
+
+    def fail(self, entry: RegistryEntry, error: Exception) -> None:
+        """Drop an entry whose index could not be built and wake up waiting sessions.
+
+        Args:
+            entry: Entry returned by acquire()
+            error: The error that stopped the build
+        """
+        with self._lock:
+            if self._entries.get(entry.key) is entry:
+                del self._entries[entry.key]
+        entry.error = error
+        entry._set_ready()
+
+    def release(self, entry: RegistryEntry) -> bool:
+        """Drop a reference to an entry.
+
+        Args:
+            entry: Entry returned by acquire()
+
+        Returns:
+            True if this was the last reference and the caller should
+            unregister the vector database
+        """
+        with self._lock:
+            entry.refcount -= 1
+            if entry.refcount > 0:
+                return False
+            if self._entries.get(entry.key) is entry:
+                del self._entries[entry.key]
+            return entry.error is None and not entry.evicted
+
+    def evict(self, vector_db_id: str) -> None:
+        """Drop the entry of a vector database the lifecycle manager unregistered.
+
+        Sessions still attached to it keep their reference, but new sessions
+        asking for the same key build a new index.
+
+        Args:
+            vector_db_id: Identifier of the unregistered database
+        """
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.vector_db_id == vector_db_id:
+                    entry.evicted = True
+                    del self._entries[key]
+
+
+registry = VectorDBRegistry()
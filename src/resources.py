@@ -0,0 +1,153 @@
+import os
+import time
+import threading
+from typing import Optional
+
+import httpx
+from llama_stack_client import AsyncLlamaStackClient, LlamaStackClient
+
+LLAMA_STACK_ENDPOINT = os.getenv("LLAMA_STACK_ENDPOINT", "http://localhost:8321")
+
+# explicit resource ids skip discovery through the LlamaStack API
+LLM_MODEL_ID = os.getenv("LLM_MODEL_ID", "")
+EMBEDDING_MODEL_ID = os.getenv("EMBEDDING_MODEL_ID", "")
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "0"))
+VECTOR_IO_PROVIDER_ID = os.getenv("VECTOR_IO_PROVIDER_ID", "")
+
+RESOURCE_CACHE_TTL = float(os.getenv("RESOURCE_CACHE_TTL", "300"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "64"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "16"))
+
+
+class ResourceResolver:
+    """Lazily created LlamaStack clients and discovered model and provider ids.
+
+    Nothing is contacted until a client or id is first needed, so importing
+    the app does not depend on the LlamaStack server being up. The clients
+    share pooled HTTP connections across all sessions. The model and
+    provider lists are fetched once and cached for RESOURCE_CACHE_TTL
+    seconds; ids given through the environment are used without any
+    discovery at all.
+    """
+
+    def __init__(
+        self,
+        endpoint: str = LLAMA_STACK_ENDPOINT,
+        llm_id: str = LLM_MODEL_ID,
+        embedding_model_id: str = EMBEDDING_MODEL_ID,
+        embedding_dimension: int = EMBEDDING_DIMENSION,
+        vector_io_provider_id: str = VECTOR_IO_PROVIDER_ID,
+        ttl: float = RESOURCE_CACHE_TTL,
+    ):
+        """Initialize the resolver without contacting the server.
+
+        Args:
+            endpoint: Base URL of the LlamaStack server
+            llm_id: LLM to use, or "" to use the first one the server lists
+            embedding_model_id: Embedding model to use, or "" to use the first one the server lists
+            embedding_dimension: Dimension of the embedding model, or 0 to read it from the model metadata
+            vector_io_provider_id: vector_io provider to use, or "" to use the first one the server lists
+            ttl: Seconds the discovered model and provider lists are reused
+        """
+        self.endpoint = endpoint
+        self.ttl = ttl
+        self._llm_id = llm_id
+        self._embedding_model_id = embedding_model_id
+        self._embedding_dimension = embedding_dimension
+        self._vector_io_provider_id = vector_io_provider_id
+        self._lock = threading.Lock()
+        self._discovery_lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+        self._models = None
+        self._models_fetched = 0.0
+        self._providers = None
+        self._providers_fetched = 0.0
+
+    @staticmethod
+    def _limits() -> httpx.Limits:
+        """Connection pool limits shared by both clients."""
+        return httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        )
+
+    def client(self) -> LlamaStackClient:
+        """Return the shared synchronous client, creating it on first use."""
+        with self._lock:
+            if self._client is None:
+                self._client = LlamaStackClient(
+                    base_url=self.endpoint,
+                    http_client=httpx.Client(limits=self._limits()),
+                )
+            return self._client
+
+    def async_client(self) -> AsyncLlamaStackClient:
+        """Return the shared async client, creating it on first use.
+
+        The client's connection pool belongs to the event loop it is first
+        used on, so it must only be used from that loop.
+        """
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = AsyncLlamaStackClient(
+                    base_url=self.endpoint,
+                    http_client=httpx.AsyncClient(limits=self._limits()),
+                )
+            return self._async_client
+
+    def models(self) -> list:
+        """Return the models registered with the server, cached for the TTL."""
+        client = self.client()
+        with self._discovery_lock:
+            if self._models is None or time.monotonic() - self._models_fetched > self.ttl:
+                self._models = list(client.models.list())
+                self._models_fetched = time.monotonic()
+            return self._models
+
+    def providers(self) -> list:
+        """Return the providers configured on the server, cached for the TTL."""
+        client = self.client()
+        with self._discovery_lock:
+            if self._providers is None or time.monotonic() - self._providers_fetched > self.ttl:
+                self._providers = list(client.providers.list())
+                self._providers_fetched = time.monotonic()
+            return self._providers
+
+    def _first_model(self, model_type: str) -> object:
+        """Return the first registered model of a type, e.g. 'llm' or 'embedding'."""
+        try:
+            return next(m for m in self.models() if m.model_type == model_type)
+        except StopIteration:
+            raise LookupError(f"LlamaStack server at {self.endpoint} has no {model_type} model") from None
+
+    def llm_id(self) -> str:
+        """Return the identifier of the LLM answering questions."""
+        return self._llm_id or self._first_model("llm").identifier
+
+    def embedding_model_id(self) -> str:
+        """Return the identifier of the embedding model."""
+        return self._embedding_model_id or self._first_model("embedding").identifier
+
+    def embedding_dimension(self) -> int:
+        """Return the dimension of the embedding model's vectors."""
+        if self._embedding_dimension:
+            return self._embedding_dimension
+        model_id = self.embedding_model_id()
+        model: Optional[object] = next((m for m in self.models() if m.identifier == model_id), None)
+        if model is None:
+            raise LookupError(f"Embedding model {model_id} is not registered with {self.endpoint}")
+        return int(model.metadata["embedding_dimension"])
+
+    def vector_io_provider_id(self) -> str:
+        """Return the identifier of the vector_io provider storing the vector databases."""
+        if self._vector_io_provider_id:
+            return self._vector_io_provider_id
+        try:
+            return next(p.provider_id for p in self.providers() if p.api == "vector_io")
+        except StopIteration:
+            raise LookupError(f"LlamaStack server at {self.endpoint} has no vector_io provider") from None
+
+
+# Global shared resources (not user-specific)
+resources = ResourceResolver()
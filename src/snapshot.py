@@ -0,0 +1,323 @@
+import os
+import glob
+import json
+import shutil
+import hashlib
+import tempfile
+from typing import Callable, Optional
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from chunking import count_tokens
+from github import RepositoryDiagram, tree_from_json, tree_to_json
+from lexical import LexicalIndex
+from metrics import span
+
+# directory of index snapshots, e.g. on a persistent volume; empty disables automatic snapshots
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "")
+# storage type of the embeddings: 'float16', or 'int8' with a scale per chunk
+SNAPSHOT_DTYPE = os.getenv("SNAPSHOT_DTYPE", "float16")
+# documents whose embeddings are read from the embedding cache, or embedded again, at once
+SNAPSHOT_EXPORT_BATCH_DOCS = int(os.getenv("SNAPSHOT_EXPORT_BATCH_DOCS", "64"))
+
+SNAPSHOT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+LEXICAL_FILE = "lexical.idx"
+EMBEDDINGS_FILE = "embeddings.npy"
+SCALES_FILE = "scales.npy"
+TOKEN_COUNTS_FILE = "token_counts.npy"
+
+
+def snapshot_path(key: tuple, directory: str = SNAPSHOT_DIR) -> str:
+    """Return the directory of the snapshot of an index.
+
+    The snapshots of all commits of a repository share a prefix, so that
+    those of older commits can be found and dropped.
+
+    Args:
+        key: Registry key of the index, see registry.make_key()
+        directory: Directory holding the snapshots
+
+    Returns:
+        Path of the snapshot directory
+    """
+    repo_url, commit_sha, chunk_config, embedding_model = key
+    digest = hashlib.sha256(repr((repo_url, tuple(chunk_config), embedding_model)).encode()).hexdigest()
+    return os.path.join(directory, f"{digest[:24]}-{commit_sha}")
+
+
+def quantize(rows: np.ndarray, dtype: str) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """Convert float32 embeddings to the storage type of a snapshot.
+
+    Args:
+        rows: Embeddings, one per row
+        dtype: 'float16', or 'int8' for symmetric quantization with a scale per row
+
+    Returns:
+        The converted rows and, for int8, the scale of every row
+
+    Raises:
+        ValueError: If the storage type is not supported
+    """
+    if dtype == "float16":
+        return rows.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(rows).max(axis=1) / 127
+        scales[scales == 0] = 1
+        return np.round(rows / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"Unsupported snapshot dtype {dtype!r}, use 'float16' or 'int8'")
+
+
+def line_range(label: str) -> dict:
+    """Parse a line range formatted by agent.lines_label(), e.g. '10-42', into 'start_line' and 'end_line' keys."""
+    if not label:
+        return {}
+    start, _, end = label.partition("-")
+    return {"start_line": int(start), "end_line": int(end or start)}
+
+
+def write_snapshot(
+    path: str,
+    agent,
+    embed: Callable[[list[dict]], list[list[dict]]],
+    key: tuple,
+    dtype: str = SNAPSHOT_DTYPE,
+) -> str:
+    """Write the index of an agent to a snapshot directory.
+
+    The chunks and their metadata are taken from the lexical index, which
+    holds every chunk inserted into the vector database, in insertion order,
+    and is saved as is. Their embeddings are looked up in the embedding
+    cache by document; documents that fell out of the cache are embedded
+    again. Embeddings are stored as a float16 or int8 .npy array that the
+    restore memory-maps. The directory is written next to path and renamed
+    into place, replacing an older snapshot.
+
+    Args:
+        path: Snapshot directory to write
+        agent: GithubAgent or AsyncGithubAgent holding the index
+        embed: Function embedding documents as GithubAgent._embed_documents
+        key: Registry key of the index, see registry.make_key()
+        dtype: Storage type of the embeddings, see quantize()
+
+    Returns:
+        The path of the snapshot
+
+    Raises:
+        ValueError: If the index is empty or does not match the embedding cache
+    """
+    lexical = agent.lexical_index
+    count = len(lexical)
+    if not count:
+        raise ValueError("Cannot snapshot an empty index")
+    # chunk ids of every document, in the order its chunks were inserted
+    chunk_ids = {}
+    for chunk_id in range(count):
+        chunk_ids.setdefault(lexical.chunk(chunk_id)[1]["file"], []).append(chunk_id)
+
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix=".snapshot-", dir=parent)
+    try:
+        embeddings = scales = None
+        token_counts = np.zeros(count, dtype=np.int32)
+        documents = list(chunk_ids.items())
+        for start in range(0, len(documents), SNAPSHOT_EXPORT_BATCH_DOCS):
+            batch = documents[start:start + SNAPSHOT_EXPORT_BATCH_DOCS]
+            prepared = []
+            for relpath, ids in batch:
+                chunks = []
+                for chunk_id in ids:
+                    content, metadata = lexical.chunk(chunk_id)
+                    chunks.append({"content": content, "token_count": count_tokens(content),
+                                   **line_range(metadata.get("lines", ""))})
+                prepared.append({"key": agent.documents[relpath], "chunks": chunks})
+
+            for (relpath, ids), document_chunks in zip(batch, embed(prepared)):
+                if len(document_chunks) != len(ids):
+                    raise ValueError(f"Cached chunks of {relpath} do not match the indexed chunks")
+                rows = np.asarray([chunk["embedding"] for chunk in document_chunks], dtype=np.float32)
+                values, row_scales = quantize(rows, dtype)
+                if embeddings is None:
+                    embeddings = open_memmap(os.path.join(tmp_path, EMBEDDINGS_FILE), mode="w+",
+                                             dtype=values.dtype, shape=(count, rows.shape[1]))
+                    if row_scales is not None:
+                        scales = open_memmap(os.path.join(tmp_path, SCALES_FILE), mode="w+",
+                                             dtype=np.float32, shape=(count,))
+                embeddings[ids] = values
+                if scales is not None:
+                    scales[ids] = row_scales
+                token_counts[ids] = [chunk["token_count"] for chunk in document_chunks]
+
+        dimension = embeddings.shape[1]
+        embeddings.flush()
+        del embeddings
+        if scales is not None:
+            scales.flush()
+            del scales
+        np.save(os.path.join(tmp_path, TOKEN_COUNTS_FILE), token_counts)
+        lexical.save(os.path.join(tmp_path, LEXICAL_FILE))
+        # the manifest is written last: a snapshot without one is incomplete
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "key": [key[0], key[1], list(key[2]), key[3]],
+            "dtype": dtype,
+            "dimension": dimension,
+            "chunks": count,
+            "doc_id_to_filename": agent.doc_id_to_filename,
+            "documents": agent.documents,
+            "duplicates": agent.duplicates,
+            "summary": agent.ingest_summary,
+            "diagram": tree_to_json(agent.diagram.root_node) if agent.diagram is not None else None,
+        }
+        with open(os.path.join(tmp_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return path
+
+
+class Snapshot:
+    """An index snapshot written by write_snapshot(), with its embeddings memory-mapped.
+
+    Attributes:
+        path (str): Snapshot directory
+        key (tuple): Registry key of the index
+        dimension (int): Dimension of the embeddings
+        doc_id_to_filename (dict): Mapping of document IDs to filenames
+        documents (dict): Mapping of relative paths to embedding cache keys
+        duplicates (dict): Mapping of relative paths to their duplicates, which were not embedded
+        summary (Optional[dict]): Summary of the ingestion that built the index
+        diagram (Optional[RepositoryDiagram]): Diagram of the repository
+        lexical (LexicalIndex): Lexical index holding the chunks and their metadata
+    """
+
+    def __init__(self, path: str):
+        """Open a snapshot.
+
+        Args:
+            path: Snapshot directory
+
+        Raises:
+            ValueError: If the snapshot is incomplete or of another version
+            OSError: If its files cannot be read
+        """
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} is a snapshot of version {manifest.get('version')}, not {SNAPSHOT_VERSION}")
+        self.path = path
+        repo_url, commit_sha, chunk_config, embedding_model = manifest["key"]
+        self.key = (repo_url, commit_sha, tuple(chunk_config), embedding_model)
+        self.dimension = manifest["dimension"]
+        self.doc_id_to_filename = manifest["doc_id_to_filename"]
+        self.documents = manifest["documents"]
+        self.duplicates = manifest["duplicates"]
+        self.summary = manifest["summary"]
+        self.diagram = RepositoryDiagram(tree_from_json(manifest["diagram"])) if manifest["diagram"] else None
+        self.lexical = LexicalIndex.load(os.path.join(path, LEXICAL_FILE))
+        self._embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        scales_path = os.path.join(path, SCALES_FILE)
+        self._scales = np.load(scales_path, mmap_mode="r") if os.path.exists(scales_path) else None
+        self._token_counts = np.load(os.path.join(path, TOKEN_COUNTS_FILE))
+        if not len(self._embeddings) == len(self._token_counts) == len(self.lexical) == manifest["chunks"]:
+            raise ValueError(f"{path} is incomplete")
+
+        self._chunk_ids = {}
+        self._sizes = {}
+        for chunk_id in range(len(self.lexical)):
+            content, metadata = self.lexical.chunk(chunk_id)
+            self._chunk_ids.setdefault(metadata["file"], []).append(chunk_id)
+            self._sizes[metadata["file"]] = self._sizes.get(metadata["file"], 0) + len(content) + 4 * self.dimension
+
+    def files(self) -> list[str]:
+        """Return the relative paths of the documents, in the order they were inserted."""
+        return list(self._chunk_ids)
+
+    def size_of(self, relpath: str) -> int:
+        """Return the approximate bytes of the chunks and float32 embeddings of a document."""
+        return self._sizes.get(relpath, 0)
+
+    def chunks(self, relpath: str) -> list[dict]:
+        """Read the chunks of a document.
+
+        Args:
+            relpath: Relative path of the document
+
+        Returns:
+            The chunks as dicts with 'content', 'metadata', 'token_count'
+            and float32 'embedding' keys
+        """
+        ids = self._chunk_ids[relpath]
+        rows = np.asarray(self._embeddings[ids], dtype=np.float32)
+        if self._scales is not None:
+            rows *= self._scales[ids][:, None]
+        chunks = []
+        for chunk_id, row in zip(ids, rows.tolist()):
+            content, metadata = self.lexical.chunk(chunk_id)
+            chunks.append({"content": content, "metadata": metadata,
+                           "token_count": int(self._token_counts[chunk_id]), "embedding": row})
+        return chunks
+
+
+def open_snapshot(key: tuple, directory: str = SNAPSHOT_DIR) -> Optional[Snapshot]:
+    """Open the snapshot of an index, if snapshots are enabled and there is one.
+
+    Args:
+        key: Registry key of the index
+        directory: Directory holding the snapshots, empty if disabled
+
+    Returns:
+        The snapshot, or None if there is none or it cannot be read
+    """
+    if not directory:
+        return None
+    path = snapshot_path(key, directory)
+    if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        return None
+    try:
+        with span("open_snapshot"):
+            snapshot = Snapshot(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: Could not read snapshot {path}, ingesting the repository instead: {e}")
+        return None
+    if snapshot.key != tuple(key):
+        print(f"Warning: Snapshot {path} is of another index, ingesting the repository instead")
+        return None
+    return snapshot
+
+
+def save_snapshot(agent, key: tuple, directory: str = SNAPSHOT_DIR) -> Optional[str]:
+    """Export the index of an agent to the snapshot directory, dropping snapshots of older commits.
+
+    Failures are logged and ignored, the index itself is not affected.
+
+    Args:
+        agent: GithubAgent or AsyncGithubAgent holding the index, with an export_snapshot() method
+        key: Registry key of the index
+        directory: Directory holding the snapshots, empty if disabled
+
+    Returns:
+        The path of the snapshot, or None if none was written
+    """
+    if not directory:
+        return None
+    path = snapshot_path(key, directory)
+    try:
+        with span("export_snapshot"):
+            agent.export_snapshot(path)
+    except Exception as e:
+        print(f"Warning: Could not write snapshot {path}: {e}")
+        return None
+    prefix = os.path.basename(path).rsplit("-", 1)[0]
+    for older in glob.glob(os.path.join(directory, f"{prefix}-*")):
+        if older != path:
+            shutil.rmtree(older, ignore_errors=True)
+    print(f"Saved snapshot of {key[0]}@{key[1]} to {path}")
+    return path
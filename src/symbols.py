@@ -0,0 +1,234 @@
+import os
+import re
+import ast
+import sys
+import threading
+
+SYMBOL_MAX_RESULTS = int(os.getenv("SYMBOL_MAX_RESULTS", "20"))
+
+# definitions in languages without a parser here: (kind, pattern with a 'name' group)
+C_LIKE_DEFINITIONS = [
+    ("class", r"^\s*(?:(?:public|private|protected|internal|abstract|final|static|sealed|partial|export|default|data|open)\s+)*"
+              r"(?:class|interface|enum|struct|record|trait|object)\s+(?P<name>[A-Za-z_]\w*)"),
+    ("function", r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*(?P<name>[A-Za-z_$][\w$]*)"),
+    ("function", r"^\s*(?:export\s+)?(?:const|let|var)\s+(?P<name>[A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?"
+                 r"(?:function\b|\([^)]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>)"),
+    ("method", r"^\s*(?:(?:public|private|protected|internal|static|final|abstract|override|virtual|async|synchronized|inline)\s+)+"
+               r"[\w<>\[\],.? ]*?\b(?P<name>[A-Za-z_]\w*)\s*\([^;]*$"),
+    ("function", r"^(?:[A-Za-z_][\w:<>,*& ]*\s+)+\**(?P<name>[A-Za-z_]\w*)\s*\([^;]*$"),
+]
+SYMBOL_PATTERNS = {
+    "c_like": C_LIKE_DEFINITIONS,
+    "go": [
+        ("function", r"^func\s+(?:\([^)]*\)\s*)?(?P<name>[A-Za-z_]\w*)\s*[(\[]"),
+        ("type", r"^type\s+(?P<name>[A-Za-z_]\w*)\s"),
+    ],
+    "rust": [
+        ("function", r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:const\s+)?(?:async\s+)?(?:unsafe\s+)?fn\s+(?P<name>[A-Za-z_]\w*)"),
+        ("type", r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:struct|enum|trait|type|union|mod)\s+(?P<name>[A-Za-z_]\w*)"),
+        ("macro", r"^\s*macro_rules!\s*(?P<name>[A-Za-z_]\w*)"),
+    ],
+    "ruby": [
+        ("function", r"^\s*def\s+(?:self\.)?(?P<name>[A-Za-z_]\w*[?!=]?)"),
+        ("class", r"^\s*(?:class|module)\s+(?P<name>[A-Z]\w*)"),
+    ],
+    "php": [
+        ("function", r"^\s*(?:(?:public|private|protected|static|abstract|final)\s+)*function\s+&?(?P<name>[A-Za-z_]\w*)"),
+        ("class", r"^\s*(?:(?:abstract|final)\s+)?(?:class|interface|trait|enum)\s+(?P<name>[A-Za-z_]\w*)"),
+    ],
+    "shell": [
+        ("function", r"^\s*(?:function\s+)?(?P<name>[A-Za-z_][\w-]*)\s*\(\)\s*\{?"),
+        ("function", r"^\s*function\s+(?P<name>[A-Za-z_][\w-]*)"),
+    ],
+}
+SYMBOL_LANGUAGES = {
+    **{extension: "c_like" for extension in (
+        ".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".java", ".kt", ".kts", ".scala", ".groovy",
+        ".swift", ".dart", ".c", ".h", ".cc", ".cpp", ".cxx", ".hpp", ".hh", ".cs", ".m", ".mm",
+    )},
+    ".go": "go",
+    ".rs": "rust",
+    ".rb": "ruby",
+    ".php": "php",
+    ".sh": "shell", ".bash": "shell", ".zsh": "shell",
+}
+COMPILED_PATTERNS = {
+    language: [(kind, re.compile(pattern)) for kind, pattern in patterns]
+    for language, patterns in SYMBOL_PATTERNS.items()
+}
+# control flow keywords the C-like function patterns would otherwise take for definitions
+NOT_SYMBOLS = frozenset("if for while switch catch return sizeof else new delete throw do case".split())
+
+
+def _signature(line: str) -> str:
+    """Shorten a definition line for display."""
+    line = line.strip()
+    return line if len(line) <= 160 else line[:157] + "..."
+
+
+def extract_python(text: str) -> tuple[list[tuple], list[tuple]]:
+    """Extract the definitions and call sites of Python source.
+
+    Args:
+        text: Python source
+
+    Returns:
+        (definitions, references): definitions as (name, kind, line,
+        signature) tuples with names qualified by their enclosing classes,
+        references as (name, line) tuples of called names. Both are empty if
+        the source does not parse.
+    """
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return [], []
+
+    lines = text.split("\n")
+    definitions = []
+    references = []
+    stack = [(tree, "", False)]
+    while stack:
+        node, prefix, in_class = stack.pop()
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                is_class = isinstance(child, ast.ClassDef)
+                kind = "class" if is_class else ("method" if in_class else "function")
+                definitions.append((prefix + child.name, kind, child.lineno, _signature(lines[child.lineno - 1])))
+                stack.append((child, f"{prefix}{child.name}.", is_class))
+            elif isinstance(child, (ast.Assign, ast.AnnAssign)) and node is tree:
+                targets = child.targets if isinstance(child, ast.Assign) else [child.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        definitions.append((target.id, "variable", child.lineno, _signature(lines[child.lineno - 1])))
+                stack.append((child, prefix, False))
+            else:
+                if isinstance(child, ast.Call):
+                    func = child.func
+                    if isinstance(func, ast.Name):
+                        references.append((func.id, child.lineno))
+                    elif isinstance(func, ast.Attribute):
+                        references.append((func.attr, child.lineno))
+                stack.append((child, prefix, in_class and not isinstance(child, ast.Lambda)))
+    return definitions, references
+
+
+def extract_with_patterns(text: str, language: str) -> list[tuple]:
+    """Extract definitions from source code with the regular expressions of a language.
+
+    Args:
+        text: Source code
+        language: Key of SYMBOL_PATTERNS
+
+    Returns:
+        Definitions as (name, kind, line, signature) tuples
+    """
+    patterns = COMPILED_PATTERNS[language]
+    definitions = []
+    for number, line in enumerate(text.split("\n"), start=1):
+        if not line or line.lstrip().startswith(("//", "#", "*", "/*")):
+            continue
+        for kind, pattern in patterns:
+            match = pattern.match(line)
+            if match and match.group("name") not in NOT_SYMBOLS:
+                definitions.append((match.group("name"), kind, number, _signature(line)))
+                break
+    return definitions
+
+
+def extract_symbols(relpath: str, text: str) -> tuple[list[tuple], list[tuple]]:
+    """Extract the definitions, and for Python the call sites, of a source file.
+
+    Args:
+        relpath: Path of the file, used to pick the extractor
+        text: Content of the file
+
+    Returns:
+        (definitions, references) as returned by extract_python; references
+        are only extracted for Python
+    """
+    extension = os.path.splitext(relpath)[1].lower()
+    if extension in (".py", ".pyi"):
+        return extract_python(text)
+    language = SYMBOL_LANGUAGES.get(extension)
+    if language is None:
+        return [], []
+    return extract_with_patterns(text, language), []
+
+
+class SymbolIndex:
+    """ctags-style table of symbol definitions and references with file and line.
+
+    Names are interned and locations refer to interned file paths, so the
+    table stays small. Lookups are dictionary hits on the full name and on
+    the last component of qualified names ('build_tree' finds
+    'Node.build_tree').
+    """
+
+    def __init__(self):
+        """Initialize an empty index."""
+        self._lock = threading.Lock()
+        self._definitions = {}
+        self._by_short_name = {}
+        self._references = {}
+        self._files = {}
+
+    def __len__(self) -> int:
+        return sum(len(locations) for locations in self._definitions.values())
+
+    def add_file(self, relpath: str, text: str) -> None:
+        """Index the symbols of a file.
+
+        Args:
+            relpath: Path of the file relative to the repository root
+            text: Content of the file
+        """
+        definitions, references = extract_symbols(relpath, text)
+        if not definitions and not references:
+            return
+        with self._lock:
+            relpath = self._files.setdefault(relpath, sys.intern(relpath))
+            for name, kind, line, signature in definitions:
+                name = sys.intern(name)
+                self._definitions.setdefault(name, []).append((kind, relpath, line, signature))
+                short_name = name.rsplit(".", 1)[-1]
+                if short_name != name:
+                    self._by_short_name.setdefault(sys.intern(short_name), []).append(name)
+            for name, line in references:
+                self._references.setdefault(sys.intern(name), []).append((relpath, line))
+
+    def find(self, name: str) -> list[dict]:
+        """Find the definitions of a symbol.
+
+        Args:
+            name: Plain or qualified name; matched case-insensitively if there
+                  is no exact match
+
+        Returns:
+            Definitions as dicts with 'name', 'kind', 'file', 'line' and 'signature' keys
+        """
+        with self._lock:
+            names = [name] if name in self._definitions else []
+            names += self._by_short_name.get(name, [])
+            if not names:
+                lowered = name.lower()
+                names = [n for n in self._definitions
+                         if n.lower() == lowered or n.rsplit(".", 1)[-1].lower() == lowered]
+            return [
+                {"name": n, "kind": kind, "file": relpath, "line": line, "signature": signature}
+                for n in dict.fromkeys(names)
+                for kind, relpath, line, signature in self._definitions[n]
+            ][:SYMBOL_MAX_RESULTS]
+
+    def references(self, name: str) -> list[dict]:
+        """Find the call sites of a symbol, by its last name component.
+
+        Args:
+            name: Plain or qualified name
+
+        Returns:
+            References as dicts with 'file' and 'line' keys
+        """
+        with self._lock:
+            locations = self._references.get(name.rsplit(".", 1)[-1], [])
+            return [{"file": relpath, "line": line} for relpath, line in sorted(locations)[:SYMBOL_MAX_RESULTS]]
+
@@ -0,0 +1,299 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from llama_stack_client.lib.agents.client_tool import ClientTool
+from llama_stack_client.types.tool_def_param import Parameter
+
+from lexical import LexicalIndex, reciprocal_rank_fusion
+from metrics import span
+from resources import resources
+from symbols import SymbolIndex
+
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+HYBRID_MAX_CHUNKS = int(os.getenv("HYBRID_MAX_CHUNKS", "5"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+
+# the format of builtin::rag/knowledge_search results, which the agent parses sources from
+RESULT_TEMPLATE = "Result {index}\nContent: {content}\nMetadata: {metadata}\n"
+
+
+class SourceRecordingTool(ClientTool):
+    """Client tool that records the sources it returned, for the agent to stream.
+
+    Client tools run inside the agent's turn loop, so their results do not
+    reach the caller as tool execution steps. The agent drains them with
+    pop_sources() while it streams the turn instead.
+    """
+
+    def __init__(self):
+        self._sources = []
+        self._sources_lock = threading.Lock()
+
+    def record_sources(self, sources: list[dict[str, str]]) -> None:
+        """Remember sources returned by a call of the tool."""
+        with self._sources_lock:
+            self._sources.extend(sources)
+
+    def pop_sources(self) -> list[dict[str, str]]:
+        """Return and forget the sources returned since the last call."""
+        with self._sources_lock:
+            sources, self._sources = self._sources, []
+            return sources
+
+
+class KnowledgeSearchTool(SourceRecordingTool):
+    """Hybrid replacement for builtin::rag/knowledge_search.
+
+    Runs the vector search of the LlamaStack vector database and a BM25
+    search of the local lexical index, and merges both rankings with
+    reciprocal rank fusion. Exact identifiers, config keys and error strings
+    are found by the lexical search even when their embeddings are not
+    close to the question.
+
+    An agent over several repositories searches the indexes of all of them,
+    or of the repository the model or the user restricts the search to.
+    """
+
+    def __init__(self, indexes: dict[str, tuple[str, LexicalIndex]]):
+        """Initialize the tool.
+
+        Args:
+            indexes: Mapping of repository names to the vector database and
+                lexical index of the repository; the single repository of an
+                agent may be named ''
+        """
+        super().__init__()
+        self.indexes = indexes
+        self.scope = None
+
+    def get_name(self) -> str:
+        return "knowledge_search"
+
+    def get_description(self) -> str:
+        description = ("Search the repository for relevant code and documentation. "
+                       "Works for natural language questions as well as exact names of functions, classes, "
+                       "config keys and error messages.")
+        if len(self.indexes) > 1:
+            description += " Searches all repositories unless one is given."
+        return description
+
+    def get_params_definition(self) -> dict[str, Parameter]:
+        params = {
+            "query": Parameter(
+                name="query",
+                parameter_type="string",
+                description="The query to search for",
+                required=True,
+            ),
+        }
+        if len(self.indexes) > 1:
+            params["repo"] = repo_parameter(self.indexes)
+        return params
+
+    @staticmethod
+    def _vector_results(response, repo: str) -> list[tuple[str, dict]]:
+        results = []
+        for chunk in response.chunks:
+            content = chunk.content if isinstance(chunk.content, str) else str(chunk.content)
+            results.append((content, {**(chunk.metadata or {}), "repo": repo}))
+        return results
+
+    def _fuse(self, query: str, repos: list[str], vector_results: list[list[tuple[str, dict]]]) -> dict:
+        """Fuse the vector and lexical results of the searched repositories into the tool response."""
+        lexical_results = [
+            [(content, {**metadata, "repo": repo}) for _, content, metadata in
+             self.indexes[repo][1].search(query, HYBRID_CANDIDATES)]
+            for repo in repos
+        ]
+        fused = reciprocal_rank_fusion(
+            vector_results + lexical_results,
+            key=lambda result: (result[1]["repo"], result[1].get("document_id"), result[1].get("lines"),
+                                result[0][:200]),
+        )[:HYBRID_MAX_CHUNKS]
+
+        results = []
+        sources = []
+        for index, (content, metadata) in enumerate(fused, start=1):
+            metadata = {name: metadata[name] for name in ("repo", "document_id", "file", "lines", "duplicates",
+                                                           "duplicate_count") if metadata.get(name)}
+            results.append(RESULT_TEMPLATE.format(index=index, content=content, metadata=metadata))
+            if "file" in metadata:
+                lines = metadata.get("lines")
+                source = {
+                    "file": os.path.join(metadata.get("repo", ""), os.path.basename(metadata["file"]))
+                            + (f":{lines}" if lines else ""),
+                    "text": content.strip(),
+                }
+                if "duplicates" in metadata:
+                    source["duplicates"] = [os.path.join(metadata.get("repo", ""), duplicate)
+                                            for duplicate in metadata["duplicates"]]
+                    source["duplicate_count"] = int(metadata.get("duplicate_count", len(metadata["duplicates"])))
+                sources.append(source)
+        self.record_sources(sources)
+
+        if not results:
+            return {"content": "No relevant results found in the repository."}
+        return {"content": f"knowledge_search found {len(results)} chunks:\n" + "\n".join(results)}
+
+    def run_impl(self, query: str, repo: Optional[str] = None) -> dict:
+        repos = select_repositories(self.indexes, repo, self.scope)
+        def search(name: str) -> list[tuple[str, dict]]:
+            response = resources.client().vector_io.query(
+                vector_db_id=self.indexes[name][0],
+                query=query,
+                params={"max_chunks": HYBRID_CANDIDATES},
+            )
+            return self._vector_results(response, name)
+
+        with span("knowledge_search", repositories=len(repos)):
+            if len(repos) == 1:
+                vector_results = [search(repos[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=min(len(repos), 8)) as pool:
+                    vector_results = list(pool.map(search, repos))
+            return self._fuse(query, repos, vector_results)
+
+    async def async_run_impl(self, query: str, repo: Optional[str] = None) -> dict:
+        repos = select_repositories(self.indexes, repo, self.scope)
+        with span("knowledge_search", repositories=len(repos)):
+            responses = await asyncio.gather(*(
+                resources.async_client().vector_io.query(
+                    vector_db_id=self.indexes[name][0],
+                    query=query,
+                    params={"max_chunks": HYBRID_CANDIDATES},
+                )
+                for name in repos
+            ))
+            vector_results = [self._vector_results(response, name) for name, response in zip(repos, responses)]
+            return await asyncio.to_thread(self._fuse, query, repos, vector_results)
+
+
+class FindSymbolTool(SourceRecordingTool):
+    """Looks up symbol definitions and call sites in the symbol index of a repository.
+
+    Runs entirely in the client: a lookup is a few dictionary hits, so the
+    agent can jump to a definition without a vector search round trip.
+    """
+
+    def __init__(self, symbol_indexes: dict[str, SymbolIndex]):
+        """Initialize the tool.
+
+        Args:
+            symbol_indexes: Mapping of repository names to their symbol
+                indexes, as the indexes of KnowledgeSearchTool
+        """
+        super().__init__()
+        self.symbol_indexes = symbol_indexes
+        self.scope = None
+
+    def get_name(self) -> str:
+        return "find_symbol"
+
+    def get_description(self) -> str:
+        return ("Find where a function, method, class, type or module-level variable of the repository is "
+                "defined, with file, line and signature, and where it is called.")
+
+    def get_params_definition(self) -> dict[str, Parameter]:
+        params = {
+            "name": Parameter(
+                name="name",
+                parameter_type="string",
+                description="Name of the symbol, e.g. 'load_repository' or 'GithubAgent.stream_query'",
+                required=True,
+            ),
+            "include_references": Parameter(
+                name="include_references",
+                parameter_type="boolean",
+                description="Whether to also list the places calling the symbol",
+                required=False,
+                default=False,
+            ),
+        }
+        if len(self.symbol_indexes) > 1:
+            params["repo"] = repo_parameter(self.symbol_indexes)
+        return params
+
+    def run_impl(self, name: str, include_references: bool = False, repo: Optional[str] = None) -> dict:
+        with span("find_symbol"):
+            return self._find(name, include_references, repo)
+
+    def _find(self, name: str, include_references: bool, repo: Optional[str]) -> dict:
+        name = name.strip().strip("`").rstrip("()")
+        repos = select_repositories(self.symbol_indexes, repo, self.scope)
+        definitions = [(r, d) for r in repos for d in self.symbol_indexes[r].find(name)]
+        lines = [f"{d['kind']} {d['name']} at {os.path.join(r, d['file'])}:{d['line']}: {d['signature']}"
+                 for r, d in definitions]
+        self.record_sources([
+            {"file": f"{os.path.join(r, os.path.basename(d['file']))}:{d['line']}", "text": d["signature"]}
+            for r, d in definitions
+        ])
+        if not lines:
+            lines.append(f"No definition of {name} found.")
+        # models sometimes pass booleans as strings
+        if str(include_references).lower() == "true":
+            references = [(r, ref) for r in repos for ref in self.symbol_indexes[r].references(name)]
+            lines.append(f"Called at {len(references)} places" + (":" if references else "."))
+            lines.extend(f"  {os.path.join(r, ref['file'])}:{ref['line']}" for r, ref in references)
+        return {"content": "\n".join(lines)}
+
+    async def async_run_impl(self, name: str, include_references: bool = False, repo: Optional[str] = None) -> dict:
+        return self.run_impl(name, include_references, repo)
+
+
+def repo_parameter(indexes: dict) -> Parameter:
+    """Build the optional parameter restricting a tool of a multi-repository agent to one repository."""
+    return Parameter(
+        name="repo",
+        parameter_type="string",
+        description="Repository to search, one of " + ", ".join(sorted(indexes)) + "; omit to search all of them",
+        required=False,
+        default="",
+    )
+
+
+def select_repositories(indexes: dict, repo: Optional[str], scope: Optional[str] = None) -> list[str]:
+    """Pick the repositories a tool call searches.
+
+    Args:
+        indexes: Indexes of the tool, keyed by repository name
+        repo: Repository the model asked for, matched case-insensitively
+            by full name or by the name without its owner; empty for all
+        scope: Repository the user restricted the search to, which takes
+            precedence over the model's choice
+
+    Returns:
+        Names of the repositories to search, all of them if repo matches none
+    """
+    for wanted in (scope, repo):
+        wanted = (wanted or "").strip().strip("/").lower()
+        if not wanted:
+            continue
+        matches = [name for name in indexes if name.lower() == wanted or name.lower().rsplit("/", 1)[-1] == wanted]
+        if matches:
+            return matches
+    return list(indexes)
+
+
+def knowledge_search_tool(indexes: dict[str, tuple[str, Optional[LexicalIndex]]]):
+    """Return the knowledge search tool of an agent.
+
+    Args:
+        indexes: Mapping of repository names to the vector database searched
+            by the agent and the lexical index of the same chunks, or None
+
+    Returns:
+        A hybrid KnowledgeSearchTool, or the builtin vector-only RAG tool
+        configuration if hybrid search is disabled or there is no lexical index
+    """
+    if HYBRID_SEARCH and all(lexical_index is not None for _, lexical_index in indexes.values()):
+        return KnowledgeSearchTool(indexes)
+    return {
+        "name": "builtin::rag/knowledge_search",
+        "args": {
+            "vector_db_ids": [vector_db_id for vector_db_id, _ in indexes.values()],
+            "chunk_template": "Result {index}\nContent: {chunk.content}\nMetadata: {metadata}\n",
+        },
+    }
@@ -0,0 +1,322 @@
+import os
+import json
+from typing import Callable, Optional
+
+from agent import GithubAgent, load_repository, update_repository
+from chunking import CHUNK_CONFIG
+from github import RepositoryDiagram, combine_trees, resolve_head_commit
+from gitsource import discard_prefetched, prefetch_repository
+from jobs import JobCancelled
+from lexical import LexicalIndex
+from lifecycle import lifecycle
+from metrics import span
+from registry import make_key, normalize_repo_url, registry, repository_name
+from resources import resources
+from symbols import SymbolIndex
+from tools import SourceRecordingTool
+
+# keys of the repository URL in the objects of JSON manifests, e.g. saved from
+# 'gh repo list <org> --json url' or the GitHub API's /orgs/<org>/repos
+MANIFEST_URL_KEYS = ("clone_url", "url", "html_url", "ssh_url")
+
+
+class Workspace(GithubAgent):
+    """An agent answering questions across several ingested repositories.
+
+    Every repository keeps its own vector database, shared through the
+    registry and kept alive by the lifecycle manager like that of a single
+    repository agent. The workspace only owns a LlamaStack agent session
+    whose tools search the indexes of all its repositories, or of the one
+    the model or the user restricts them to. Answers are not cached, since
+    the answer cache is invalidated per vector database.
+
+    Attributes:
+        members (list): Agents of the repositories, GithubAgent or SyncGithubAgent
+        failed (list[tuple[str, str]]): (link, error) pairs of repositories that could not be loaded
+        scope (Optional[str]): Repository the user restricted the search to, or None for all
+    """
+
+    def __init__(self, members: list, failed: Optional[list[tuple[str, str]]] = None):
+        """Create the agent session over the indexes of the member agents.
+
+        Args:
+            members (list): Agents of the ingested repositories
+            failed (Optional[list[tuple[str, str]]]): Repositories that could not be loaded
+        """
+        self.members = members
+        self.failed = failed or []
+        self.scope = None
+        super().__init__(register=False)
+        self.diagram = RepositoryDiagram(combine_trees({
+            repository_name(member.repo_url): member.diagram.root_node
+            for member in members if member.diagram is not None
+        }))
+
+    @property
+    def expired(self) -> bool:
+        """Whether the lifecycle manager evicted the vector database of any repository."""
+        return any(member.expired for member in self.members)
+
+    def touch(self) -> bool:
+        """Record a query of every repository with the lifecycle manager.
+
+        Returns:
+            bool: False if the vector database of any repository was evicted
+        """
+        return all([lifecycle.touch(member.vector_db_id) for member in self.members])
+
+    def search_indexes(self) -> dict[str, tuple[str, Optional[LexicalIndex], Optional[SymbolIndex]]]:
+        """Return the indexes of the member repositories, keyed by repository name."""
+        return {
+            repository_name(member.repo_url): (member.vector_db_id, member.lexical_index, member.symbol_index)
+            for member in self.members
+        }
+
+    def repositories(self) -> list[str]:
+        """Return the names of the member repositories, sorted."""
+        return sorted(self.search_indexes())
+
+    def set_scope(self, repo: Optional[str]) -> None:
+        """Restrict the searches of the agent's tools to one repository.
+
+        Args:
+            repo (Optional[str]): Name of the repository, or None to search all of them
+        """
+        self.scope = repo
+        for tool in self.rag_agent.client_tools.values():
+            if isinstance(tool, SourceRecordingTool):
+                tool.scope = repo
+
+    def _answer_scope(self) -> None:
+        return None
+
+    def share(self) -> "Workspace":
+        """Create another workspace with its own session on the indexes of the member repositories.
+
+        Raises:
+            RuntimeError: If the index of any repository is no longer registered
+        """
+        members = []
+        try:
+            for member in self.members:
+                members.append(member.share())
+        except BaseException:
+            for member in members:
+                member.release()
+            raise
+        return Workspace(members, self.failed)
+
+    def release(self, keep: Optional[GithubAgent] = None) -> None:
+        """Release the vector databases of the member repositories.
+
+        Args:
+            keep (Optional[GithubAgent]): Agent or workspace whose repositories
+                are still in use and must not be released
+        """
+        kept = {id(member) for member in members_of(keep)} if keep is not None else set()
+        for member in self.members:
+            if id(member) not in kept:
+                member.release()
+        self.members = [member for member in self.members if id(member) in kept]
+
+
+def members_of(agent) -> list:
+    """Return the repository agents of a workspace, or a single repository agent as a list."""
+    return list(agent.members) if isinstance(agent, Workspace) else [agent]
+
+
+def parse_manifest(text: str) -> list[str]:
+    """Parse a list of repositories.
+
+    Accepts one URL per line, with blank lines and '#' comments ignored, or
+    a JSON list of URLs or of objects with a URL, such as the repositories
+    of an organization listed by 'gh repo list <org> --json url'. A JSON
+    object with a 'repositories' list is accepted too.
+
+    Args:
+        text (str): Manifest content
+
+    Returns:
+        list[str]: Repository URLs, without duplicates, in manifest order
+
+    Raises:
+        ValueError: If a JSON manifest is malformed
+    """
+    stripped = text.strip()
+    if stripped.startswith(("[", "{")):
+        try:
+            entries = json.loads(stripped)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON manifest: {e}") from e
+        if isinstance(entries, dict):
+            entries = entries.get("repositories", [])
+        links = []
+        for entry in entries:
+            if isinstance(entry, dict):
+                entry = next((entry[key] for key in MANIFEST_URL_KEYS if entry.get(key)), None)
+            if not isinstance(entry, str):
+                raise ValueError(f"Manifest entry without a repository URL: {entry!r}")
+            links.append(entry)
+    else:
+        links = [line.split("#", 1)[0].strip() for line in text.splitlines()]
+
+    unique = {}
+    for link in links:
+        if link:
+            unique.setdefault(normalize_repo_url(link), link)
+    return list(unique.values())
+
+
+def load_manifest(path: str) -> list[str]:
+    """Read a list of repositories from a local manifest file, see parse_manifest().
+
+    Args:
+        path (str): Path of the manifest
+
+    Returns:
+        list[str]: Repository URLs
+    """
+    with open(os.path.expanduser(path), encoding="utf-8") as f:
+        return parse_manifest(f.read())
+
+
+class _CombinedProgress:
+    """Turns the batch reports of consecutive ingestions into reports of one job.
+
+    Batch and chunk counts of the repositories already ingested are added
+    to those of the current one, so that the batches of the job never exceed
+    its total.
+    """
+
+    def __init__(self, callback: Optional[Callable[[dict], None]]):
+        self.callback = callback
+        self.done_batches = 0
+        self.done_chunks = 0
+        self.batches = 0
+        self.chunks = 0
+
+    def report(self, report: dict) -> None:
+        self.batches = report["total_batches"]
+        self.chunks = report.get("chunks", 0)
+        if self.callback is not None:
+            self.callback({**report, "total_batches": self.done_batches + self.batches,
+                           "chunks": self.done_chunks + self.chunks})
+
+    def next_repository(self) -> None:
+        self.done_batches += self.batches
+        self.done_chunks += self.chunks
+        self.batches = self.chunks = 0
+
+
+def load_repositories(
+    links: list[str],
+    progress_callback: Optional[Callable[[dict], None]] = None,
+    load: Callable = load_repository,
+    existing: Optional[GithubAgent] = None,
+) -> Workspace:
+    """Ingest several repositories, e.g. every repository of an organization, into one workspace.
+
+    The remote HEADs are resolved up front. The repositories are then loaded
+    one after the other with load, reusing indexes already built by other
+    sessions, while the next repository that is not indexed yet is cloned
+    and scanned in the background, so its clone overlaps with the embedding
+    of the current one. Repositories that fail to load are skipped and
+    reported in the workspace's failed list.
+
+    Args:
+        links (list[str]): Git repository URLs
+        progress_callback (Optional[Callable[[dict], None]]): Called with a
+            report dict after each ingested batch of any repository
+        load (Callable): load_repository() of the sync or async agent
+        existing (Optional[GithubAgent]): Agent or workspace of the session,
+            whose repositories are added to the new workspace and not loaded again
+
+    Returns:
+        Workspace: Agent over the existing and the loaded repositories
+
+    Raises:
+        ValueError: If there are no new repositories to load
+        RuntimeError: If none of the repositories could be loaded
+    """
+    members = members_of(existing) if existing is not None else []
+    known = {normalize_repo_url(member.repo_url) for member in members}
+    links = [link for link in links if normalize_repo_url(link) not in known]
+    if not links:
+        raise ValueError("All repositories are already loaded")
+
+    failed = []
+    targets = []
+    with span("resolve_heads", repositories=len(links)):
+        for link in links:
+            try:
+                targets.append((link, resolve_head_commit(link)))
+            except ValueError as e:
+                print(f"Skipping {link}: {e}")
+                failed.append((link, str(e)))
+
+    embedding_model = resources.embedding_model_id()
+    progress = _CombinedProgress(progress_callback)
+    loaded = []
+    try:
+        for i, (link, commit_sha) in enumerate(targets):
+            # clone the next repository while this one is embedded, unless it is indexed already
+            for next_link, next_sha in targets[i + 1:i + 2]:
+                if not registry.contains(make_key(next_link, next_sha, CHUNK_CONFIG, embedding_model)):
+                    prefetch_repository(next_link, next_sha)
+            try:
+                loaded.append(load(link, progress.report, commit_sha=commit_sha))
+            except JobCancelled:
+                raise
+            except Exception as e:
+                print(f"Skipping {link}: {e}")
+                failed.append((link, str(e)))
+            progress.next_repository()
+    except BaseException:
+        for agent in loaded:
+            agent.release()
+        raise
+    finally:
+        for link, commit_sha in targets:
+            discard_prefetched(link, commit_sha)
+
+    if not loaded:
+        raise RuntimeError("No repository could be loaded: " + "; ".join(f"{link}: {error}" for link, error in failed))
+    print(f"Loaded {len(loaded)} repositories, {len(failed)} failed")
+    return Workspace(members + loaded, failed)
+
+
+def update_repositories(
+    workspace: Workspace,
+    progress_callback: Optional[Callable[[dict], None]] = None,
+    update: Callable = update_repository,
+) -> Workspace:
+    """Bring every repository of a workspace up to date with its remote HEAD.
+
+    The indexes of the old commits are only released once every repository
+    was updated, so a failed or cancelled update leaves the workspace usable.
+
+    Args:
+        workspace (Workspace): Workspace to update
+        progress_callback (Optional[Callable[[dict], None]]): Called with a
+            report dict after each ingested batch of any repository
+        update (Callable): update_repository() taking a release argument
+
+    Returns:
+        Workspace: Workspace over the updated repositories
+    """
+    progress = _CombinedProgress(progress_callback)
+    updated = []
+    try:
+        for member in workspace.members:
+            updated.append(update(member, progress.report, release=False))
+            progress.next_repository()
+    except BaseException:
+        for old, new in zip(workspace.members, updated):
+            if new is not old:
+                new.release()
+        raise
+
+    for old, new in zip(workspace.members, updated):
+        if new is not old:
+            old.release()
+    return Workspace(updated, workspace.failed)
@@ -0,0 +1,74 @@
+import time
+
+from answer_cache import AnswerCache, normalize_query
+
+
+SCOPE = ("vdb1", "model", "prompt")
+
+
+def test_normalize_query_ignores_case_spacing_and_trailing_punctuation():
+    assert normalize_query("  How does   Ingestion work?! ") == normalize_query("how does ingestion work")
+
+
+def test_exact_lookup_is_scoped():
+    cache = AnswerCache()
+    cache.put(SCOPE, "What is this?", "A repository.", [{"filename": "README.md"}])
+    entry = cache.get(SCOPE, "what is this")
+    assert entry.answer == "A repository."
+    assert entry.sources == [{"filename": "README.md"}]
+    assert cache.get(("vdb2", "model", "prompt"), "What is this?") is None
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = AnswerCache(max_entries=2)
+    cache.put(SCOPE, "first", "1", [])
+    cache.put(SCOPE, "second", "2", [])
+    # a lookup makes 'first' the most recently used entry
+    assert cache.get(SCOPE, "first") is not None
+    cache.put(SCOPE, "third", "3", [])
+    assert cache.get(SCOPE, "second") is None
+    assert cache.get(SCOPE, "first").answer == "1"
+    assert cache.get(SCOPE, "third").answer == "3"
+
+
+def test_putting_the_same_question_replaces_its_answer():
+    cache = AnswerCache(max_entries=2)
+    cache.put(SCOPE, "question", "old", [])
+    cache.put(SCOPE, "Question?", "new", [])
+    cache.put(SCOPE, "other", "other", [])
+    assert cache.get(SCOPE, "question").answer == "new"
+    assert cache.get(SCOPE, "other") is not None
+
+
+def test_entries_expire():
+    cache = AnswerCache(ttl=0.01)
+    cache.put(SCOPE, "question", "answer", [], embedding=[1.0, 0.0])
+    time.sleep(0.02)
+    assert cache.get(SCOPE, "question") is None
+    assert cache.get_similar(SCOPE, [1.0, 0.0]) is None
+
+
+def test_similar_lookup_returns_the_closest_question_above_the_threshold():
+    cache = AnswerCache(similarity=0.9)
+    cache.put(SCOPE, "how is a repository ingested", "close", [], embedding=[1.0, 0.1, 0.0])
+    cache.put(SCOPE, "what does the cache do", "far", [], embedding=[0.0, 1.0, 0.0])
+    assert cache.get_similar(SCOPE, [2.0, 0.0, 0.0]).answer == "close"
+    assert cache.get_similar(SCOPE, [0.0, 0.0, 1.0]) is None
+    assert cache.get_similar(("vdb2",), [2.0, 0.0, 0.0]) is None
+
+
+def test_similar_lookup_is_off_with_zero_similarity():
+    cache = AnswerCache(similarity=0)
+    cache.put(SCOPE, "question", "answer", [], embedding=[1.0])
+    assert cache.get_similar(SCOPE, [1.0]) is None
+
+
+def test_invalidate_drops_every_scope_of_a_vector_database():
+    cache = AnswerCache()
+    cache.put(SCOPE, "question", "answer", [])
+    cache.put(("vdb1", "other model", "prompt"), "question", "answer", [])
+    cache.put(("vdb2", "model", "prompt"), "question", "kept", [])
+    cache.invalidate("vdb1")
+    assert cache.get(SCOPE, "question") is None
+    assert cache.get(("vdb1", "other model", "prompt"), "question") is None
+    assert cache.get(("vdb2", "model", "prompt"), "question").answer == "kept"
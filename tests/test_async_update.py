@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import os
+import subprocess
+
+import pytest
+
+import embedding_cache
+from async_agent import get_event_loop_thread, load_repository, load_repository_sync, update_repository_sync
+from bench_pipeline import fake_stats, make_repo, start_fake_server
+from resources import resources
+
+
+def git(repo, *args) -> str:
+    command = ["git", "-C", str(repo), "-c", "user.name=test", "-c", "user.email=test@example.com", *args]
+    return subprocess.run(command, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def commit(repo, message: str) -> str:
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", message)
+    return git(repo, "rev-parse", "HEAD")
+
+
+def embedded_texts(url: str) -> int:
+    return fake_stats(url)["requests"].get("embedded_texts", 0)
+
+
+@pytest.fixture(scope="module")
+def llama_stack(tmp_path_factory):
+    """Point the shared clients and embedding cache at a fake LlamaStack and a fresh cache."""
+    server, url = start_fake_server(argparse.Namespace(dimension=32, latency_ms=0, embed_latency_ms=0,
+                                                       token_latency_ms=0))
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(resources, "endpoint", url)
+        patch.setattr(resources, "_client", None)
+        patch.setattr(resources, "_async_client", None)
+        patch.setattr(embedding_cache, "_cache", embedding_cache.EmbeddingCache(str(tmp_path_factory.mktemp("cache"))))
+        try:
+            yield url
+        finally:
+            server.terminate()
+
+
+@pytest.fixture
+def repo(tmp_path):
+    make_repo(str(tmp_path), 20, 2, 3, 1024, seed=7)
+    git(tmp_path, "init", "-q")
+    commit(tmp_path, "first")
+    return tmp_path
+
+
+def test_update_only_embeds_the_diff(llama_stack, repo):
+    before = embedded_texts(llama_stack)
+    agent = load_repository_sync(f"file://{repo}")
+    full = embedded_texts(llama_stack) - before
+    try:
+        assert update_repository_sync(agent) is agent
+
+        changed = sorted(relpath for relpath in agent.documents if relpath.endswith(".md"))[0]
+        with open(os.path.join(repo, changed), "a") as f:
+            f.write("\nA paragraph added in the second commit.\n")
+        with open(os.path.join(repo, "added.md"), "w") as f:
+            f.write("# Added\n\nA document added in the second commit.\n")
+        sha = commit(repo, "second")
+        before = embedded_texts(llama_stack)
+
+        updated = update_repository_sync(agent, release=False)
+        try:
+            summary = updated.ingest_summary
+            assert updated.commit_sha == sha
+            assert updated.vector_db_id != agent.vector_db_id
+            assert summary["stored"] == 2
+            assert summary["reused"] == len(agent.documents) - 1
+            assert set(updated.documents) == set(agent.documents) | {"added.md"}
+            assert updated.documents[changed] != agent.documents[changed]
+            # only the chunks of the changed and added documents were embedded
+            embedded = embedded_texts(llama_stack) - before
+            assert 0 < embedded < full
+        finally:
+            updated.release()
+    finally:
+        agent.release()
+
+
+def test_sessions_loading_the_same_commit_share_one_index(llama_stack, repo):
+    async def load_twice():
+        return await asyncio.gather(*(load_repository(f"file://{repo}") for _ in range(8)))
+
+    before = fake_stats(llama_stack)["vector_dbs"]
+    agents = get_event_loop_thread().run(load_twice())
+    try:
+        assert len({agent.vector_db_id for agent in agents}) == 1
+        assert fake_stats(llama_stack)["vector_dbs"] == before + 1
+        assert agents[0].registry_entry.refcount == len(agents)
+    finally:
+        for agent in agents:
+            get_event_loop_thread().run(agent.release())
+    assert fake_stats(llama_stack)["vector_dbs"] == before
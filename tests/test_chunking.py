@@ -0,0 +1,125 @@
+import random
+
+import pytest
+
+from chunking import chunk_code, chunk_document, chunk_stream, chunk_text, count_tokens
+
+
+def sample_text(seed: int, lines: int = 300) -> str:
+    rng = random.Random(seed)
+    words = ["alpha", "beta", "gamma_delta", "x", "42", "(", ")", "{", "}", "==", "éclair"]
+    return "".join(" ".join(rng.choice(words) for _ in range(rng.randint(0, 12))) + "\n" for _ in range(lines))
+
+
+def random_pieces(text: str, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    pieces = []
+    start = 0
+    while start < len(text):
+        end = start + rng.randint(1, 200)
+        pieces.append(text[start:end])
+        start = end
+    return pieces
+
+
+@pytest.mark.parametrize("chunk_size, overlap", [(64, 16), (50, 0), (8, 7), (512, 50)])
+@pytest.mark.parametrize("seed", range(5))
+def test_chunk_stream_matches_chunk_text(seed, chunk_size, overlap):
+    text = sample_text(seed)
+    expected = chunk_text(text, chunk_size, overlap)
+    assert list(chunk_stream(random_pieces(text, seed), chunk_size, overlap)) == expected
+
+
+def test_chunk_text_windows_overlap_and_carry_line_ranges():
+    text = sample_text(7)
+    lines = text.split("\n")
+    chunks = chunk_text(text, 40, 10)
+    assert all(chunk["token_count"] <= 40 for chunk in chunks)
+    assert sum(chunk["token_count"] for chunk in chunks) - 10 * (len(chunks) - 1) == count_tokens(text)
+    for chunk in chunks:
+        span = "\n".join(lines[chunk["start_line"] - 1:chunk["end_line"]])
+        assert chunk["content"].strip() in span
+
+
+def test_chunk_text_of_blank_text_is_empty():
+    assert chunk_text("  \n\n") == []
+    assert list(chunk_stream(["", " \n"])) == []
+
+
+PYTHON_SOURCE = '''import os
+
+
+def first(a, b):
+    """Add two numbers."""
+    return a + b
+
+
+# the second function
+@decorator
+def second(values):
+    total = 0
+    for value in values:
+        total += value
+    return total
+
+
+class Third:
+    """A class with methods."""
+
+    def method_one(self):
+        return first(1, 2)
+
+    def method_two(self):
+        return second([1, 2, 3])
+'''
+
+
+def non_blank_lines(text: str) -> list[str]:
+    return [line for line in text.splitlines() if line.strip()]
+
+
+@pytest.mark.parametrize("chunk_size", [8, 20, 40, 1000])
+def test_chunk_code_round_trips_the_source(chunk_size):
+    chunks = chunk_code(PYTHON_SOURCE, "python", chunk_size)
+    # only blank lines between parts are left out
+    assert "".join(chunk["content"] for chunk in chunks).split() == PYTHON_SOURCE.split()
+    assert all(chunk["token_count"] <= chunk_size for chunk in chunks)
+
+
+@pytest.mark.parametrize("chunk_size", [20, 40, 1000])
+def test_chunk_code_line_ranges_match_the_content(chunk_size):
+    chunks = chunk_code(PYTHON_SOURCE, "python", chunk_size)
+    lines = PYTHON_SOURCE.splitlines()
+    for chunk in chunks:
+        span = "\n".join(lines[chunk["start_line"] - 1:chunk["end_line"]])
+        assert non_blank_lines(chunk["content"]) == non_blank_lines(span)
+        assert chunk["token_count"] == count_tokens(chunk["content"])
+
+
+def test_chunk_code_splits_python_on_definitions():
+    chunks = chunk_code(PYTHON_SOURCE, "python", 40)
+    starts = [non_blank_lines(chunk["content"])[0] for chunk in chunks]
+    # comments and decorators stay with the definition below them
+    assert "# the second function" in starts
+    assert all(not start.startswith(("    return", "    total", "@")) for start in starts)
+    assert all(chunk["token_count"] <= 40 for chunk in chunks)
+
+
+def test_chunk_code_splits_markdown_on_headings():
+    text = "# Title\n\nintro text here\n\n## Install\n\n" + "pip install x\n" * 4 + "\n## Usage\n\nrun it\n"
+    chunks = chunk_code(text, "markdown", 15)
+    assert [non_blank_lines(chunk["content"])[0] for chunk in chunks] == ["# Title", "## Install", "## Usage"]
+
+
+def test_chunk_code_falls_back_to_windows_for_long_lines():
+    text = "var a=1;" * 500 + "\n"
+    chunks = chunk_code(text, "code", 100)
+    assert len(chunks) > 1
+    assert all(chunk["token_count"] <= 100 and chunk["start_line"] == chunk["end_line"] == 1 for chunk in chunks)
+    assert "".join(chunk["content"] for chunk in chunks) == text
+
+
+def test_chunk_document_picks_the_strategy_from_the_file_name():
+    text = sample_text(3, lines=100)
+    assert list(chunk_document(random_pieces(text, 3), "notes.txt", 64, 16)) == chunk_text(text, 64, 16)
+    assert list(chunk_document([PYTHON_SOURCE], "module.py", 40, 16)) == chunk_code(PYTHON_SOURCE, "python", 40)
@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+from dedup import deduplicate, generated_reason, minhash, similarity
+from loader import SkippedFile
+
+
+def source(seed: int, lines: int = 200) -> str:
+    rng = random.Random(seed)
+    words = [f"name{i}" for i in range(300)]
+    return "".join(f"value = {' + '.join(rng.choice(words) for _ in range(6))}\n" for _ in range(lines))
+
+
+@pytest.mark.parametrize("filepath, text", [
+    ("api.pb.go", "// Code generated by protoc-gen-go. DO NOT EDIT.\npackage api\n"),
+    ("schema.py", "# @generated by codegen\nx = 1\n"),
+    ("types.ts", "/* Auto-generated by openapi-generator */\nexport type A = string;\n"),
+    ("bundle.min.js", "var a=1;" * 2000),
+    ("data.json", '{"values": [' + ", ".join(["123456789"] * 2000) + "]}\n"),
+])
+def test_generated_files_are_recognized(filepath, text):
+    assert generated_reason(filepath, text) is not None
+
+
+@pytest.mark.parametrize("filepath, text", [
+    # markers in docstrings describe what the code generates
+    ("codegen.py", '"""Writes files that are generated by this module."""\nx = 1\n'),
+    # prose often has one paragraph per line
+    ("README.md", "Code generated by a tool. DO NOT EDIT.\n" + "word " * 5000),
+    # hand-written fixtures and data with long lines, and sources with one long literal
+    ("fixture.json", '{"key": "' + "x" * 300 + '"}\n' * 100),
+    ("seed.sql", "INSERT INTO t VALUES " + ", ".join(["(1, 'a')"] * 3000) + ";\n"),
+    ("config.yaml", "key: " + "x" * 20000 + "\n"),
+    ("table.py", "TABLE = " + repr(list(range(5000))) + "\n"),
+    ("small.js", "var a=1;" * 100),
+])
+def test_hand_written_files_are_kept(filepath, text):
+    assert generated_reason(filepath, text) is None
+
+
+def test_minhash_estimates_similarity():
+    text = source(1)
+    edited = text.replace("value", "result", 5)
+    assert similarity(minhash(text), minhash(text.replace("\n", "\n\n"))) == 1.0
+    assert similarity(minhash(text), minhash(edited)) >= 0.85
+    assert similarity(minhash(text), minhash(source(2))) < 0.2
+    assert minhash("too short") is None
+
+
+def test_deduplicate_keeps_the_shallowest_copy_of_each_cluster():
+    text = source(1)
+    files = {
+        "/repo/util.py": text,
+        "/repo/vendor/lib/util.py": text,
+        "/repo/util_v2.py": text.replace("value", "result", 3),
+        # near duplicates are only looked for among files of the same extension
+        "/repo/util.txt": text.replace("value", "total", 3),
+        "/repo/other.py": source(2),
+        "/repo/api.pb.go": "// Code generated by protoc-gen-go. DO NOT EDIT.\n" + source(3),
+    }
+    result = deduplicate(list(files), files.__getitem__, workers=2)
+    assert result.files == ["/repo/util.py", "/repo/util.txt", "/repo/other.py"]
+    assert result.duplicates == {"/repo/util.py": ["/repo/util_v2.py", "/repo/vendor/lib/util.py"]}
+    assert list(result.generated) == ["/repo/api.pb.go"]
+    assert result.texts == {filepath: files[filepath] for filepath in result.files}
+
+
+def test_deduplicate_with_zero_threshold_only_drops_exact_copies():
+    text = source(1)
+    files = {"/a.py": text, "/b.py": text, "/c.py": text.replace("value", "result", 3)}
+    result = deduplicate(list(files), files.__getitem__, threshold=0)
+    assert result.files == ["/a.py", "/c.py"]
+    assert result.duplicates == {"/a.py": ["/b.py"]}
+
+
+def test_deduplicate_keeps_unreadable_files_for_ingestion_to_report():
+    def read(filepath):
+        if filepath == "/image.png":
+            raise SkippedFile("file appears to be binary")
+        return source(4)
+
+    result = deduplicate(["/image.png", "/code.py"], read)
+    assert result.files == ["/image.png", "/code.py"]
+    assert list(result.texts) == ["/code.py"]
+
+
+def test_deduplicate_keeps_texts_within_the_budget():
+    files = {f"/file{i}.py": source(i, lines=20) for i in range(10)}
+    budget = sum(len(text) for text in files.values()) // 2
+    result = deduplicate(list(files), files.__getitem__, keep_chars=budget)
+    assert result.files == list(files)
+    assert 0 < sum(len(text) for text in result.texts.values()) <= budget
+    assert all(files[filepath] == text for filepath, text in result.texts.items())
@@ -0,0 +1,66 @@
+import subprocess
+
+import pytest
+
+from github import diff_commits
+
+
+def git(repo, *args) -> str:
+    result = subprocess.run(["git", "-C", str(repo), "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+                            check=True, capture_output=True, text=True)
+    return result.stdout.strip()
+
+
+def commit(repo, message: str) -> str:
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", message)
+    return git(repo, "rev-parse", "HEAD")
+
+
+@pytest.fixture
+def repo(tmp_path):
+    git(tmp_path, "init", "-q")
+    return tmp_path
+
+
+def test_diff_commits_lists_every_kind_of_change(repo):
+    lines = "".join(f"line {i}\n" for i in range(50))
+    other_lines = "".join(f"other line {i}\n" for i in range(50))
+    (repo / "kept.py").write_text("x = 1\n")
+    (repo / "changed.py").write_text("x = 1\n")
+    (repo / "removed.py").write_text("x = 1\n")
+    (repo / "old name.py").write_text(lines)
+    (repo / "edited.py").write_text(other_lines)
+    old = commit(repo, "old")
+
+    (repo / "changed.py").write_text("x = 2\n")
+    (repo / "removed.py").unlink()
+    (repo / "added.py").write_text("y = 1\n")
+    (repo / "old name.py").rename(repo / "new name.py")
+    (repo / "edited.py").rename(repo / "moved.py")
+    (repo / "moved.py").write_text(other_lines + "other line 50\n")
+    new = commit(repo, "new")
+
+    changes = diff_commits(str(repo), old, new)
+
+    assert changes["added"] == ["added.py"]
+    assert changes["modified"] == ["changed.py"]
+    assert changes["deleted"] == ["removed.py"]
+    renamed = {old_path: (new_path, similarity) for old_path, new_path, similarity in changes["renamed"]}
+    # -z output keeps paths with spaces intact, and pure renames have a similarity of 100
+    assert renamed["old name.py"] == ("new name.py", 100)
+    assert renamed["edited.py"][0] == "moved.py"
+    assert 50 <= renamed["edited.py"][1] < 100
+
+
+def test_diff_commits_of_same_commit_is_empty(repo):
+    (repo / "a.py").write_text("x = 1\n")
+    sha = commit(repo, "only")
+    assert diff_commits(str(repo), sha, sha) == {"added": [], "modified": [], "deleted": [], "renamed": []}
+
+
+def test_diff_commits_against_unknown_commit_fails(repo):
+    (repo / "a.py").write_text("x = 1\n")
+    sha = commit(repo, "only")
+    with pytest.raises(ValueError):
+        diff_commits(str(repo), "0" * 40, sha)
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from jobs import CANCELLED, FAILED, QUEUED, SUCCEEDED, Job, JobCancelled, JobQueue
+
+
+def wait_finished(job: Job) -> None:
+    for _ in range(500):
+        if job.finished_at is not None:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"job {job.description} did not finish")
+
+
+@pytest.fixture
+def blocked_queue():
+    """A single-worker queue whose worker is busy until the test releases it."""
+    queue = JobQueue(workers=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def block(progress):
+        started.set()
+        release.wait(5)
+
+    blocker = queue.submit("someone", "blocker", block)
+    assert started.wait(5)
+    yield queue, release
+    release.set()
+    wait_finished(blocker)
+
+
+def test_workers_take_turns_between_users(blocked_queue):
+    queue, release = blocked_queue
+    order = []
+    jobs = [queue.submit(owner, f"{owner}{i}", lambda progress, name=f"{owner}{i}": order.append(name))
+            for owner, i in (("alice", 1), ("alice", 2), ("alice", 3), ("bob", 1))]
+    release.set()
+    for job in jobs:
+        wait_finished(job)
+    assert order == ["alice1", "bob1", "alice2", "alice3"]
+    assert all(job.state == SUCCEEDED for job in jobs)
+
+
+def test_position_counts_the_jobs_served_first(blocked_queue):
+    queue, _ = blocked_queue
+    alice = [queue.submit("alice", f"alice{i}", lambda progress: None) for i in range(3)]
+    bob = [queue.submit("bob", f"bob{i}", lambda progress: None) for i in range(2)]
+    assert [queue.position(job) for job in alice] == [0, 2, 4]
+    assert [queue.position(job) for job in bob] == [1, 3]
+
+
+def test_cancelled_queued_job_never_runs(blocked_queue):
+    queue, release = blocked_queue
+    ran = []
+    job = queue.submit("alice", "cancelled", lambda progress: ran.append(True))
+    assert queue.cancel(job.id)
+    release.set()
+    wait_finished(job)
+    assert job.state == CANCELLED
+    assert not ran
+    assert not queue.cancel(job.id)
+
+
+def test_failed_job_records_its_error():
+    queue = JobQueue(workers=1)
+
+    def fail(progress):
+        raise RuntimeError("clone failed")
+
+    job = queue.submit("alice", "failing", fail)
+    wait_finished(job)
+    assert job.state == FAILED
+    assert job.error == "clone failed"
+    assert queue.get(job.id) is job
+
+
+def test_reports_accumulate_and_stop_a_cancelled_job():
+    job = Job("alice", "ingest", lambda progress: None)
+    assert job.state == QUEUED
+    job.report({"total_batches": 3, "files": 2, "bytes": 100, "stored": 2, "failed": [], "chunks": 5})
+    job.cancel()
+    with pytest.raises(JobCancelled):
+        job.report({"total_batches": 3, "files": 1, "bytes": 50, "stored": 0, "failed": [("a", "error")]})
+    assert job.snapshot()["progress"] == {"batches": 2, "total_batches": 3, "files": 3, "bytes": 150, "stored": 2,
+                                          "failed": 1, "chunks": 5}
+    # the last batch is in, so there is nothing left to interrupt
+    job.report({"total_batches": 3, "files": 1, "bytes": 50, "stored": 1, "failed": []})
+
+
+def test_job_cancelled_after_its_last_batch_releases_its_result():
+    released = []
+    job = Job("alice", "ingest", lambda progress: job.cancel() or "agent", on_cancel=released.append)
+    job.run()
+    assert job.state == CANCELLED
+    assert released == ["agent"]
+    assert job.result is None
+
+
+def test_only_the_first_adoption_gets_the_result():
+    job = Job("alice", "ingest", lambda progress: "agent")
+    job.run()
+    assert job.adopt() == ("agent", True)
+    assert job.adopt() == ("agent", False)
@@ -0,0 +1,68 @@
+import pytest
+
+from lexical import LexicalIndex, code_tokens, reciprocal_rank_fusion
+
+
+def test_code_tokens_split_identifiers_into_words():
+    assert code_tokens("parse_gitignore(IgnoreMatcher)") == [
+        "parse_gitignore", "parse", "gitignore", "ignorematcher", "ignore", "matcher",
+    ]
+    assert code_tokens("HTTPServer v2") == ["httpserver", "http", "server", "v2", "v", "2"]
+
+
+@pytest.fixture
+def index():
+    index = LexicalIndex()
+    index.add("def load_gitignore(path):\n    return IgnoreMatcher(path)", {"file": "ignore.py", "lines": "1-2"})
+    index.add("The ingestion pipeline embeds chunks in batches.", {"file": "README.md", "lines": "1-1"})
+    index.add("ERROR_CODE_42 = 'vector store unavailable'", {"file": "errors.py", "lines": "3-3"})
+    return index
+
+
+def test_search_ranks_exact_identifiers_first(index):
+    results = index.search("where is IgnoreMatcher created?")
+    assert [metadata["file"] for _, _, metadata in results] == ["ignore.py"]
+    score, content, metadata = index.search("ERROR_CODE_42")[0]
+    assert score > 0
+    assert content.startswith("ERROR_CODE_42")
+    assert metadata == {"file": "errors.py", "lines": "3-3"}
+
+
+def test_search_ignores_stopwords_and_unknown_terms(index):
+    assert index.search("the") == []
+    assert index.search("nonexistent") == []
+    assert LexicalIndex().search("anything") == []
+
+
+def test_search_respects_the_limit(index):
+    assert len(index.search("gitignore ingestion error", limit=2)) == 2
+
+
+def test_saved_index_loads_identically(index, tmp_path):
+    path = str(tmp_path / "lexical.idx")
+    index.save(path)
+    loaded = LexicalIndex.load(path)
+    assert len(loaded) == len(index)
+    assert loaded.chunk(1) == index.chunk(1)
+    for query in ("IgnoreMatcher", "batches ingestion", "vector store"):
+        assert loaded.search(query) == index.search(query)
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not an index")
+    with pytest.raises(ValueError):
+        LexicalIndex.load(str(path))
+
+
+def test_reciprocal_rank_fusion_favours_items_ranked_by_both():
+    vector = ["a", "b", "c"]
+    lexical = ["d", "c", "a"]
+    assert reciprocal_rank_fusion([vector, lexical]) == ["a", "c", "d", "b"]
+
+
+def test_reciprocal_rank_fusion_keeps_the_first_occurrence_of_an_item():
+    vector = [("same text", {"source": "vector"})]
+    lexical = [("other", {"source": "lexical"}), ("same text", {"source": "lexical"})]
+    fused = reciprocal_rank_fusion([vector, lexical], key=lambda item: item[0])
+    assert fused == [("same text", {"source": "vector"}), ("other", {"source": "lexical"})]
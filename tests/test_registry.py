@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from registry import VectorDBRegistry, make_key, normalize_repo_url
+
+
+KEY = make_key("https://github.com/owner/repo", "abc123", (512, 50, True), "all-MiniLM-L6-v2")
+
+
+def test_normalize_repo_url_maps_equivalent_links_together():
+    expected = "https://github.com/owner/repo"
+    for link in ("git@github.com:owner/repo.git", "http://GitHub.com/owner/repo/", "ssh://git@github.com/owner/repo"):
+        assert normalize_repo_url(link) == expected
+
+
+def test_make_key_ignores_link_spelling():
+    assert make_key("git@github.com:owner/repo.git", "abc123", (512, 50, True), "all-MiniLM-L6-v2") == KEY
+
+
+def test_first_session_owns_the_entry_and_later_ones_share_it():
+    registry = VectorDBRegistry()
+    entry, owner = registry.acquire(KEY)
+    shared, shared_owner = registry.acquire(KEY)
+    assert owner and not shared_owner
+    assert shared is entry
+    assert entry.refcount == 2
+
+
+def test_release_reports_the_last_reference_only():
+    registry = VectorDBRegistry()
+    entry, _ = registry.acquire(KEY)
+    registry.acquire(KEY)
+    registry.publish(entry, {}, None)
+    assert not registry.release(entry)
+    assert registry.contains(KEY)
+    assert registry.release(entry)
+    assert not registry.contains(KEY)
+
+
+def test_retain_only_takes_references_to_published_entries():
+    registry = VectorDBRegistry()
+    entry, _ = registry.acquire(KEY)
+    assert not registry.retain(entry)
+    registry.publish(entry, {}, None)
+    assert registry.retain(entry)
+    assert entry.refcount == 2
+    registry.evict(entry.vector_db_id)
+    assert not registry.retain(entry)
+    assert entry.refcount == 2
+
+
+def test_evicted_entry_is_not_unregistered_again_by_its_last_session():
+    registry = VectorDBRegistry()
+    entry, _ = registry.acquire(KEY)
+    registry.publish(entry, {}, None)
+    registry.evict(entry.vector_db_id)
+    assert not registry.contains(KEY)
+    assert not registry.release(entry)
+
+
+def test_waiting_session_sees_a_failed_build():
+    registry = VectorDBRegistry()
+    entry, _ = registry.acquire(KEY)
+    waiter, _ = registry.acquire(KEY)
+    errors = []
+
+    def wait():
+        try:
+            waiter.wait(timeout=5)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    registry.fail(entry, ValueError("clone failed"))
+    thread.join(5)
+    assert errors == ["Processing repository failed: clone failed"]
+    assert not registry.contains(KEY)
+    # the failed entry is dropped at once, so its sessions never unregister the database
+    registry.release(entry)
+    assert not registry.release(waiter)
+
+
+def test_wait_times_out():
+    registry = VectorDBRegistry()
+    entry, _ = registry.acquire(KEY)
+    with pytest.raises(RuntimeError, match="Timed out"):
+        entry.wait(timeout=0.01)